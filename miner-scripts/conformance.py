@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Golden-vector conformance and speed check for minr-stratum-miner.py
+
+Replays historical blocks from golden-blocks.json through the miner's
+header, merkle and target code (build_block_header, build_static_header,
+compute_merkle_root, check_share, compile_job) and through every hashing
+backend available here (hashlib, pycryptodome, the hashlib midstate hot
+loop, NumPy, minr_native), asserting bit-exact results. A live worker
+process is also run on each engine and every share it finds is rebuilt and
+rehashed, and the whole miner is run against its mock pool with 1- and
+2-byte extranonce2 to check that workers never submit the same share.
+Finally each backend's single-core hashrate is measured.
+
+Usage:
+    python3 conformance.py                 # checks + 1 s speed run per backend
+    python3 conformance.py --seconds 5     # longer speed runs
+    python3 conformance.py --no-speed      # checks only
+    python3 conformance.py --json out.json # also write the results as JSON
+
+Exits with status 1 if any check fails. Run it before and after every
+performance change: a faster engine that finds different shares is a bug.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import types
+import struct
+import hashlib
+import platform
+import multiprocessing as mp
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MINER_PATH = os.path.join(SCRIPT_DIR, "minr-stratum-miner.py")
+FIXTURE_PATH = os.path.join(SCRIPT_DIR, "golden-blocks.json")
+
+# Where each block's coinbase is split for the Stratum job: both extranonces sit
+# inside the coinbase scriptSig (after version, input count, null prevout and its
+# 1-byte length), which is non-zero and at least 7 bytes in every golden block
+SCRIPTSIG_OFFSET = 42
+EXTRANONCE1_OFFSET = SCRIPTSIG_OFFSET
+EXTRANONCE1_SIZE = 3
+EXTRANONCE2_SIZE = 4
+WORKER_SHARE_TARGET = 1 << 244  # About one share per 4096 hashes for the live worker run
+WORKER_RUN_SECONDS = 1.5
+MOCK_POOL_WORKERS = 4  # Workers splitting a mock pool's small extranonce2 space
+MOCK_POOL_EXTRANONCE2_SIZES = (1, 2)
+MOCK_POOL_DIFFICULTY = 0.00005
+MOCK_POOL_RUN_SECONDS = 4.0
+
+
+def load_miner(path: str) -> types.ModuleType:
+    """Import the miner template with its {{PLACEHOLDERS}} filled with dummy values."""
+    with open(path) as f:
+        source = f.read()
+    dummies = {"STRATUM_PORT": "3333", "API_URL": "", "AUTH_TOKEN": ""}  # No stats reporting
+    source = re.sub(r"\{\{(\w+)\}\}", lambda m: dummies.get(m.group(1), "conformance"), source)
+    module = types.ModuleType("minr_stratum_miner")
+    module.__file__ = path
+    sys.modules[module.__name__] = module
+    exec(compile(source, path, "exec"), module.__dict__)
+    return module
+
+
+def double_sha256(data: bytes) -> bytes:
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def bits_to_target(bits: int) -> int:
+    """Compact nBits to a target (written out here rather than taken from the miner)."""
+    exponent, mantissa = bits >> 24, bits & 0x007FFFFF
+    return mantissa << (8 * (exponent - 3)) if exponent > 3 else mantissa >> (8 * (3 - exponent))
+
+
+def reference_header(block: dict) -> bytes:
+    """80-byte header straight from the block's fields."""
+    return (struct.pack("<I", block["version"]) + bytes.fromhex(block["prevhash"])[::-1]
+            + bytes.fromhex(block["merkle_root"])[::-1]
+            + struct.pack("<III", block["time"], int(block["bits"], 16), block["nonce"]))
+
+
+def coinbase_branches(txids: list) -> list:
+    """Merkle branches for the coinbase (index 0), as a pool sends them in mining.notify."""
+    layer = [bytes.fromhex(txid)[::-1] for txid in txids]
+    branches = []
+    while len(layer) > 1:
+        if len(layer) % 2:
+            layer.append(layer[-1])
+        branches.append(layer[1])
+        layer = [double_sha256(layer[i] + layer[i + 1]) for i in range(0, len(layer), 2)]
+    return branches
+
+
+def stratum_job(block: dict):
+    """The mining.notify job a pool would have sent for this block, plus its extranonces."""
+    coinbase = bytes.fromhex(block["coinbase"])
+    extranonce2_offset = EXTRANONCE1_OFFSET + EXTRANONCE1_SIZE
+    prevhash = bytes.fromhex(block["prevhash"])[::-1]
+    job = {
+        "job_id": f"block-{block['height']}",
+        # Stratum prints the header prevhash as eight big-endian 32-bit words
+        "prevhash": b"".join(prevhash[i:i + 4][::-1] for i in range(0, 32, 4)).hex(),
+        "coinb1": coinbase[:EXTRANONCE1_OFFSET].hex(),
+        "coinb2": coinbase[extranonce2_offset + EXTRANONCE2_SIZE:].hex(),
+        "merkle_branches": [branch.hex() for branch in coinbase_branches(block["txids"])],
+        "version": f"{block['version']:08x}",
+        "nbits": block["bits"],
+        "ntime": f"{block['time']:08x}",
+    }
+    extranonce1 = coinbase[EXTRANONCE1_OFFSET:extranonce2_offset]
+    extranonce2 = coinbase[extranonce2_offset:extranonce2_offset + EXTRANONCE2_SIZE]
+    return job, extranonce1, extranonce2
+
+
+class Report:
+    """Collects pass/fail results and prints one line per check."""
+
+    def __init__(self):
+        self.passed = 0
+        self.failed = []
+
+    def check(self, name: str, ok: bool, detail: str = "") -> bool:
+        if ok:
+            self.passed += 1
+            print(f"  PASS {name}")
+        else:
+            self.failed.append(name)
+            print(f"  FAIL {name}" + (f": {detail}" if detail else ""))
+        return ok
+
+    def run(self, name: str, check, *args) -> None:
+        """Run a group of checks; an exception fails the group instead of ending the run."""
+        try:
+            check(*args)
+        except Exception as e:
+            self.check(name, False, f"{type(e).__name__}: {e}")
+
+
+def sha256_backends() -> dict:
+    """Single-shot SHA-256 functions: hashlib always, pycryptodome if installed."""
+    backends = {"hashlib": lambda data: hashlib.sha256(data).digest()}
+    try:
+        from Crypto.Hash import SHA256 as Crypto_SHA256
+        backends["pycryptodome"] = lambda data: Crypto_SHA256.new(data).digest()
+    except ImportError:
+        pass
+    return backends
+
+
+def range_engines(miner) -> dict:
+    """Batch nonce-range engines with the minr_native.scan_nonces call shape."""
+    engines = {}
+    if miner._check_numpy():
+        engines["numpy"] = miner.numpy_scan_nonces
+    if miner._check_native_module():
+        engines["native"] = miner._native_module.scan_nonces
+    return engines
+
+
+def check_fixture(block: dict, report: Report) -> bool:
+    """The fixture itself, hashed without any miner code."""
+    header = reference_header(block)
+    block_hash = double_sha256(header)[::-1].hex()
+    ok = report.check("fixture coinbase txid", double_sha256(bytes.fromhex(block["coinbase"]))[::-1].hex() == block["txids"][0])
+    branches = coinbase_branches(block["txids"])
+    root = bytes.fromhex(block["txids"][0])[::-1]
+    for branch in branches:
+        root = double_sha256(root + branch)
+    ok &= report.check("fixture merkle root", root[::-1].hex() == block["merkle_root"])
+    ok &= report.check("fixture block hash", block_hash == block["hash"], block_hash)
+    ok &= report.check("fixture proof of work", int(block["hash"], 16) <= bits_to_target(int(block["bits"], 16)))
+    # The extranonces must cover scriptSig bytes, or a misplaced one would go unnoticed
+    scriptsig_end = SCRIPTSIG_OFFSET + bytes.fromhex(block["coinbase"])[SCRIPTSIG_OFFSET - 1]
+    ok &= report.check("fixture extranonces inside the scriptSig",
+                       EXTRANONCE1_OFFSET + EXTRANONCE1_SIZE + EXTRANONCE2_SIZE <= scriptsig_end)
+    return ok
+
+
+def check_helpers(miner, stratum, block: dict, report: Report) -> None:
+    """StratumMiner header/merkle/target helpers and compile_job against the golden header."""
+    header = reference_header(block)
+    merkle_root = bytes.fromhex(block["merkle_root"])[::-1]
+    hash_int = int(block["hash"], 16)
+    job, extranonce1, extranonce2 = stratum_job(block)
+    coinbase = bytes.fromhex(block["coinbase"])
+
+    stratum.extranonce1 = extranonce1.hex()
+    stratum.version_mask = 0
+    report.check("compute_merkle_root", stratum.compute_merkle_root(coinbase, job["merkle_branches"]) == merkle_root)
+    for name, sha256_func in sha256_backends().items():
+        root = miner.compute_coinbase_merkle_root(coinbase, [bytes.fromhex(b) for b in job["merkle_branches"]], sha256_func)
+        report.check(f"compute_coinbase_merkle_root ({name})", root == merkle_root)
+    report.check("build_static_header", stratum.build_static_header(job, merkle_root) == header[:68])
+    built = stratum.build_block_header(job, extranonce2, block["time"], block["nonce"])
+    report.check("build_block_header", built == header, built.hex())
+
+    # BIP310: a job version with every rollable bit set, rolled back to the block's bits
+    mask = miner.VERSION_ROLLING_MASK
+    stratum.version_mask = mask
+    rolled_job = dict(job, version=f"{block['version'] | mask:08x}")
+    built = stratum.build_block_header(rolled_job, extranonce2, block["time"], block["nonce"], block["version"] & mask)
+    report.check("build_block_header (version rolling)", built == header, built.hex())
+    stratum.version_mask = 0
+
+    record = miner.compile_job(job, extranonce1.hex(), EXTRANONCE2_SIZE, hash_int)
+    report.check("compile_job header fields",
+                 record["version"] == header[0:4] and record["prevhash"] == header[4:36]
+                 and record["nbits"] == header[72:76] and record["ntime"] == block["time"])
+    report.check("compile_job coinbase", record["coinbase_prefix"] + extranonce2 + record["coinb2"] == coinbase)
+
+    network_target = bits_to_target(int(block["bits"], 16))
+    report.check("nbits_to_target", miner.nbits_to_target(int(block["bits"], 16)) == network_target)
+    report.check("check_share boundary", stratum.check_share(header, hash_int + 1) and not stratum.check_share(header, hash_int))
+
+
+def check_backends(miner, block: dict, report: Report) -> None:
+    """Every hashing backend on the golden header, including the exact nonce search."""
+    header = reference_header(block)
+    golden = bytes.fromhex(block["hash"])[::-1]  # Raw digest bytes
+    hash_int = int(block["hash"], 16)
+    nonce = block["nonce"]
+
+    for name, sha256_func in sha256_backends().items():
+        report.check(f"sha256d ({name})", sha256_func(sha256_func(header)) == golden)
+    midstate = miner.header_midstate(bytearray(header)).copy()
+    midstate.update(header[64:])
+    report.check("sha256d (hashlib midstate hot loop)", hashlib.sha256(midstate.digest()).digest() == golden)
+
+    # Batch engines: zero the nonce and search around the real one with target = hash + 1,
+    # so exactly the golden nonce qualifies
+    header_buf = bytearray(header)
+    struct.pack_into("<I", header_buf, 76, 0)
+    start = max(0, nonce - 2048)
+    for name, scan in range_engines(miner).items():
+        result = scan(header_buf, start, nonce + 2048, miner.int_to_target_bytes(hash_int + 1))
+        found_nonces = list(result[2]) if len(result) > 2 else []
+        found_hashes = [bytes(h) for h in result[3]] if len(result) > 3 else []
+        report.check(f"{name} nonce search", found_nonces == [nonce], f"found {found_nonces}")
+        if found_hashes:
+            report.check(f"{name} found hash", found_hashes[0] == golden, found_hashes[0].hex())
+
+
+def check_worker(miner, stratum, block: dict, engine: str, report: Report) -> None:
+    """Run mine_worker_process on the block's job and rehash every share it queues."""
+    job, extranonce1, _ = stratum_job(block)
+    miner.USE_NUMPY = engine == "numpy"  # Read by the forked worker
+    board = miner.SharedJobBoard()
+    board.publish(miner.compile_job(job, extranonce1.hex(), EXTRANONCE2_SIZE, WORKER_SHARE_TARGET))
+    counters = miner.WorkerCounters(1)
+    running = mp.Value("b", True)
+    shares = mp.Queue()
+    process = mp.Process(target=miner.mine_worker_process,
+                         args=(0, counters, running, board, shares, False, engine == "native", None), daemon=True)
+    process.start()
+    time.sleep(WORKER_RUN_SECONDS)
+    running.value = False
+    found = []
+    while process.is_alive() or not shares.empty():
+        try:
+            found.append(shares.get(timeout=0.2))
+        except Exception:
+            pass  # Empty: keep waiting for the worker to exit
+    process.join()
+    board.close()
+    miner.USE_NUMPY = False
+
+    stratum.extranonce1 = extranonce1.hex()
+    bad = []
+    for job_id, extranonce2_hex, ntime_hex, nonce, version_bits, difficulty, _ in found:
+        header = stratum.build_block_header(job, bytes.fromhex(extranonce2_hex), int(ntime_hex, 16), nonce, version_bits)
+        share_hash = int.from_bytes(double_sha256(header), "little")
+        if (job_id != job["job_id"] or share_hash >= WORKER_SHARE_TARGET
+                or abs(miner.hash_difficulty(share_hash) - difficulty) > difficulty * 1e-9):
+            bad.append(nonce)
+    hashes = counters.total(miner.WC_HASHES)
+    report.check(f"{engine} worker shares", found and not bad,
+                 f"{len(found)} shares in {hashes:,} hashes, {len(bad)} invalid (nonces {bad[:5]})")
+
+
+def check_mock_pool(miner, extranonce2_size: int, report: Report) -> None:
+    """Mine against MockPool with a small extranonce2: every share must be accepted, none duplicated."""
+    import io
+    import contextlib
+    pool = miner.MockPool(MOCK_POOL_DIFFICULTY, 1.0, 2, extranonce2_size)
+    miner.STRATUM_HOST, miner.STRATUM_PORT = "127.0.0.1", pool.start()
+    with contextlib.redirect_stdout(io.StringIO()):  # The miner's own banner and share lines
+        stratum = miner.StratumMiner()
+        pool.miner = stratum
+        try:
+            stratum.start(MOCK_POOL_WORKERS)
+            time.sleep(MOCK_POOL_RUN_SECONDS)
+        finally:
+            stratum.stop()
+            pool.stop()
+    counts = pool.counts
+    report.check(f"{extranonce2_size}-byte extranonce2, {MOCK_POOL_WORKERS} workers",
+                 counts["accepted"] and not counts["duplicate"] and not counts["invalid"] and not stratum.verify_mismatches(),
+                 f"{counts['accepted']} accepted, {counts['duplicate']} duplicate, {counts['invalid']} invalid, "
+                 f"{stratum.verify_mismatches()} failed local verification")
+
+
+def measure_speed(miner, block: dict, seconds: float) -> dict:
+    """Single-core hashes/sec of each backend on the golden header."""
+    header_buf = bytearray(reference_header(block))
+    pack_into = struct.pack_into
+    rates = {}
+
+    def run(name, hash_batch):
+        hashes = 0
+        nonce = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            hashes += hash_batch(nonce)
+            nonce = (nonce + hashes) & 0xFFFFFFFF
+        rates[name] = hashes / (time.perf_counter() - started)
+        print(f"  {name:<32} {rates[name]:>14,.0f} H/s")
+
+    for name, sha256_func in sha256_backends().items():
+        def full_header(nonce, sha256_func=sha256_func):
+            for n in range(nonce, nonce + 4096):
+                pack_into("<I", header_buf, 76, n & 0xFFFFFFFF)
+                sha256_func(sha256_func(header_buf))
+            return 4096
+        run(f"{name} (full header)", full_header)
+
+    sha256 = hashlib.sha256
+    midstate_copy = miner.header_midstate(header_buf).copy
+    header_tail = memoryview(header_buf)[64:]
+
+    def midstate_loop(nonce):
+        for n in range(nonce, nonce + 4096):
+            pack_into("<I", header_buf, 76, n & 0xFFFFFFFF)
+            h = midstate_copy()
+            h.update(header_tail)
+            sha256(h.digest()).digest()
+        return 4096
+    run("hashlib midstate (hot loop)", midstate_loop)
+
+    target_bytes = miner.int_to_target_bytes(bits_to_target(int(block["bits"], 16)))
+    for name, scan in range_engines(miner).items():
+        batch = miner.NUMPY_MAX_LANES if name == "numpy" else miner.NATIVE_BATCH_SIZE
+        def range_batch(nonce, scan=scan, batch=batch):
+            nonce = min(nonce, 0x100000000 - batch)
+            result = scan(header_buf, nonce, nonce + batch, target_bytes)
+            return result[0] if isinstance(result, tuple) else result
+        run(name, range_batch)
+    return rates
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    seconds = 1.0
+    json_path = None
+    speed = True
+    fixture_path = FIXTURE_PATH
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == "--no-speed":
+            speed = False
+        elif arg in ("--seconds", "--json", "--fixture") and i + 1 < len(args):
+            value = args[i + 1]
+            i += 1
+            if arg == "--seconds":
+                seconds = float(value)
+            elif arg == "--json":
+                json_path = value
+            else:
+                fixture_path = value
+        else:
+            print(__doc__.strip())
+            return 2
+        i += 1
+
+    sys.path.insert(0, SCRIPT_DIR)  # minr_native built next to the miner
+    miner = load_miner(MINER_PATH)
+    with open(fixture_path) as f:
+        blocks = json.load(f)["blocks"]
+
+    report = Report()
+    stratum = miner.StratumMiner()  # For its helpers only: never started
+    engines = ["python"] + list(range_engines(miner))
+    print(f"SHA-256 backends: {', '.join(sha256_backends())}; batch engines: {', '.join(engines[1:]) or 'none'}")
+    for block in blocks:
+        print(f"Block {block['height']} ({block['hash'][:20]}...)")
+        if not check_fixture(block, report):
+            continue  # Fixture data is wrong: miner results against it mean nothing
+        report.run("helpers", check_helpers, miner, stratum, block, report)
+        report.run("backends", check_backends, miner, block, report)
+    print(f"Live worker on block {blocks[-1]['height']}'s job")
+    for engine in engines:
+        report.run(f"{engine} worker", check_worker, miner, stratum, blocks[-1], engine, report)
+    stratum.job_board.close()
+    print("Mock pool end to end")
+    for extranonce2_size in MOCK_POOL_EXTRANONCE2_SIZES:
+        report.run(f"mock pool ({extranonce2_size}-byte extranonce2)", check_mock_pool, miner, extranonce2_size, report)
+
+    rates = {}
+    if speed:
+        print(f"Speed (single core, {seconds:g} s per backend)")
+        rates = measure_speed(miner, blocks[-1], seconds)
+
+    print(f"{report.passed} passed, {len(report.failed)} failed")
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump({"passed": report.passed, "failed": report.failed, "hashes_per_second": rates,
+                       "python": platform.python_version(), "machine": platform.machine(),
+                       "timestamp": int(time.time())}, f, indent=2)
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
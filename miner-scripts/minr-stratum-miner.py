@@ -9,9 +9,11 @@ This miner connects directly to the Stratum pool and mines Bitcoin blocks.
 
 import sys
 import time
+import bisect
 import hashlib
 import json
-import socket
+import random
+import asyncio
 import struct
 import threading
 import multiprocessing as mp
@@ -37,12 +39,53 @@ AUTH_TOKEN = "{{AUTH_TOKEN}}"
 DEBUG_STRATUM = False
 TEST_LOW_DIFF = False
 BENCH_MODE = False
+BENCH_ENGINES = None  # Header engines to benchmark (--bench-engines; None = every engine that loads)
+BENCH_WORKERS = None  # Worker counts (--bench-workers; None = 1 and the thread count)
+BENCH_BATCH_SIZES = None  # Nonces per call for the batch engines (--bench-batch; None = engine default)
+BENCH_BRANCHES = [0, 12]  # Merkle branch depths for the coinbase + merkle root benchmark (--bench-branches)
+BENCH_TRIALS = 3  # Measured windows per benchmark cell (--bench-trials)
+BENCH_SECONDS = 2.0  # Length of each window (--bench-seconds)
+BENCH_WARMUP_SECONDS = 1.0  # Unmeasured run before the first window (--bench-warmup)
+BENCH_JSON = None  # Write benchmark results to this file (--bench-json)
+BENCH_BASELINE = None  # Saved results to compare against (--bench-compare)
+BENCH_TOLERANCE = 5.0  # Percent below the baseline median that counts as a regression (--bench-tolerance)
 PROFILE_MODE = False
 USE_NATIVE = False  # Force native module if available
-TRACE_PERF = False  # Performance tracing mode
-TRACE_INTERVAL = 2.0  # Seconds between trace prints
-NATIVE_BATCH_SIZE = 1 << 20  # Default native batch size (1M)
+USE_NUMPY = False  # Batched NumPy SHA-256d engine (--backend numpy)
+TRACE_PERF = False  # Phase profiler of the mining loop (--trace-perf)
+TRACE_INTERVAL = 2.0  # Seconds between phase profile prints
+TRACE_SAMPLE_BATCHES = 8  # Python hot loop: every Nth batch runs the per-hash timed copy of the loop
+NATIVE_BATCH_SIZE = 1 << 20  # Default native batch size (1M) - upper bound for adaptive native ranges
+JOB_SLICE_SECONDS = 0.02  # Wall-clock slice per batch; bounds how long a worker mines a stale job
+MIN_BATCH_SIZE = 1024  # Adaptive batch floor (keeps per-batch overhead small on slow backends)
 RUN_SECONDS = None  # Hard deadline for test runs (None = no limit)
+MAX_LINE_BYTES = 1 << 20  # Longest Stratum line accepted before the receive buffer is discarded
+BACKUP_POOLS = []  # Failover pools as (host, port), tried after STRATUM_HOST:STRATUM_PORT (--pool)
+POOL_BACKOFF_BASE = 1.0  # First reconnect delay after a pool fails (seconds, doubles per failure)
+POOL_BACKOFF_MAX = 60.0  # Reconnect delay cap
+POOL_FAILBACK_INTERVAL = 60.0  # How often a failover session probes the primary pool
+POOL_STABLE_SECONDS = 60.0  # A session lasting this long (or with an accepted share) resets the pool's backoff
+VERSION_ROLLING = True  # Negotiate BIP310 version rolling (--no-version-rolling disables)
+VERSION_ROLLING_MASK = 0x1FFFE000  # Version bits we ask to roll (BIP320 general-purpose bits)
+TARGET_SHARE_RATE = 0.0  # Shares per minute to steer toward with mining.suggest_difficulty (0 = off)
+VARDIFF_INTERVAL = 60.0  # Seconds between share-rate measurements / difficulty suggestions
+JOB_REGISTRY_SIZE = 32  # Most recent jobs remembered per pool session for share validation
+VERIFY_SHARES = True  # Rebuild and rehash every share before submit (--no-verify-shares disables)
+STATS_REPORT_TIMEOUT = 5.0  # Seconds per /api/miner-stats request (on the reporter thread, never the stats loop)
+STATS_SPOOL_PATH = None  # Unsent stats samples (JSON lines); None = minr-stats-spool.jsonl next to this script
+STATS_SPOOL_MAX_BYTES = 1 << 20  # Oldest spooled samples are dropped beyond this
+METRICS_HOST = "127.0.0.1"  # Prometheus endpoint bind address (--metrics-port [host:]port)
+METRICS_PORT = 0  # Prometheus endpoint port (0 = off)
+TRACE_RING_EVENTS = 0  # Events kept per worker in the shared-memory trace ring (--trace-ring; 0 = off)
+TRACE_FILE = None  # Trace ring dump (JSON lines, on SIGUSR1 and at exit); None = minr-trace.jsonl next to this script
+MOCK_POOL = False  # Mine against a local in-process Stratum pool instead of STRATUM_HOST (--mock-pool)
+MOCK_JOB_INTERVAL = 2.0  # Seconds between the mock pool's clean_jobs notifies (--mock-job-interval)
+MOCK_DIFFICULTY = 0.0001  # Share difficulty the mock pool sets (--mock-difficulty)
+MOCK_BRANCHES = 12  # Merkle branches per mock job (a mainnet-sized block)
+MOCK_EXTRANONCE2_SIZE = 4  # extranonce2 bytes the mock pool hands out (--mock-extranonce2-size)
+RECORD_FILE = None  # Log every Stratum line sent and received to this file (--record)
+REPLAY_FILE = None  # Play a --record log back instead of connecting to a pool (--replay)
+REPLAY_SPEED = 1.0  # Replay speed-up (--replay-speed; 0 = no waiting)
 
 # Global job ready event for threading mode (unique name to avoid collision)
 JOB_READY_EVT = threading.Event()
@@ -80,6 +123,18 @@ def int_to_target_bytes(target_int: int) -> bytes:
     """Convert target integer to 32-byte big-endian bytes for comparison."""
     return target_int.to_bytes(32, byteorder='big')
 
+def nbits_to_target(nbits: int) -> int:
+    """Expand the compact nbits encoding into the full network (block) target."""
+    exponent = nbits >> 24
+    mantissa = nbits & 0x007FFFFF
+    if exponent <= 3:
+        return mantissa >> (8 * (3 - exponent))
+    return mantissa << (8 * (exponent - 3))
+
+def hash_difficulty(hash_int: int) -> float:
+    """Share difficulty a hash achieves (difficulty-1 target / hash)."""
+    return 0x00000000FFFF0000000000000000000000000000000000000000000000000000 / max(hash_int, 1)
+
 def _select_sha256_backend() -> Tuple[str, Callable]:
     """Select the fastest available SHA256 backend at runtime."""
     global _sha256_backend_name, _sha256_backend
@@ -113,117 +168,406 @@ def _select_sha256_backend() -> Tuple[str, Callable]:
     _sha256_backend = hashlib_sha256
     return _sha256_backend_name, _sha256_backend
 
+def header_midstate(header_buf):
+    """Absorb the first 64-byte block of an 80-byte header.
+
+    The returned hash object is the SHA-256 midstate: only bytes 64-79 (merkle
+    root tail, ntime, nbits, nonce) change during a nonce scan, so each candidate
+    is hashed as ``midstate.copy()`` + the 16-byte tail instead of all 80 bytes.
+    Must be recomputed whenever bytes 0-63 change (new job or extranonce2).
+
+    Always uses hashlib: OpenSSL's state copy is a C-level memcpy, while
+    pycryptodome's copy() goes through its Python wrapper and is slower than
+    rehashing the full header.
+    """
+    midstate = hashlib.sha256()
+    midstate.update(memoryview(header_buf)[:64])
+    return midstate
+
 def sha256d(data: bytes) -> bytes:
     """Double SHA256: SHA256(SHA256(data))"""
     backend_name, backend = _select_sha256_backend()
     return backend(backend(data))
 
 
-# Standalone bench_worker function (must be at module level for multiprocessing)
-def bench_worker(worker_id: int, shared_total_hashes, shared_running, test_header_bytes, use_native_flag):
-    """Benchmark worker: hash fixed header with varying nonce."""
-    global NATIVE_BATCH_SIZE
-    use_native = use_native_flag
-    
-    if use_native:
+# NumPy batched SHA-256d engine (optional dependency, loaded on first use)
+_numpy = None
+_numpy_k = None
+_numpy_midstate = (None, None)  # (first 64 header bytes, compressed state) of the last scan
+NUMPY_MAX_LANES = 1 << 16  # Nonces hashed per vectorized pass (bounds temporary array memory)
+NUMPY_MIN_LANES = 1 << 12  # Smallest useful batch: below this the fixed per-call cost dominates
+
+_SHA256_K = (
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+)
+_SHA256_IV = (0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19)
+
+
+def _check_numpy() -> bool:
+    """Check if NumPy is available for the batched engine."""
+    global _numpy, _numpy_k
+    if _numpy is None:
         try:
-            import minr_native
-            if not hasattr(minr_native, 'scan_nonces'):
-                return
-            backend_name = "native"
-            sha256_func = None
+            import numpy
+            _numpy = numpy
+            _numpy_k = [numpy.uint32(k) for k in _SHA256_K]
         except ImportError:
+            _numpy = False
+    return _numpy is not False
+
+
+def _numpy_sha256_compress(state, w):
+    """One SHA-256 compression over uint32 lanes.
+
+    state and w hold NumPy uint32 scalars or equal-length arrays; scalars
+    broadcast, so rounds that do not depend on the nonce run once per batch
+    instead of once per lane.
+    """
+    u32 = _numpy.uint32
+
+    def rotr(x, n):
+        return (x >> u32(n)) | (x << u32(32 - n))
+
+    w = list(w)
+    for t in range(16, 64):
+        x, y = w[t - 15], w[t - 2]
+        sigma0 = rotr(x, 7) ^ rotr(x, 18) ^ (x >> u32(3))
+        sigma1 = rotr(y, 17) ^ rotr(y, 19) ^ (y >> u32(10))
+        w.append(w[t - 16] + sigma0 + w[t - 7] + sigma1)
+
+    K = _numpy_k
+    a, b, c, d, e, f, g, h = state
+    for t in range(64):
+        t1 = h + (rotr(e, 6) ^ rotr(e, 11) ^ rotr(e, 25)) + ((e & f) ^ (~e & g)) + K[t] + w[t]
+        t2 = (rotr(a, 2) ^ rotr(a, 13) ^ rotr(a, 22)) + ((a & b) ^ (a & c) ^ (b & c))
+        h, g, f, e, d, c, b, a = g, f, e, d + t1, c, b, a, t1 + t2
+    return [x + y for x, y in zip(state, (a, b, c, d, e, f, g, h))]
+
+
+def numpy_scan_nonces(header_buf, nonce_start: int, nonce_end: int, target_be_bytes: bytes):
+    """Batched SHA-256d of header_buf for every nonce in [nonce_start, nonce_end).
+
+    Same call shape and return value as minr_native.scan_nonces:
+    (hashes_done, found_count, found_nonces, found_hashes). The first header
+    block is compressed once (midstate); the second block and the second
+    SHA-256 run on whole uint32 lane arrays. The hash is compared as a
+    little-endian integer, like Bitcoin: the whole batch is tested against its
+    most significant word (the byte-swapped last digest word), and only those
+    candidates are turned into bytes and compared exactly.
+    """
+    global _numpy_midstate
+    np = _numpy
+    u32 = np.uint32
+    target = int.from_bytes(target_be_bytes, byteorder="big")
+    target_top = u32(target >> 224) if target < (1 << 256) else u32(0xFFFFFFFF)
+    words = struct.unpack(">20I", bytes(header_buf[:80]))
+
+    found_nonces = []
+    found_hashes = []
+    with np.errstate(over="ignore"):
+        # Midstate only changes with header bytes 0-63 (new job or extranonce2)
+        first_block = bytes(header_buf[:64])
+        if _numpy_midstate[0] != first_block:
+            _numpy_midstate = (first_block, _numpy_sha256_compress([u32(v) for v in _SHA256_IV], [u32(v) for v in words[:16]]))
+        midstate = _numpy_midstate[1]
+        # Second block: merkle tail, ntime, nbits, nonce (big-endian word of LE bytes) + padding for 80 bytes
+        block2 = [u32(words[16]), u32(words[17]), u32(words[18]), None, u32(0x80000000)]
+        block2 += [u32(0)] * 10 + [u32(640)]
+        # Digest of the first hash is padded to a 64-byte block for the second hash
+        pad2 = [u32(0x80000000)] + [u32(0)] * 6 + [u32(256)]
+        iv = [u32(v) for v in _SHA256_IV]
+
+        for lane_start in range(nonce_start, nonce_end, NUMPY_MAX_LANES):
+            lane_end = min(lane_start + NUMPY_MAX_LANES, nonce_end)
+            nonces = np.arange(lane_start, lane_end, dtype=np.int64).astype(np.uint32)
+            block2[3] = nonces.byteswap()  # Header stores the nonce little-endian
+            first = _numpy_sha256_compress(midstate, block2)
+            digest = _numpy_sha256_compress(iv, first + pad2)
+
+            candidates = np.flatnonzero(digest[7].byteswap() <= target_top)
+            for lane in candidates:
+                hash_bytes = struct.pack(">8I", *(int(word[lane]) for word in digest))
+                if int.from_bytes(hash_bytes, byteorder="little") < target:
+                    found_nonces.append(lane_start + int(lane))
+                    found_hashes.append(hash_bytes)
+
+    return (nonce_end - nonce_start, len(found_nonces), found_nonces, found_hashes)
+
+
+# Standalone bench_worker function (must be at module level for multiprocessing)
+def bench_worker(worker_id: int, worker_counters, shared_running, test_header_bytes, engine: str, batch_size: int):
+    """Benchmark worker: hash a fixed header with varying nonce on one header engine.
+
+    engine is "python" (hashlib midstate loop), "numpy" or "native"; batch
+    engines scan batch_size nonces per call. Every hash is compared against a
+    difficulty-1 target as in the mining loop; hashes done and shares found
+    are stored into this worker's WorkerCounters slot after every batch.
+    """
+    counters = worker_counters.array
+    slot = worker_counters.slot(worker_id)
+    range_scan = None  # Batch engine taking [nonce_start, nonce_end) ranges
+    if engine == "native":
+        if not _check_native_module():
+            return
+        range_scan = _native_module.scan_nonces
+    elif engine == "numpy":
+        if not _check_numpy():
             return
+        range_scan = numpy_scan_nonces
     else:
-        backend_name, sha256_func = _select_sha256_backend()
+        batch_size = 4096  # Python loop: counters and the running flag are checked every 4096 hashes
     
     # Create local copy of header
     header_buf = bytearray(test_header_bytes)
     nonce_start = worker_id * 0x1000000
     nonce = nonce_start
     nonce_end = (worker_id + 1) * 0x1000000
-    
     local_count = 0
+    local_shares = 0
     
-    if use_native and backend_name == "native":
-        # Native mode: use scan_nonces
-        target_be_bytes = int_to_target_bytes(0x00000000FFFF0000000000000000000000000000000000000000000000000000)
-        while shared_running.value:
-            # Use native scan_nonces in batches
-            batch_size = min(NATIVE_BATCH_SIZE, nonce_end - nonce)
-            if batch_size <= 0:
-                nonce = nonce_start
-                batch_size = min(NATIVE_BATCH_SIZE, nonce_end - nonce_start)
-            
-            result = minr_native.scan_nonces(
-                header_buf, nonce, nonce + batch_size, target_be_bytes
-            )
+    # Difficulty-1 target: a share turns up now and then, as when mining
+    target = 0x00000000FFFF0000000000000000000000000000000000000000000000000000
+    target_be_bytes = int_to_target_bytes(target)
+    # Python mode: per-hash loop from a cached midstate (header bytes 0-63 never change here)
+    sha256 = hashlib.sha256
+    midstate_copy = header_midstate(header_buf).copy
+    header_tail = memoryview(header_buf)[64:]
+    pack_into = struct.pack_into
+    from_bytes = int.from_bytes
+    while shared_running.value:
+        scan_end = min(nonce + batch_size, nonce_end)
+        if range_scan is not None:
+            result = range_scan(header_buf, nonce, scan_end, target_be_bytes)
             if isinstance(result, tuple):
-                hashes_done = result[0]
+                local_count += result[0]
+                local_shares += result[1]
             else:
-                hashes_done = result
-            local_count += hashes_done
-            nonce += batch_size
-            
-            if nonce >= nonce_end:
-                nonce = nonce_start
-            
-            # Update shared counter periodically
-            if local_count >= 100000:
-                with shared_total_hashes.get_lock():
-                    shared_total_hashes.value += local_count
-                local_count = 0
-        
-        # Final update
-        if local_count > 0:
-            with shared_total_hashes.get_lock():
-                shared_total_hashes.value += local_count
-    else:
-        # Python mode: per-hash loop
-        while shared_running.value:
-            # Mutate only nonce bytes
-            struct.pack_into("<I", header_buf, 76, nonce)
-            
-            # Double SHA256 using backend directly
-            hash1 = sha256_func(bytes(header_buf))
-            hash2 = sha256_func(hash1)
-            
-            local_count += 1
-            nonce += 1
-            
-            if nonce >= nonce_end:
-                nonce = nonce_start
-            
-            # Update shared counter every 100k hashes
-            if local_count % 100000 == 0:
-                with shared_total_hashes.get_lock():
-                    shared_total_hashes.value += 100000
-        
-        # Final update
-        with shared_total_hashes.get_lock():
-            shared_total_hashes.value += local_count % 100000
+                local_count += result
+        else:
+            for n in range(nonce, scan_end):
+                # Mutate only nonce bytes, then clone the midstate and absorb the 16-byte tail
+                pack_into("<I", header_buf, 76, n)
+                h = midstate_copy()
+                h.update(header_tail)
+                hash2 = sha256(h.digest()).digest()
+                if from_bytes(hash2, byteorder="little") < target:
+                    local_shares += 1
+            local_count += scan_end - nonce
+        nonce = scan_end if scan_end < nonce_end else nonce_start
+        counters[slot + WC_HASHES] = local_count
+        counters[slot + WC_SHARES] = local_shares
+
+
+def bench_sha256_backends() -> Dict[str, Callable]:
+    """Single-shot SHA-256 functions available here, by backend name (for the merkle benchmark)."""
+    def hashlib_sha256(data):
+        return hashlib.sha256(data).digest()
+    backends = {"hashlib": hashlib_sha256}
+    try:
+        from Crypto.Hash import SHA256 as Crypto_SHA256
+        def crypto_sha256(data):
+            h = Crypto_SHA256.new()
+            h.update(data)
+            return h.digest()
+        backends["pycryptodome"] = crypto_sha256
+    except ImportError:
+        pass
+    return backends
+
+
+def summarize_trials(rates: list) -> Dict[str, Any]:
+    """Median, standard deviation and range of a list of trial rates."""
+    import statistics
+    return {
+        "trials": [round(rate, 1) for rate in rates],
+        "median": round(statistics.median(rates), 1),
+        "stdev": round(statistics.stdev(rates), 1) if len(rates) > 1 else 0.0,
+        "min": round(min(rates), 1),
+        "max": round(max(rates), 1),
+    }
+
+
+def bench_hashing(engine: str, num_workers: int, batch_size: Optional[int], test_header: bytes) -> Dict[str, Any]:
+    """One matrix cell: warm up, then BENCH_TRIALS windows of BENCH_SECONDS over the same worker processes."""
+    worker_counters = WorkerCounters(num_workers)
+    shared_running = mp.Value('b', True)
+    processes = []
+    for i in range(num_workers):
+        p = mp.Process(target=bench_worker, args=(i, worker_counters, shared_running, test_header, engine, batch_size or 0),
+                       daemon=True)
+        p.start()
+        processes.append(p)
+    
+    rates = []
+    try:
+        time.sleep(BENCH_WARMUP_SECONDS)
+        last_hashes, last_time = worker_counters.total(WC_HASHES), time.perf_counter()
+        for _ in range(BENCH_TRIALS):
+            time.sleep(BENCH_SECONDS)
+            hashes, now = worker_counters.total(WC_HASHES), time.perf_counter()
+            rates.append((hashes - last_hashes) / (now - last_time))
+            last_hashes, last_time = hashes, now
+    finally:
+        shared_running.value = False
+        for p in processes:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+    
+    result = {"engine": engine, "workers": num_workers, "batch_size": batch_size}
+    result.update(summarize_trials(rates))
+    result["per_worker"] = round(result["median"] / num_workers, 1)
+    return result
+
+
+def bench_merkle(backend: str, sha256_func: Callable, branches: int) -> Dict[str, Any]:
+    """Coinbase hash + merkle walk per extranonce2 (the work rolled per 2^32 nonces), in roots/s."""
+    import os
+    coinbase = bytearray(os.urandom(200))  # Typical coinbase transaction size
+    branch_bytes = [os.urandom(32) for _ in range(branches)]
+    extranonce2 = 0
+    
+    def run_for(seconds):
+        nonlocal extranonce2
+        roots = 0
+        start = time.perf_counter()
+        deadline = start + seconds
+        while time.perf_counter() < deadline:
+            for _ in range(100):
+                extranonce2 += 1
+                struct.pack_into("<I", coinbase, 100, extranonce2 & 0xFFFFFFFF)
+                compute_coinbase_merkle_root(bytes(coinbase), branch_bytes, sha256_func)
+            roots += 100
+        return roots / (time.perf_counter() - start)
+    
+    run_for(BENCH_WARMUP_SECONDS)
+    result = {"sha256": backend, "branches": branches}
+    result.update(summarize_trials([run_for(BENCH_SECONDS) for _ in range(BENCH_TRIALS)]))
+    result["us_per_root"] = round(1e6 / result["median"], 3) if result["median"] else None
+    return result
+
+
+def bench_machine_info() -> Dict[str, Any]:
+    """Where the benchmark ran: results are only comparable on the same machine and software."""
+    import os
+    import platform
+    import ssl
+    info = {
+        "hostname": platform.node(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_model": platform.processor() or platform.machine(),
+        "cpu_count": mp.cpu_count(),
+        "python": platform.python_version(),
+        "python_implementation": platform.python_implementation(),
+        "openssl": ssl.OPENSSL_VERSION,
+        "numpy": _numpy.__version__ if _check_numpy() else None,
+        "native_module": getattr(_native_module, "__file__", None) if _check_native_module() else None,
+    }
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    info["cpu_model"] = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    try:
+        from Crypto import __version__ as crypto_version
+        info["pycryptodome"] = crypto_version
+    except ImportError:
+        info["pycryptodome"] = None
+    with open(os.path.abspath(__file__), "rb") as f:
+        info["miner_sha256"] = hashlib.sha256(f.read()).hexdigest()  # Identifies the build under test
+    return info
+
+
+def compare_benchmarks(baseline: Dict[str, Any], results: Dict[str, Any], tolerance_pct: float) -> int:
+    """Print each result against the baseline cell with the same key; returns the number of regressions.
 
+    A cell regresses when its median is more than tolerance_pct below the
+    baseline median; one whose trials spread wider than the tolerance is
+    marked noisy. Cells present on only one side are listed, not flagged.
+    """
+    regressions = 0
+    machine_keys = ("cpu_model", "cpu_count", "python", "platform")
+    different = [key for key in machine_keys if baseline.get("machine", {}).get(key) != results["machine"].get(key)]
+    print(f"Compared with baseline from {baseline.get('created', '?')} (tolerance {tolerance_pct:g}%)")
+    if different:
+        print(f"⚠ Baseline machine differs ({', '.join(different)}): numbers may not be comparable")
+    sections = (("hashing", ("engine", "workers", "batch_size"), "H/s"),
+                ("merkle", ("sha256", "branches"), "roots/s"))
+    for section, key_fields, unit in sections:
+        def label(key):
+            return " ".join(f"{k}={v if v is not None else '-'}" for k, v in zip(key_fields, key))
+        base_cells = {tuple(cell.get(k) for k in key_fields): cell for cell in baseline.get(section, [])}
+        for cell in results[section]:
+            key = tuple(cell.get(k) for k in key_fields)
+            base = base_cells.pop(key, None)
+            if base is None or not base.get("median"):
+                print(f"  {label(key)}: {cell['median']:,.0f} {unit} (not in baseline)")
+                continue
+            change = (cell["median"] - base["median"]) / base["median"] * 100
+            spread = max(c.get("stdev", 0) / c["median"] * 100 if c["median"] else 0 for c in (cell, base))
+            regressed = change < -tolerance_pct
+            regressions += regressed
+            print(f"  {label(key)}: {cell['median']:,.0f} vs {base['median']:,.0f} {unit} ({change:+.1f}%)"
+                  f"{'  REGRESSION' if regressed else ''}{f'  (noisy: ±{spread:.1f}%)' if spread > tolerance_pct else ''}")
+        for key in base_cells:
+            print(f"  {label(key)}: in baseline only")
+    print(f"{regressions} regression(s)" if regressions else "No regressions")
+    return regressions
 
-def run_benchmark(num_threads: int):
-    """Benchmark mode: test hashing performance without Stratum connection."""
+
+def run_benchmark(num_threads: int) -> int:
+    """Benchmark mode: a matrix of hashing runs without a Stratum connection.
+
+    Every combination of header engine (python, numpy, native), worker count
+    and batch size (batch engines only) hashes a fixed header, plus a
+    single-process coinbase + merkle root benchmark per SHA-256 backend and
+    branch depth. Each cell is warmed up, then measured BENCH_TRIALS times;
+    the median and standard deviation are printed and optionally written to
+    BENCH_JSON. With BENCH_BASELINE, the medians are compared against a saved
+    run. Returns the process exit code (1 if a cell regressed).
+    """
     print("=" * 60)
     print("Minr.online Python Stratum Miner - BENCHMARK MODE")
     print("=" * 60)
     
-    # Select backend (check native if --native was set)
-    global USE_NATIVE
-    if USE_NATIVE:
-        if not _check_native_module():
-            print("ERROR: --native specified but native module not available")
-            sys.exit(2)
-        backend_name = "native"
-        sha256_func = None  # Not used in native mode
-        print(f"SHA256 Backend: native (minr_native.scan_nonces)")
-    else:
-        backend_name, sha256_func = _select_sha256_backend()
-        print(f"SHA256 Backend: {backend_name}")
-    print(f"Workers: {num_threads}")
-    print(f"CPU Cores: {mp.cpu_count()}")
+    # Engines: what was asked for (--bench-engines, or --native / --backend numpy), else all that load
+    engines = BENCH_ENGINES
+    if engines is None:
+        if USE_NATIVE:
+            engines = ["native"]
+        elif USE_NUMPY:
+            engines = ["numpy"]
+        else:
+            engines = ["python"] + [name for name, available in (("numpy", _check_numpy), ("native", _check_native_module))
+                                    if available()]
+    for engine in engines:
+        if engine not in ("python", "numpy", "native"):
+            print(f"ERROR: Unknown benchmark engine '{engine}' (use python, numpy or native)")
+            return 2
+        if (engine == "numpy" and not _check_numpy()) or (engine == "native" and not _check_native_module()):
+            print(f"ERROR: {engine} engine not available on this machine")
+            return 2
+    worker_counts = BENCH_WORKERS or sorted({1, num_threads})
+    sha256_backends = bench_sha256_backends()
+    forced_backend = (_sha256_backend_name or "").split(" ")[0]  # Set only by --backend hashlib / pycryptodome here
+    if forced_backend in sha256_backends:
+        sha256_backends = {forced_backend: sha256_backends[forced_backend]}
+    
+    print(f"Engines: {', '.join(engines)} | Workers: {', '.join(map(str, worker_counts))} | "
+          f"Batch sizes: {', '.join(map(str, BENCH_BATCH_SIZES)) if BENCH_BATCH_SIZES else 'engine default'}")
+    print(f"Merkle: {', '.join(sha256_backends)} x {', '.join(map(str, BENCH_BRANCHES))} branches")
+    print(f"Trials: {BENCH_TRIALS} x {BENCH_SECONDS:g} s after {BENCH_WARMUP_SECONDS:g} s warm-up | CPU Cores: {mp.cpu_count()}")
     print("=" * 60)
     
     # Create a fixed 80-byte header for benchmarking
@@ -232,167 +576,681 @@ def run_benchmark(num_threads: int):
     test_header[0:4] = struct.pack("<I", 0x20000000)  # version
     test_header[4:36] = b'\x00' * 32  # prevhash (zeros)
     test_header[36:68] = b'\x00' * 32  # merkle_root (zeros)
-    test_header[68:72] = struct.pack("<I", 0x1d00ffff)  # nbits
-    test_header[72:76] = struct.pack("<I", int(time.time()))  # ntime
+    test_header[68:72] = struct.pack("<I", int(time.time()))  # ntime
+    test_header[72:76] = struct.pack("<I", 0x1d00ffff)  # nbits
     test_header[76:80] = struct.pack("<I", 0)  # nonce
+    test_header = bytes(test_header)
     
-    # Shared counter for total hashes
-    shared_total_hashes = mp.Value('q', 0)
-    shared_running = mp.Value('b', True)
+    results = {
+        "format": 1,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "machine": bench_machine_info(),
+        "settings": {"trials": BENCH_TRIALS, "seconds": BENCH_SECONDS, "warmup_seconds": BENCH_WARMUP_SECONDS},
+        "hashing": [],
+        "merkle": [],
+    }
+    for engine in engines:
+        default_batch = NATIVE_BATCH_SIZE if engine == "native" else NUMPY_MAX_LANES
+        batch_sizes = [None] if engine == "python" else (BENCH_BATCH_SIZES or [default_batch])
+        for num_workers in worker_counts:
+            for batch_size in batch_sizes:
+                cell = bench_hashing(engine, num_workers, batch_size, test_header)
+                results["hashing"].append(cell)
+                spread = cell["stdev"] / cell["median"] * 100 if cell["median"] else 0.0
+                print(f"{engine:<7} workers={num_workers:<3} batch={batch_size or '-':<8} "
+                      f"{cell['median']:>14,.0f} H/s  ±{spread:.1f}%  (per worker {cell['per_worker']:,.0f} H/s)")
+    for backend, sha256_func in sha256_backends.items():
+        for branches in BENCH_BRANCHES:
+            cell = bench_merkle(backend, sha256_func, branches)
+            results["merkle"].append(cell)
+            spread = cell["stdev"] / cell["median"] * 100 if cell["median"] else 0.0
+            print(f"merkle  {backend:<13} branches={branches:<3} {cell['median']:>10,.0f} roots/s  ±{spread:.1f}%  "
+                  f"({cell['us_per_root']} us per extranonce2)")
+    print("=" * 60)
     
-    # Start workers (pass test_header and USE_NATIVE as arguments)
-    processes = []
-    for i in range(num_threads):
-        p = mp.Process(target=bench_worker, args=(i, shared_total_hashes, shared_running, test_header, USE_NATIVE), daemon=True)
-        p.start()
-        processes.append(p)
+    if BENCH_JSON:
+        with open(BENCH_JSON, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {BENCH_JSON}")
+    if BENCH_BASELINE:
+        try:
+            with open(BENCH_BASELINE) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: Cannot read baseline {BENCH_BASELINE}: {e}")
+            return 2
+        if compare_benchmarks(baseline, results, BENCH_TOLERANCE):
+            return 1
+    return 0
+
+
+def set_bench_option(option: str, value: str) -> None:
+    """Apply one --bench-* option (raises ValueError on a bad value)."""
+    global BENCH_ENGINES, BENCH_WORKERS, BENCH_BATCH_SIZES, BENCH_BRANCHES, BENCH_TRIALS, BENCH_SECONDS
+    global BENCH_WARMUP_SECONDS, BENCH_JSON, BENCH_BASELINE, BENCH_TOLERANCE
+    
+    def int_list(text):
+        values = [int(part) for part in text.split(",") if part.strip()]
+        if not values or min(values) < 0:
+            raise ValueError(text)
+        return values
+    
+    if option == "--bench-engines":
+        BENCH_ENGINES = [part.strip() for part in value.split(",") if part.strip()]
+    elif option == "--bench-workers":
+        BENCH_WORKERS = int_list(value)
+    elif option == "--bench-batch":
+        BENCH_BATCH_SIZES = int_list(value)
+    elif option == "--bench-branches":
+        BENCH_BRANCHES = int_list(value)
+    elif option == "--bench-trials":
+        BENCH_TRIALS = max(1, int(value))
+    elif option == "--bench-seconds":
+        BENCH_SECONDS = float(value)
+    elif option == "--bench-warmup":
+        BENCH_WARMUP_SECONDS = float(value)
+    elif option == "--bench-json":
+        BENCH_JSON = value
+    elif option == "--bench-compare":
+        BENCH_BASELINE = value
+    elif option == "--bench-tolerance":
+        BENCH_TOLERANCE = float(value)
+    else:
+        raise KeyError(option)
+
+
+# Compiled job record layout (fixed, little-endian) published in shared memory:
+#   [0:8]   seq - seqlock counter, odd while a write is in progress; seq // 2 is the job generation
+#   [8:..]  _JOB_RECORD fields, then job id | coinbase prefix | coinb2 | merkle branches (32 bytes each)
+_JOB_RECORD = struct.Struct("<d32sI4s32s4sIIIIII?")
+JOB_RECORD_OFFSET = 8
+JOB_MAX_JOB_ID = 1024  # UTF-8 bytes; Stratum sets no limit, pools use short hex ids
+JOB_MAX_COINBASE = 8192  # coinb1 + extranonce1 + coinb2 bytes
+JOB_MAX_BRANCHES = 32  # Enough for 2^32 transactions
+JOB_BOARD_SIZE = JOB_RECORD_OFFSET + _JOB_RECORD.size + JOB_MAX_JOB_ID + JOB_MAX_COINBASE + JOB_MAX_BRANCHES * 32
+JOB_BOARD_SIZE += -JOB_BOARD_SIZE % 8  # Keep the buffer castable to uint64
+
+
+def stratum_prevhash_bytes(prevhash_hex: str) -> bytes:
+    """Header bytes of a mining.notify prevhash.
+
+    Stratum sends the previous block hash as eight 32-bit words in header
+    order, each word printed big-endian, so only the bytes within each word
+    are swapped.
+    """
+    raw = bytes.fromhex(prevhash_hex)
+    return b"".join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+
+
+def compile_job(job: Dict[str, Any], extranonce1: str, extranonce2_size: int, target: int, clean_jobs: bool = False,
+                version_mask: int = 0) -> Dict[str, Any]:
+    """Decode a mining.notify job once into header-ready bytes for the workers.
+
+    version_mask is the BIP310 mask negotiated with the pool (0 = no version rolling).
+    """
+    version_str = job.get("version", "20000000")
+    if isinstance(version_str, str):
+        version_int = int(version_str, 16) if version_str.startswith(('0x', '0X')) or all(c in '0123456789abcdefABCDEF' for c in version_str) else int(version_str)
+    else:
+        version_int = version_str
+    ntime = job.get("ntime", "")
+    return {
+        "job_id": job["job_id"],
+        "target": target,
+        "version": struct.pack("<I", version_int),
+        "prevhash": stratum_prevhash_bytes(job["prevhash"]),
+        "nbits": bytes.fromhex(job["nbits"])[::-1],
+        "ntime": int(ntime, 16) if isinstance(ntime, str) and ntime else int(ntime or 0),
+        "extranonce2_size": extranonce2_size,
+        "coinbase_prefix": bytes.fromhex(job["coinb1"]) + bytes.fromhex(extranonce1),
+        "coinb2": bytes.fromhex(job["coinb2"]),
+        "merkle_branches": [bytes.fromhex(branch) for branch in job.get("merkle_branches", [])],
+        "clean_jobs": bool(clean_jobs),
+        "version_mask": version_mask,
+    }
+
+
+class SharedJobBoard:
+    """Single-writer job record in multiprocessing.shared_memory, guarded by a seqlock.
+
+    The main process publishes each compiled job once; workers map the same
+    buffer and detect a new job with a single integer read of the sequence
+    counter (see generation()), with no manager process in the path.
+    """
+
+    def __init__(self, name: Optional[str] = None):
+        from multiprocessing import shared_memory
+        self._owner = name is None
+        if self._owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=JOB_BOARD_SIZE)
+            self.shm.buf[:JOB_BOARD_SIZE] = bytes(JOB_BOARD_SIZE)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self._seq = self.shm.buf[:JOB_BOARD_SIZE].cast("Q")
+
+    def __getstate__(self):
+        # Spawned workers (Windows) re-attach by name instead of pickling the buffer
+        return {"name": self.shm.name}
+
+    def __setstate__(self, state):
+        self.__init__(state["name"])
+
+    def sequence(self) -> int:
+        """Raw seqlock counter (odd while the main process is writing)."""
+        return self._seq[0]
+
+    def generation(self) -> int:
+        """Number of completed publishes (0 = no job yet)."""
+        return self._seq[0] >> 1
+
+    def publish(self, record: Dict[str, Any]) -> int:
+        """Write a compiled job record (from compile_job). Returns the new generation."""
+        coinbase_prefix = record["coinbase_prefix"]
+        coinb2 = record["coinb2"]
+        branches = record["merkle_branches"]
+        job_id = record["job_id"].encode()
+        if len(job_id) > JOB_MAX_JOB_ID:
+            raise ValueError(f"Job id {record['job_id'][:32]}... is {len(job_id)} bytes (limit {JOB_MAX_JOB_ID})")
+        if len(coinbase_prefix) + len(coinb2) > JOB_MAX_COINBASE or len(branches) > JOB_MAX_BRANCHES:
+            raise ValueError(f"Job {record['job_id']} exceeds shared job record limits")
+        fixed = _JOB_RECORD.pack(
+            time.time(), int_to_target_bytes(record["target"]), len(job_id),
+            record["version"], record["prevhash"], record["nbits"], record["ntime"],
+            record["extranonce2_size"], len(coinbase_prefix), len(coinb2), len(branches),
+            record["version_mask"], record["clean_jobs"],
+        )
+        payload = fixed + job_id + coinbase_prefix + coinb2 + b"".join(branches)
+
+        buf = self.shm.buf
+        seq = self._seq[0]
+        self._seq[0] = seq + 1  # Odd: readers retry until the write completes
+        buf[JOB_RECORD_OFFSET:JOB_RECORD_OFFSET + len(payload)] = payload
+        self._seq[0] = seq + 2
+        return (seq + 2) >> 1
+
+    def read(self) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Consistent snapshot of the current record as (sequence, record)."""
+        buf = self.shm.buf
+        seq_view = self._seq
+        fixed_end = JOB_RECORD_OFFSET + _JOB_RECORD.size
+        while True:
+            seq = seq_view[0]
+            if seq == 0:
+                return 0, None
+            if seq & 1:
+                continue  # Write in progress
+            fixed = bytes(buf[JOB_RECORD_OFFSET:fixed_end])
+            fields = _JOB_RECORD.unpack(fixed)
+            job_id_len, prefix_len, suffix_len, n_branches = fields[2], fields[8], fields[9], fields[10]
+            variable = bytes(buf[fixed_end:fixed_end + job_id_len + prefix_len + suffix_len + n_branches * 32])
+            if seq_view[0] != seq:
+                continue  # Overwritten while copying - retry
+            break
+
+        published_at, target_bytes, _, version, prevhash, nbits, ntime, extranonce2_size, _, _, _, version_mask, clean_jobs = fields
+        prefix_start = job_id_len
+        suffix_start = prefix_start + prefix_len
+        branches_start = suffix_start + suffix_len
+        return seq, {
+            "job_id": variable[:job_id_len].decode(),
+            "target": int.from_bytes(target_bytes, byteorder="big"),
+            "version": version,
+            "prevhash": prevhash,
+            "nbits": nbits,
+            "ntime": ntime,
+            "extranonce2_size": extranonce2_size,
+            "coinbase_prefix": variable[prefix_start:suffix_start],
+            "coinb2": variable[suffix_start:branches_start],
+            "merkle_branches": [variable[i:i + 32] for i in range(branches_start, len(variable), 32)],
+            "clean_jobs": clean_jobs,
+            "version_mask": version_mask,
+            "published_at": published_at,
+            # Everything except publish time and target: equal keys mean a target-only update
+            "job_key": fixed[40:] + variable,
+        }
+
+    def close(self) -> None:
+        self._seq.release()
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+# Per-worker counter slot layout (uint64 words). Each slot is one 64-byte cache line and
+# is written by exactly one worker, so there is no lock and no false sharing between cores.
+WORKER_SLOT_WORDS = 8
+WC_HASHES = 0  # Cumulative hashes
+WC_BATCHES = 1  # Completed batches
+WC_SHARES = 2  # Shares found (queued for submission)
+WC_SWITCH_US = 3  # Last job-switch latency (publish -> pickup), microseconds
+WC_BATCH_SIZE = 4  # Current adaptive batch size
+
+
+class WorkerCounters:
+    """Cache-line-padded per-worker uint64 counters in shared memory.
+
+    Workers store absolute values into their own slot; the main process sums
+    the slots for totals and diffs them for per-worker hashrate.
+    """
+
+    def __init__(self, num_workers: int, slot_words: int = WORKER_SLOT_WORDS):
+        import ctypes
+        self.num_workers = num_workers
+        self.slot_words = slot_words  # A multiple of 8 words keeps every slot on its own cache lines
+        # One spare line so the first slot can be aligned to a 64-byte boundary. Shared
+        # mappings are page-aligned, so the same offset holds in every (forked or spawned) process.
+        self.array = mp.RawArray(ctypes.c_uint64, num_workers * slot_words + 8)
+        self._align()
+
+    def _align(self):
+        import ctypes
+        self.base = (-ctypes.addressof(self.array) % 64) // 8
+
+    def __getstate__(self):
+        return {"num_workers": self.num_workers, "slot_words": self.slot_words, "array": self.array}
+
+    def __setstate__(self, state):
+        self.num_workers = state["num_workers"]
+        self.slot_words = state["slot_words"]
+        self.array = state["array"]
+        self._align()
+
+    def slot(self, worker_id: int) -> int:
+        """Index of word 0 of a worker's slot in self.array."""
+        return self.base + worker_id * self.slot_words
+
+    def get(self, worker_id: int, field: int) -> int:
+        return self.array[self.slot(worker_id) + field]
+
+    def snapshot(self, field: int) -> list:
+        """One field across all workers."""
+        array, base, slot_words = self.array, self.base, self.slot_words
+        return [array[base + i * slot_words + field] for i in range(self.num_workers)]
+
+    def total(self, field: int) -> int:
+        return sum(self.snapshot(field))
+
+
+# Mining loop phases timed by --trace-perf: cumulative nanoseconds per worker, in a WorkerCounters
+# with PHASE_SLOT_WORDS-word slots. Header hash and target compare are timed on sampled batches
+# only and divided by PH_SAMPLED_HASHES; every other phase is timed always and divided by all hashes.
+PHASE_NAMES = ("coinbase", "merkle", "midstate", "header", "compare", "enqueue", "job", "counters")
+PH_COINBASE, PH_MERKLE, PH_MIDSTATE, PH_HEADER, PH_COMPARE, PH_ENQUEUE, PH_JOB, PH_COUNTERS = range(len(PHASE_NAMES))
+PH_SAMPLED_HASHES = len(PHASE_NAMES)  # Hashes in the batches whose header/compare time was measured
+PHASE_SLOT_WORDS = 16
+
+
+# Trace event kinds, indexed by kind: (name, meaning of field a, meaning of field b)
+TRACE_EVENTS = (
+    ("worker_start", "pid", None),
+    ("job_wait", "wait_ms", None),
+    ("job_switch", "job_seq", "switch_ms"),
+    ("target_update", "job_seq", "difficulty"),
+    ("merkle_root", "extranonce2", None),
+    ("batch", "hashes", "batch_ms"),
+    ("share", "nonce", "difficulty"),
+    ("block_candidate", "nonce", "difficulty"),
+    ("workers_started", "workers", None),
+    ("pool_connected", "connect_ms", None),
+    ("job_published", "generation", "difficulty"),
+    ("stats", "hashrate", "total_hashes"),
+)
+(TE_WORKER_START, TE_JOB_WAIT, TE_JOB_SWITCH, TE_TARGET_UPDATE, TE_MERKLE_ROOT, TE_BATCH, TE_SHARE, TE_BLOCK_CANDIDATE,
+ TE_WORKERS_STARTED, TE_POOL_CONNECTED, TE_JOB_PUBLISHED, TE_STATS) = range(len(TRACE_EVENTS))
+TRACE_HEADER_WORDS = 8  # Ring header (event count), one cache line of doubles
+TRACE_EVENT_WORDS = 4  # time, kind, a, b
+
+
+class TraceBuffer:
+    """Per-worker ring buffers of fixed-size binary trace events in shared memory.
     
-    # Run for 5 seconds
-    print("Running benchmark for 5 seconds...")
-    time.sleep(5)
+    Each ring has exactly one writer - a worker process, or the event loop for
+    the last ring ("main") - which stores (time, kind, a, b) as four doubles
+    and then bumps the ring's event count: no lock, syscall or formatting on
+    the mining path. dump() reads the rings while the writers keep going and
+    skips any event that was overwritten during the read.
+    """
     
-    # Stop workers
-    shared_running.value = False
-    for p in processes:
-        p.join(timeout=1)
+    def __init__(self, num_workers: int, events: int):
+        import ctypes
+        self.num_workers = num_workers
+        self.events = events + (events & 1)  # Even, so every ring starts on a cache line
+        self.ring_words = TRACE_HEADER_WORDS + self.events * TRACE_EVENT_WORDS
+        # Rings for each worker plus the main process, and one spare line for alignment
+        self.array = mp.RawArray(ctypes.c_double, (num_workers + 1) * self.ring_words + 8)
+        self._align()
     
-    # Get final count
-    with shared_total_hashes.get_lock():
-        total_hashes = shared_total_hashes.value
+    def _align(self):
+        import ctypes
+        self.base = (-ctypes.addressof(self.array) % 64) // 8
     
-    total_hps = total_hashes / 5.0
-    per_worker_hps = total_hps / num_threads
+    def __getstate__(self):
+        return {"num_workers": self.num_workers, "events": self.events, "array": self.array}
     
-    print("=" * 60)
-    print("BENCHMARK RESULTS")
-    print("=" * 60)
-    print(f"Total hashes: {total_hashes:,}")
-    print(f"Total hashrate: {total_hps:,.0f} H/s")
-    print(f"Per worker: {per_worker_hps:,.0f} H/s")
-    print(f"Backend: {backend_name}")
-    print("=" * 60)
+    def __setstate__(self, state):
+        self.num_workers = state["num_workers"]
+        self.events = state["events"]
+        self.ring_words = TRACE_HEADER_WORDS + self.events * TRACE_EVENT_WORDS
+        self.array = state["array"]
+        self._align()
+    
+    def ring(self, source: int) -> int:
+        """Index of a ring's header in self.array (source num_workers is the main process)."""
+        return self.base + source * self.ring_words
+    
+    def record(self, ring: int, kind: int, a: float = 0, b: float = 0) -> None:
+        """Append one event; only the ring's own writer may call this."""
+        array = self.array
+        count = int(array[ring])
+        slot = ring + TRACE_HEADER_WORDS + count % self.events * TRACE_EVENT_WORDS
+        array[slot:slot + TRACE_EVENT_WORDS] = (time.time(), kind, a, b)
+        array[ring] = count + 1
+    
+    def read(self, source: int) -> list:
+        """Events still held in one ring, oldest first, as (time, kind, a, b)."""
+        ring = self.ring(source)
+        array = self.array
+        written = int(array[ring])
+        start = ring + TRACE_HEADER_WORDS
+        words = array[start:start + self.events * TRACE_EVENT_WORDS]
+        # Events written meanwhile (and one possibly half-written) replaced the oldest slots
+        first = max(0, int(array[ring]) + 1 - self.events)
+        events = []
+        for n in range(first, written):
+            slot = n % self.events * TRACE_EVENT_WORDS
+            events.append(tuple(words[slot:slot + TRACE_EVENT_WORDS]))
+        return events
+    
+    def dump(self, path: str) -> int:
+        """Write every ring to path as JSON lines sorted by time; returns the event count."""
+        import os
+        rows = []
+        for source in range(self.num_workers + 1):
+            worker = source if source < self.num_workers else "main"
+            for event_time, kind, a, b in self.read(source):
+                name, a_name, b_name = TRACE_EVENTS[int(kind)]
+                row = {"time": round(event_time, 6), "worker": worker, "event": name}
+                for field, value in ((a_name, a), (b_name, b)):
+                    if field:
+                        row[field] = int(value) if value.is_integer() else value
+                rows.append(row)
+        rows.sort(key=lambda row: row["time"])
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+        os.replace(temp_path, path)
+        return len(rows)
+
+
+def deposit_version_bits(value: int, mask: int) -> int:
+    """Spread the low bits of value over the set bits of mask (lowest mask bit first).
+
+    Enumerates every version a BIP310 mask allows: value 0..2^popcount(mask)-1
+    maps to a distinct mask-only bit pattern.
+    """
+    bits = 0
+    bit = 1
+    while value and mask:
+        if mask & 1:
+            if value & 1:
+                bits |= bit
+            value >>= 1
+        mask >>= 1
+        bit <<= 1
+    return bits
+
+
+def compute_coinbase_merkle_root(coinbase: bytes, merkle_branches_bytes: list, sha256_func: Callable) -> bytes:
+    """Hash the coinbase and fold in the merkle branches (once per extranonce2 value)."""
+    return fold_merkle_branches(sha256_func(sha256_func(coinbase)), merkle_branches_bytes, sha256_func)
+
+
+def fold_merkle_branches(coinbase_hash: bytes, merkle_branches_bytes: list, sha256_func: Callable) -> bytes:
+    """Walk the merkle branches up from the coinbase hash to the merkle root."""
+    merkle_root = coinbase_hash
+    for branch_bytes in merkle_branches_bytes:
+        merkle_root = sha256_func(sha256_func(merkle_root + branch_bytes))
+    return merkle_root
 
 
 # Standalone function for multiprocessing (must be outside class to avoid pickling issues)
-def mine_worker_process(worker_id: int, shared_total_hashes, shared_running, shared_job, share_queue, debug_mode=False):
-    """Mining worker process (multiprocessing - bypasses GIL for true parallelism)"""
-    # #region agent log
+def mine_worker_process(worker_id: int, worker_counters, shared_running, job_board, share_queue, debug_mode=False, use_native=False,
+                        block_channel=None, trace_buffer=None, phase_counters=None):
+    """Mining worker process (multiprocessing - bypasses GIL for true parallelism)
+    
+    Header-scan engine: the coinbase and merkle root are computed once per
+    extranonce2 value, then the full 2^32 header nonce space is scanned against
+    that root. When the pool allows version rolling (BIP310), each version the
+    mask permits gets its own 2^32 nonce scan first - a new version only costs a
+    new midstate - and extranonce2 is rolled (new merkle root) only after every
+    version has been exhausted.
+    
+    Jobs arrive pre-compiled through the SharedJobBoard; a new job is detected
+    by comparing the board's sequence counter between batches.
+    
+    With use_native, each nonce range is handed to minr_native.scan_nonces
+    instead of the per-hash Python loop.
+    
+    Preemption: batches are sized per worker to take JOB_SLICE_SECONDS of wall
+    clock, and the job generation is checked between batches, so a worker
+    leaves a stale job within roughly one slice regardless of hashrate.
+    
+    Progress (hashes, batches, shares, job-switch latency) is stored into this
+    worker's own WorkerCounters slot after every batch, without any lock.
+    
+    Block candidates (hash below the network target from nbits) skip share_queue
+    and are written straight to block_channel, a pipe the main event loop
+    watches, so a found block is submitted without any queue hand-off delay.
+    
+    With trace_buffer (--trace-ring), job pickups, merkle roots, batches and
+    shares are appended to this worker's trace ring; without it each of those
+    points costs a single None check.
+    
+    With phase_counters (--trace-perf), the time spent in each loop phase is
+    accumulated in nanoseconds into this worker's phase slot. Per-hash work in
+    the Python loop is timed on every TRACE_SAMPLE_BATCHES-th batch only, by a
+    copy of the loop that reads the clock around the header hash and the
+    target compare; batch engines are timed per call.
+    """
     import os
-    log_path = "/Users/seneca/Desktop/minr.online/.cursor/debug.log"
-    try:
-        with open(log_path, "a") as f:
-            f.write(json.dumps({"sessionId":"debug-session","runId":"perf-debug","hypothesisId":"A","location":"mine_worker_process:start","message":"Worker started","data":{"worker_id":worker_id},"timestamp":int(time.time()*1000)}) + "\n")
-    except: pass
-    # #endregion
+    trace = trace_buffer.record if trace_buffer is not None else None
+    trace_ring = trace_buffer.ring(worker_id) if trace_buffer is not None else 0
+    if trace:
+        trace(trace_ring, TE_WORKER_START, os.getpid())
     
     # Wait for first job
     wait_start = time.time()
-    while shared_running.value and not shared_job:
+    while shared_running.value and not job_board.generation():
         time.sleep(0.1)
     wait_time = time.time() - wait_start
-    
-    # #region agent log
-    try:
-        with open(log_path, "a") as f:
-            f.write(json.dumps({"sessionId":"debug-session","runId":"perf-debug","hypothesisId":"B","location":"mine_worker_process:job_wait","message":"Waited for job","data":{"worker_id":worker_id,"wait_seconds":wait_time,"has_job":bool(shared_job)},"timestamp":int(time.time()*1000)}) + "\n")
-    except: pass
-    # #endregion
+    if trace:
+        trace(trace_ring, TE_JOB_WAIT, wait_time * 1000)
     
     if not shared_running.value:
         return
     
     # Cache methods locally for speed
-    pack_i = struct.pack
+    pack_into = struct.pack_into
     from_bytes = int.from_bytes
     
     # Get SHA256 backend (fastest available)
     backend_name, sha256_func = _select_sha256_backend()
+    sha256 = hashlib.sha256  # Header hashing runs from an OpenSSL midstate (see header_midstate)
+    range_scan = None  # Batch engine taking [nonce_start, nonce_end) ranges (native or NumPy)
+    if use_native and _check_native_module():
+        range_scan = _native_module.scan_nonces
+    elif USE_NUMPY and _check_numpy():
+        range_scan = numpy_scan_nonces
     if PROFILE_MODE and worker_id == 0:
-        print(f"[PROFILE Worker {worker_id}] Using SHA256 backend: {backend_name}")
+        if range_scan is numpy_scan_nonces:
+            print(f"[PROFILE Worker {worker_id}] Using SHA256 backend: numpy (batched SHA-256d, max batch={NATIVE_BATCH_SIZE})")
+        elif range_scan is not None:
+            print(f"[PROFILE Worker {worker_id}] Using SHA256 backend: native (minr_native.scan_nonces, max batch={NATIVE_BATCH_SIZE})")
+        else:
+            print(f"[PROFILE Worker {worker_id}] Using SHA256 backend: {backend_name} (header: hashlib midstate)")
     
     # Pre-compute constants
-    nonce_mask = 0xFFFFFFFF
-    nonce_start = worker_id * 0x1000000
-    nonce_end = (worker_id + 1) * 0x1000000
+    # Scan space, split per job by extranonce2_size: each worker owns a disjoint
+    # extranonce2 range, or a disjoint header nonce range when the pool's
+    # extranonce2 has fewer values than there are workers, so workers never
+    # scan the same header
+    num_workers = worker_counters.num_workers
+    nonce_space_start = 0
+    nonce_space_end = 0x100000000  # Full 32-bit header nonce space per extranonce2
+    extranonce2_start = 0
+    extranonce2_end = 1
     
     # Main mining loop - restart when new jobs arrive
     job_id = ""
+    job_seq = 0  # Board sequence of the job being mined
+    job_key = b""
     # Default target (max target for difficulty 1.0) - interpreted as big-endian integer
     target = 0x00000000FFFF0000000000000000000000000000000000000000000000000000
     
-    # Precomputed per-job data (avoids hex decoding in hot loop)
-    coinb1_bytes = b""
-    coinb2_bytes = b""
-    extranonce1_bytes = b""
-    merkle_root_precomputed = b""  # Precomputed merkle root bytes (little-endian, ready for header)
-    version_bytes = b""
-    prevhash_bytes = b""
-    nbits_bytes = b""
+    # Per-job data, compiled to header-ready bytes by the main process
+    merkle_branches_bytes = []
     extranonce2_size = 4
-    job_ntime = ""  # ntime from job (minimum time)
+    job_ntime = 0  # ntime from job (minimum time)
+    network_target = 0  # Block target from the job's nbits
+    
+    def send_block_candidate(found_nonce, hash_int):
+        # Single small write to the pipe (atomic below PIPE_BUF); never blocks on the share queue
+        candidate = (job_id, extranonce2_hex, ntime_hex, found_nonce, version_bits, hash_difficulty(hash_int),
+                     hash_int.to_bytes(32, "big").hex(), time.time(), worker_id)
+        try:
+            block_channel.send(candidate)
+        except Exception as e:
+            print(f"[Worker {worker_id}] Failed to send block candidate, queueing as share: {e}")
+            share_queue.put(candidate[:6] + (candidate[7],))
+        if trace:
+            trace(trace_ring, TE_BLOCK_CANDIDATE, found_nonce, candidate[5])
+    board_sequence = job_board.sequence
+    
+    # Scan position: current extranonce2, rolled version and next header nonce to try
+    extranonce2 = extranonce2_start
+    extranonce2_hex = ""
+    nonce = nonce_space_start
+    need_merkle_root = True
+    need_midstate = True
+    base_version = 0
+    version_mask = 0
+    version_roll = 0
+    version_rolls = 1  # Versions per extranonce2: 2^popcount(version_mask)
+    version_bits = None  # Rolled bits sent with shares (None = rolling not negotiated)
+    
+    # Header buffer reused for the whole scan (only merkle root, ntime and nonce change)
+    header_buf = bytearray(80)  # Bitcoin header is 80 bytes
+    header_tail = memoryview(header_buf)[64:]  # Bytes hashed per nonce after the midstate
+    midstate_copy = None
     
     # Local hash counter (64-bit unsigned)
     local_hash_count = 0
     loop_count = 0
     batch_count = 0
-    last_batch_time = time.time()
-    log_path = "/Users/seneca/Desktop/minr.online/.cursor/debug.log"
-            
+    merkle_count = 0
+    
+    # This worker's counter slot (single writer - plain stores, no lock)
+    counters = worker_counters.array
+    slot = worker_counters.slot(worker_id)
+    shares_found = 0
+    
+    # Phase profiler: nanoseconds per phase, published with the counters after every batch
+    perf_ns = time.perf_counter_ns
+    phase_ns = [0] * PHASE_SLOT_WORDS if phase_counters is not None else None
+    if phase_ns is not None:
+        phase_slot = phase_counters.slot(worker_id)
+        # Cost of one clock read (median), taken off every timed interval of the sampled loop
+        timer_ns = sorted(-perf_ns() + perf_ns() for _ in range(1001))[500]
+    
+    def queue_share(found_nonce, share_difficulty):
+        # Hand a share to the main process; a full queue drops it
+        if trace:
+            trace(trace_ring, TE_SHARE, found_nonce, share_difficulty)
+        enqueue_start = perf_ns() if phase_ns is not None else 0
+        try:
+            share_queue.put((job_id, extranonce2_hex, ntime_hex, found_nonce, version_bits, share_difficulty,
+                             time.time()), block=False)
+            if debug_mode:
+                print(f"[DEBUG Worker {worker_id}] Share queued: extranonce2={extranonce2_hex}, ntime={ntime_hex}, nonce={found_nonce}")
+        except Exception as e:
+            if debug_mode:
+                print(f"[DEBUG Worker {worker_id}] Failed to queue share: {e}")
+        if phase_ns is not None:
+            phase_ns[PH_ENQUEUE] += perf_ns() - enqueue_start
+    
+    # Adaptive batch size: starts small, then tracks hashrate * JOB_SLICE_SECONDS
+    max_batch_size = NATIVE_BATCH_SIZE if range_scan is not None else 1 << 20
+    # NumPy has a fixed per-call cost of a few ms, so its batches can't shrink as far
+    min_batch_size = NUMPY_MIN_LANES if range_scan is numpy_scan_nonces else MIN_BATCH_SIZE
+    batch_size = min_batch_size * 4
+    
     while shared_running.value:
         # Get current job from shared memory (may change during mining)
-        if not shared_job:
-            # #region agent log
-            try:
-                with open(log_path, "a") as f:
-                    f.write(json.dumps({"sessionId":"debug-session","runId":"perf-debug","hypothesisId":"C","location":"mine_worker_process:no_job","message":"Worker waiting - no job","data":{"worker_id":worker_id},"timestamp":int(time.time()*1000)}) + "\n")
-            except: pass
-            # #endregion
+        if not job_board.generation():
             time.sleep(0.01)  # Brief wait for job
             continue
         
-        # Update job info if it changed
-        current_job_id = shared_job.get("job_id", "")
-        if current_job_id != job_id:
-            job_id = current_job_id
-            target = shared_job.get("target", 0x00000000FFFF0000000000000000000000000000000000000000000000000000)
-            if isinstance(target, str):
-                target = int(target, 16)
-            
-            # Precompute all job data (hex -> bytes conversion done once per job)
-            coinb1_hex = shared_job.get("coinb1", "")
-            coinb2_hex = shared_job.get("coinb2", "")
-            extranonce1_hex = shared_job.get("extranonce1", "")
-            merkle_branches = shared_job.get("merkle_branches", [])
-            version_str = shared_job.get("version", "20000000")
-            nbits_hex = shared_job.get("nbits", "")
-            prevhash_hex = shared_job.get("prevhash", "")
-            extranonce2_size = shared_job.get("extranonce2_size", 4)
-            job_ntime = shared_job.get("ntime", "")
+        # Update job info if it changed (single integer read of the seqlock counter)
+        if board_sequence() != job_seq:
+            if phase_ns is not None:
+                job_start = perf_ns()
+            job_seq, job = job_board.read()
+            picked_up_at = time.time()
+            target = job["target"]
+            target_be_bytes = int_to_target_bytes(target)  # Target format for minr_native.scan_nonces
+            if job["job_key"] == job_key:
+                # Target-only update (mining.set_difficulty): keep the scan position
+                if debug_mode:
+                    print(f"[DEBUG Worker {worker_id}] Target update: {hex(target)}")
+                if trace:
+                    trace(trace_ring, TE_TARGET_UPDATE, job_seq, hash_difficulty(target))
+                if phase_ns is not None:
+                    phase_ns[PH_JOB] += perf_ns() - job_start
+                continue
+            if job_key:
+                # Job-switch latency: notify compiled and published -> this worker mining it
+                counters[slot + WC_SWITCH_US] = max(0, int((picked_up_at - job["published_at"]) * 1e6))
+            if trace:
+                trace(trace_ring, TE_JOB_SWITCH, job_seq, (picked_up_at - job["published_at"]) * 1000)
+            job_key = job["job_key"]
+            job_id = job["job_id"]
+            extranonce2_size = job["extranonce2_size"]
+            job_ntime = job["ntime"]
+            network_target = nbits_to_target(from_bytes(job["nbits"], "little"))
+            merkle_branches_bytes = job["merkle_branches"]
             
-            # Convert hex strings to bytes once per job
-            coinb1_bytes = bytes.fromhex(coinb1_hex)
-            coinb2_bytes = bytes.fromhex(coinb2_hex)
-            extranonce1_bytes = bytes.fromhex(extranonce1_hex)
-            
-            # Precompute merkle root for extranonce2=0 (we'll update it per nonce, but structure is same)
-            # For now, compute with placeholder extranonce2 (will be updated in loop)
-            # Actually, merkle root depends on extranonce2, so we can't fully precompute it
-            # But we can precompute the merkle branches processing
-            
-            # Convert version, prevhash, nbits to bytes (little-endian for header)
-            if isinstance(version_str, str):
-                version_int = int(version_str, 16) if version_str.startswith(('0x', '0X')) or all(c in '0123456789abcdefABCDEF' for c in version_str) else int(version_str)
+            # Coinbase template (coinb1 + extranonce1 + [extranonce2] + coinb2)
+            coinbase_prefix = job["coinbase_prefix"]
+            coinb2_bytes = job["coinb2"]
+            coinbase_buf = bytearray(len(coinbase_prefix) + extranonce2_size + len(coinb2_bytes))
+            coinbase_buf[:len(coinbase_prefix)] = coinbase_prefix
+            coinbase_buf[len(coinbase_prefix)+extranonce2_size:] = coinb2_bytes
+            extranonce2_offset = len(coinbase_prefix)
+            extranonce2_values = 1 << (8 * extranonce2_size)
+            if extranonce2_values >= num_workers:
+                extranonce2_stride = extranonce2_values // num_workers
+                extranonce2_start = worker_id * extranonce2_stride
+                extranonce2_end = extranonce2_start + extranonce2_stride
+                nonce_space_start, nonce_space_end = 0, 0x100000000
             else:
-                version_int = version_str
-            version_bytes = pack_i("<I", version_int)
-            prevhash_bytes = bytes.fromhex(prevhash_hex)[::-1]  # Reverse for little-endian
-            nbits_bytes = bytes.fromhex(nbits_hex)[::-1]
+                # Workers share every extranonce2 value and split the header nonces instead
+                extranonce2_start, extranonce2_end = 0, extranonce2_values
+                nonce_stride = 0x100000000 // num_workers
+                nonce_space_start = worker_id * nonce_stride
+                nonce_space_end = nonce_space_start + nonce_stride
             
-            # Precompute merkle branches as bytes (avoid hex decode in loop)
-            merkle_branches_bytes = [bytes.fromhex(branch) for branch in merkle_branches]
+            # Static header fields (prevhash + nbits) - only once per job; version is set per roll
+            base_version = from_bytes(job["version"], "little")
+            version_mask = job["version_mask"]
+            version_rolls = 1 << bin(version_mask).count("1")
+            header_buf[4:36] = job["prevhash"]
+            header_buf[72:76] = job["nbits"]
             
-            # Reset nonce range for new job
-            nonce = nonce_start
+            # Restart the scan at the beginning of this worker's extranonce2 range
+            extranonce2 = extranonce2_start
+            nonce = nonce_space_start
+            version_roll = 0
+            need_merkle_root = True
             
             if debug_mode:
                 # Print full target value (not truncated) to verify calculation
@@ -409,153 +1267,209 @@ def mine_worker_process(worker_id: int, shared_total_hashes, shared_running, sha
             
             # Debug: log first few hash checks ONCE per job (not in hot loop)
             debug_hash_count = 0
+            if phase_ns is not None:
+                phase_ns[PH_JOB] += perf_ns() - job_start
         
         try:
-            # Process batches for maximum throughput
-            batch_size = 100000
-            # Use job's ntime as minimum, but can use current time if later
-            if job_ntime:
-                try:
-                    job_ntime_int = int(job_ntime, 16) if isinstance(job_ntime, str) else int(job_ntime)
-                    current_time = max(job_ntime_int, int(time.time()))
-                except:
-                    current_time = int(time.time())
-            else:
-                current_time = int(time.time())
-            ntime_bytes = pack_i("<I", current_time)
-            
-            # Pre-allocate bytearray for header (reuse across iterations)
-            header_buf = bytearray(80)  # Bitcoin header is 80 bytes
+            # New extranonce2 value: rebuild coinbase and merkle root once, then
+            # amortize that work over the whole 2^32 header nonce space
+            if need_merkle_root:
+                if phase_ns is not None:
+                    phase_start = perf_ns()
+                coinbase_buf[extranonce2_offset:extranonce2_offset+extranonce2_size] = extranonce2.to_bytes(extranonce2_size, "little")
+                extranonce2_hex = coinbase_buf[extranonce2_offset:extranonce2_offset+extranonce2_size].hex()
+                coinbase_hash = sha256_func(sha256_func(bytes(coinbase_buf)))
+                if phase_ns is not None:
+                    merkle_start = perf_ns()
+                    phase_ns[PH_COINBASE] += merkle_start - phase_start
+                merkle_root = fold_merkle_branches(coinbase_hash, merkle_branches_bytes, sha256_func)
+                if phase_ns is not None:
+                    phase_ns[PH_MERKLE] += perf_ns() - merkle_start
+                header_buf[36:68] = merkle_root  # Raw double-SHA256 bytes (internal byte order)
+                merkle_count += 1
+                need_merkle_root = False
+                if trace:
+                    trace(trace_ring, TE_MERKLE_ROOT, extranonce2)
+                need_midstate = True
             
-            # Build static header parts (version + prevhash + nbits) - only once per batch
-            header_buf[0:4] = version_bytes
-            header_buf[4:36] = prevhash_bytes
-            header_buf[68:72] = nbits_bytes
-            header_buf[72:76] = ntime_bytes
-            
-            # Precompute coinbase template (coinb1 + extranonce1 + coinb2)
-            # We'll insert extranonce2 in the middle
-            coinbase_template_start = coinb1_bytes + extranonce1_bytes
-            coinbase_template_end = coinb2_bytes
-            coinbase_template_len = len(coinbase_template_start) + extranonce2_size + len(coinbase_template_end)
+            # New version roll (or merkle root): only the first-block midstate changes
+            if need_midstate:
+                if phase_ns is not None:
+                    phase_start = perf_ns()
+                if version_mask:
+                    version_bits = deposit_version_bits(version_roll, version_mask)
+                    pack_into("<I", header_buf, 0, (base_version & ~version_mask) | version_bits)
+                else:
+                    version_bits = None
+                    pack_into("<I", header_buf, 0, base_version)
+                # Bytes 0-63 are now fixed for the whole nonce scan: absorb them once
+                midstate_copy = header_midstate(header_buf).copy
+                need_midstate = False
+                if phase_ns is not None:
+                    phase_ns[PH_MIDSTATE] += perf_ns() - phase_start
             
-            # Preallocate coinbase buffer (reuse across iterations)
-            coinbase_buf = bytearray(coinbase_template_len)
-            coinbase_buf[:len(coinbase_template_start)] = coinbase_template_start
-            coinbase_buf[len(coinbase_template_start)+extranonce2_size:] = coinbase_template_end
+            # Use job's ntime as minimum, but can use current time if later
+            current_time = max(job_ntime, int(time.time()))
+            pack_into("<I", header_buf, 68, current_time)
+            ntime_hex = f"{current_time:08x}"  # Stratum sends ntime as big-endian hex
             
-            # Ultra-optimized inner loop (no GIL blocking, minimal allocations!)
-            batch_start_time = time.time()
-            for _ in range(batch_size):
-                # Build extranonce2 (little-endian, size from pool - can be 4 or 8 bytes)
-                if extranonce2_size == 8:
-                    # Use 64-bit packing for 8-byte extranonce2
-                    struct.pack_into("<Q", coinbase_buf, len(coinbase_template_start), nonce & 0xFFFFFFFFFFFFFFFF)
+            if range_scan is not None:
+                # Native / NumPy path: hand the next [nonce_start, nonce_end) range to the batch engine
+                scan_start = nonce
+                scan_end = min(nonce + batch_size, nonce_space_end)
+                batch_start_time = time.time()
+                if phase_ns is not None:
+                    scan_ns_start = perf_ns()
+                result = range_scan(header_buf, scan_start, scan_end, target_be_bytes)
+                if phase_ns is not None:
+                    # The engine hashes and compares in one call: both count as header time
+                    scan_ns_end = perf_ns()
+                    phase_ns[PH_HEADER] += scan_ns_end - scan_ns_start
+                    enqueue_before = phase_ns[PH_ENQUEUE]
+                if isinstance(result, tuple):
+                    # Returns (hashes_done, found_count, found_nonces, found_hashes)
+                    hashes_done = result[0]
+                    found_nonces = result[2] if len(result) > 2 else ()
+                    found_hashes = result[3] if len(result) > 3 else ()
                 else:
-                    # Use 32-bit packing for 4-byte extranonce2 (default)
-                    struct.pack_into("<I", coinbase_buf, len(coinbase_template_start), nonce & nonce_mask)
-                
-                # Compute coinbase hash (double SHA256) - using optimized backend
-                coinbase_hash = sha256d(bytes(coinbase_buf))
-                
-                # Compute merkle root from coinbase_hash + merkle_branches
-                # Each branch is combined with current hash: dSHA256(left || right)
-                merkle_root = coinbase_hash
-                for branch_bytes in merkle_branches_bytes:
-                    merkle_root = sha256d(merkle_root + branch_bytes)
-                
-                # Build complete header - only mutate merkle root and nonce
-                merkle_root_bytes = merkle_root[::-1]  # Reverse for little-endian
-                header_buf[36:68] = merkle_root_bytes
-                header_buf[76:80] = pack_i("<I", nonce)
-                
-                # Double SHA-256 of header - using optimized backend
-                hash2 = sha256d(bytes(header_buf))
+                    hashes_done = result
+                    found_nonces = ()
+                    found_hashes = ()
                 
-                # Convert hash to integer for comparison with target
-                # Bitcoin compares hashes as BIG-ENDIAN integers
-                hash_int = from_bytes(hash2, byteorder="big")
-                
-                # Debug: log first few hash checks ONCE per job (outside hot loop, only first iteration)
-                if debug_mode and debug_hash_count < 10 and loop_count < 10:
-                    import sys
-                    ratio = hash_int / target if target > 0 else 0
-                    hash_order = len(str(hash_int))
-                    target_order = len(str(target))
-                    debug_msg = f"[DEBUG Worker {worker_id}] Hash check #{loop_count}:\n"
-                    debug_msg += f"  Raw hash bytes (hex): {hash2.hex()}\n"
-                    debug_msg += f"  Hash as int (big-endian): {hash_int}\n"
-                    debug_msg += f"  Target as int (big-endian): {target}\n"
-                    debug_msg += f"  Hash < target: {hash_int < target}\n"
-                    debug_msg += f"  Hash/target ratio: {ratio:.2e} (hash is {ratio*100:.1f}% of target)\n"
-                    debug_msg += f"  Hash order of magnitude: 10^{hash_order-1}, Target: 10^{target_order-1}\n"
-                    sys.stdout.write(debug_msg)
-                    sys.stdout.flush()
-                    debug_hash_count += 1
-                
-                if hash_int < target:
-                    # Found a share! Submit via queue (main process will handle it)
+                for share_index, found_nonce in enumerate(found_nonces):
+                    shares_found += 1
                     if debug_mode:
-                        print(f"[DEBUG Worker {worker_id}] ✓ SHARE FOUND! job_id={job_id}, hash={hash2.hex()[:16]}..., target={hex(target)[:20]}...")
-                    try:
-                        # Convert extranonce2 to hex (must match extranonce2_size)
-                        if extranonce2_size == 8:
-                            extranonce2_bytes = struct.pack("<Q", nonce & 0xFFFFFFFFFFFFFFFF)
-                        else:
-                            extranonce2_bytes = pack_i("<I", nonce & nonce_mask)
-                        extranonce2_hex = extranonce2_bytes.hex()
-                        share_queue.put((job_id, extranonce2_hex, ntime_bytes.hex(), nonce), block=False)
-                        if debug_mode:
-                            print(f"[DEBUG Worker {worker_id}] Share queued: extranonce2={extranonce2_hex}, ntime={ntime_bytes.hex()}, nonce={nonce}")
-                    except Exception as e:
+                        print(f"[DEBUG Worker {worker_id}] ✓ SHARE FOUND (batch engine)! job_id={job_id}, nonce={found_nonce}")
+                    # Without the hash, the share is only known to meet the job target
+                    if share_index < len(found_hashes):
+                        found_hash_int = from_bytes(found_hashes[share_index], byteorder="little")
+                        if found_hash_int < network_target and block_channel is not None:
+                            send_block_candidate(found_nonce, found_hash_int)
+                            continue
+                        share_difficulty = hash_difficulty(found_hash_int)
+                    else:
+                        share_difficulty = hash_difficulty(target)
+                    queue_share(found_nonce, share_difficulty)
+                if phase_ns is not None:
+                    phase_ns[PH_COMPARE] += perf_ns() - scan_ns_end - (phase_ns[PH_ENQUEUE] - enqueue_before)
+                    phase_ns[PH_SAMPLED_HASHES] += hashes_done
+            elif phase_ns is not None and batch_count % TRACE_SAMPLE_BATCHES == 0:
+                # Sampled batch (--trace-perf): the hot loop with the clock read around header hash and compare
+                scan_start = nonce
+                scan_end = min(nonce + batch_size, nonce_space_end)
+                batch_start_time = time.time()
+                header_ns = 0
+                compare_ns = 0
+                hits = []
+                for nonce in range(scan_start, scan_end):
+                    t0 = perf_ns()
+                    pack_into("<I", header_buf, 76, nonce)
+                    h = midstate_copy()
+                    h.update(header_tail)
+                    hash2 = sha256(h.digest()).digest()
+                    t1 = perf_ns()
+                    if from_bytes(hash2, byteorder="little") < target:
+                        hits.append((nonce, hash2))
+                    t2 = perf_ns()
+                    header_ns += t1 - t0
+                    compare_ns += t2 - t1
+                hashes_done = scan_end - scan_start
+                phase_ns[PH_HEADER] += max(0, header_ns - timer_ns * hashes_done)
+                phase_ns[PH_COMPARE] += max(0, compare_ns - timer_ns * hashes_done)
+                phase_ns[PH_SAMPLED_HASHES] += hashes_done
+                for found_nonce, hash2 in hits:
+                    shares_found += 1
+                    hash_int = from_bytes(hash2, byteorder="little")
+                    if hash_int < network_target and block_channel is not None:
+                        send_block_candidate(found_nonce, hash_int)
+                        continue
+                    queue_share(found_nonce, hash_difficulty(hash_int))
+            else:
+                # Ultra-optimized inner loop: only the header nonce changes per hash
+                scan_start = nonce
+                scan_end = min(nonce + batch_size, nonce_space_end)
+                batch_start_time = time.time()
+                for nonce in range(scan_start, scan_end):
+                    pack_into("<I", header_buf, 76, nonce)
+                    
+                    # Double SHA-256 of header from the cached midstate (no header copy)
+                    h = midstate_copy()
+                    h.update(header_tail)
+                    hash2 = sha256(h.digest()).digest()
+                    
+                    # Convert hash to integer for comparison with target
+                    # Bitcoin compares hashes as LITTLE-ENDIAN integers
+                    hash_int = from_bytes(hash2, byteorder="little")
+                    
+                    # Debug: log first few hash checks ONCE per job (outside hot loop, only first iteration)
+                    if debug_mode and debug_hash_count < 10 and loop_count < 10:
+                        ratio = hash_int / target if target > 0 else 0
+                        hash_order = len(str(hash_int))
+                        target_order = len(str(target))
+                        debug_msg = f"[DEBUG Worker {worker_id}] Hash check #{loop_count}:\n"
+                        debug_msg += f"  Raw hash bytes (hex): {hash2.hex()}\n"
+                        debug_msg += f"  Hash as int (little-endian): {hash_int}\n"
+                        debug_msg += f"  Target as int (big-endian): {target}\n"
+                        debug_msg += f"  Hash < target: {hash_int < target}\n"
+                        debug_msg += f"  Hash/target ratio: {ratio:.2e} (hash is {ratio*100:.1f}% of target)\n"
+                        debug_msg += f"  Hash order of magnitude: 10^{hash_order-1}, Target: 10^{target_order-1}\n"
+                        sys.stdout.write(debug_msg)
+                        sys.stdout.flush()
+                        debug_hash_count += 1
+                        loop_count += 1
+                    
+                    if hash_int < target:
+                        # Found a share! Submit via queue (main process will handle it)
+                        shares_found += 1
                         if debug_mode:
-                            print(f"[DEBUG Worker {worker_id}] Failed to queue share: {e}")
-                        pass  # Queue full, skip this share
-                
-                # Increment local counter (64-bit unsigned)
-                local_hash_count += 1
-                loop_count += 1
-                nonce += 1
+                            print(f"[DEBUG Worker {worker_id}] ✓ SHARE FOUND! job_id={job_id}, hash={hash2.hex()[:16]}..., target={hex(target)[:20]}...")
+                        if hash_int < network_target and block_channel is not None:
+                            send_block_candidate(nonce, hash_int)
+                            continue
+                        queue_share(nonce, hash_difficulty(hash_int))
                 
-                # Wrap nonce if needed
-                if nonce >= nonce_end:
-                    nonce = nonce_start
+                hashes_done = scan_end - scan_start
             
+            if phase_ns is not None:
+                counters_start = perf_ns()
             batch_time = time.time() - batch_start_time
+            local_hash_count += hashes_done
             
-            # Update shared memory less frequently (every batch) - use 64-bit unsigned
-            lock_start = time.time()
-            with shared_total_hashes.get_lock():
-                lock_wait = time.time() - lock_start
-                # Ensure we don't overflow by checking current value
-                current = shared_total_hashes.value
-                if current + batch_size < 2**63:  # Stay within signed 64-bit range for multiprocessing
-                    shared_total_hashes.value += batch_size
-                else:
-                    # Wrap around safely (shouldn't happen in practice, but handle it)
-                    shared_total_hashes.value = (current + batch_size) % (2**63 - 1)
+            # Resize the next batch to fill one job slice at the measured rate (smoothed)
+            if batch_time > 0 and hashes_done:
+                slice_size = int(hashes_done / batch_time * JOB_SLICE_SECONDS)
+                batch_size = min(max_batch_size, max(min_batch_size, (batch_size + slice_size) // 2))
+            
+            # Advance scan position: nonce, then version roll, then extranonce2 (merkle root)
+            nonce = scan_end
+            if nonce >= nonce_space_end:
+                nonce = nonce_space_start
+                version_roll += 1
+                need_midstate = True
+                if version_roll >= version_rolls:
+                    version_roll = 0
+                    extranonce2 += 1
+                    if extranonce2 >= extranonce2_end:
+                        extranonce2 = extranonce2_start
+                    need_merkle_root = True
             
             batch_count += 1
-            last_batch_time = time.time()
+            
+            # Publish progress to this worker's slot (absolute values, no lock)
+            counters[slot + WC_HASHES] = local_hash_count
+            counters[slot + WC_BATCHES] = batch_count
+            counters[slot + WC_SHARES] = shares_found
+            counters[slot + WC_BATCH_SIZE] = batch_size
+            if phase_ns is not None:
+                phase_ns[PH_COUNTERS] += perf_ns() - counters_start
+                phase_counters.array[phase_slot:phase_slot + PHASE_SLOT_WORDS] = phase_ns
+            if trace:
+                trace(trace_ring, TE_BATCH, hashes_done, batch_time * 1000)
             
             # Profile mode: log batch performance
             if PROFILE_MODE and (batch_count <= 5 or batch_count % 100 == 0):
-                batch_hps = batch_size / batch_time if batch_time > 0 else 0
-                print(f"[PROFILE Worker {worker_id}] Batch {batch_count}: {batch_hps:.0f} H/s, time={batch_time:.3f}s")
-            
-            # #region agent log
-            if batch_count <= 5 or batch_count % 100 == 0:  # Log first 5 batches, then every 100th
-                try:
-                    batch_hps = batch_size / batch_time if batch_time > 0 else 0
-                    with open(log_path, "a") as f:
-                        f.write(json.dumps({"sessionId":"debug-session","runId":"perf-debug","hypothesisId":"D","location":"mine_worker_process:batch_complete","message":"Batch completed","data":{"worker_id":worker_id,"batch_num":batch_count,"batch_size":batch_size,"batch_time_sec":batch_time,"hashes_per_sec":batch_hps,"lock_wait_sec":lock_wait,"local_hash_count":local_hash_count},"timestamp":int(time.time()*1000)}) + "\n")
-                except: pass
-            # #endregion
-            
-            # Update time occasionally (every 10 batches = ~1M hashes)
-            if loop_count % (batch_size * 10) == 0:
-                current_time = int(time.time())
-                ntime_bytes = pack_i("<I", current_time)
+                batch_hps = hashes_done / batch_time if batch_time > 0 else 0
+                print(f"[PROFILE Worker {worker_id}] Batch {batch_count}: {batch_hps:.0f} H/s, time={batch_time:.3f}s, next batch={batch_size}, merkle roots={merkle_count}")
         except Exception as e:
             print(f"Worker {worker_id} error: {e}")
             import traceback
@@ -564,147 +1478,1053 @@ def mine_worker_process(worker_id: int, shared_total_hashes, shared_running, sha
             continue
 
 
+def parse_pool(spec: str) -> Tuple[str, int]:
+    """Parse a "host:port" pool address (stratum+tcp:// prefix allowed)."""
+    address = spec.split("://", 1)[-1].rstrip("/")
+    host, sep, port = address.rpartition(":")
+    if not sep or not host or not port.isdigit():
+        raise ValueError(f"Invalid pool address '{spec}' (expected host:port)")
+    return host, int(port)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram in milliseconds (cumulative since start).
+    
+    Bucket i counts samples <= BOUNDS_MS[i]; the last bucket counts everything
+    slower than the largest bound. Percentiles are reported as the upper bound
+    of the bucket they fall in.
+    """
+    BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+    
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+    
+    def record(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(self.BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+    
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of samples (inf past the last bound)."""
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.BOUNDS_MS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+    
+    def summary(self) -> str:
+        """p50/p99 for the stats line ("-" before the first sample)."""
+        if not self.count:
+            return "-"
+        return f"{self.percentile(0.5):g}/{self.percentile(0.99):g}"
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {"boundsMs": list(self.BOUNDS_MS), "counts": list(self.counts), "count": self.count, "sumMs": self.sum_ms}
+
+
+class StatsReporter:
+    """Posts stats samples to /api/miner-stats from a background thread.
+    
+    submit() only appends to an in-memory list, so a slow or unreachable API
+    never stalls the caller. The thread keeps one HTTP keep-alive connection
+    and sends everything pending as a single request: the endpoint stores
+    cumulative totals, so the body is the newest sample plus "intervals", the
+    per-interval deltas of every sample in the batch. Samples that cannot be
+    sent go to a bounded JSON-lines spool on disk and are sent first once the
+    API answers again, including samples left over from an earlier run.
+    """
+    # Cumulative sample fields and their names in the delta-encoded intervals
+    DELTA_FIELDS = (("totalHashes", "hashes"), ("acceptedShares", "accepted"),
+                    ("rejectedShares", "rejected"), ("staleShares", "stale"))
+    
+    def __init__(self, api_url: str, auth_token: str = "", spool_path: Optional[str] = None):
+        import os
+        from urllib.parse import urlsplit
+        url = urlsplit(api_url)
+        self.https = url.scheme == "https"
+        self.host = url.hostname
+        self.port = url.port
+        self.path = url.path.rstrip("/") + "/api/miner-stats"
+        self.headers = {"Content-Type": "application/json"}
+        if auth_token:
+            self.headers["Authorization"] = f"Bearer {auth_token}"
+        self.spool_path = spool_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), "minr-stats-spool.jsonl")
+        self.run_id = f"{int(time.time())}-{os.getpid()}"
+        self.connection = None
+        self.last_sent: Dict[str, Dict[str, Any]] = {}  # runId -> newest sample the API accepted
+        self.failures = 0
+        self.retry_at = 0.0
+        self.spooled = 0  # Samples in the spool file
+        self.dropped = 0  # Samples discarded (spool full or refused by the API)
+        self.last_status = None
+        self.pending = []
+        self.closing = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name="stats-reporter", daemon=True)
+        self.thread.start()
+    
+    def submit(self, sample: Dict[str, Any]) -> None:
+        """Queue a sample for sending (never blocks on the network)."""
+        with self.cond:
+            self.pending.append(dict(sample, runId=self.run_id, sampledAt=time.time()))
+            self.cond.notify()
+    
+    def close(self, timeout: float = STATS_REPORT_TIMEOUT + 1) -> None:
+        """Send (or spool) what is pending and stop the thread."""
+        with self.cond:
+            self.closing = True
+            self.cond.notify()
+        self.thread.join(timeout)
+    
+    def run(self) -> None:
+        while True:
+            with self.cond:
+                while not self.pending and not self.closing:
+                    self.cond.wait()
+                batch, self.pending = self.pending, []
+                closing = self.closing
+            if batch:
+                try:
+                    self.flush(batch)
+                except Exception as e:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ Stats reporter error: {type(e).__name__}: {str(e)[:100]}")
+            if closing:
+                if self.connection is not None:
+                    self.connection.close()
+                return
+    
+    def flush(self, batch: list) -> None:
+        """Send spooled + new samples, one request per run; spool whatever is left."""
+        samples = self.read_spool() + batch
+        if time.time() < self.retry_at:
+            self.write_spool(samples)  # Backing off: don't touch the network yet
+            return
+        runs: Dict[str, list] = {}
+        for sample in samples:
+            runs.setdefault(sample.get("runId", ""), []).append(sample)
+        unsent = []
+        handled = set()  # Runs sent or refused
+        try:
+            for run_id, run_samples in runs.items():
+                if unsent:
+                    unsent += run_samples
+                    continue
+                status = self.post(self.batch_body(run_id, run_samples))
+                if status is None:
+                    unsent = run_samples
+                elif status >= 400:
+                    # Refused (bad request, unknown worker): resending won't help
+                    self.dropped += len(run_samples)
+                    if status != self.last_status:
+                        print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ Stats reporting error: HTTP {status}")
+                else:
+                    self.last_sent[run_id] = run_samples[-1]
+                if status is not None:
+                    handled.add(run_id)
+                self.last_status = status
+        except Exception:
+            # Unexpected error: keep every sample not yet handled, run() reports it
+            self.write_spool([sample for sample in samples if sample.get("runId", "") not in handled])
+            raise
+        
+        if unsent:
+            self.failures += 1
+            delay = min(300.0, 10.0 * 2 ** (self.failures - 1))
+            self.retry_at = time.time() + delay
+            if self.failures == 1:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ Stats API unreachable, spooling samples to {self.spool_path}")
+        elif self.failures:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Stats API reachable again ({len(samples)} samples sent)")
+            self.failures = 0
+        self.write_spool(unsent)
+    
+    def batch_body(self, run_id: str, run_samples: list) -> Dict[str, Any]:
+        """Newest sample (absolute totals) plus the delta-encoded intervals leading up to it."""
+        previous = self.last_sent.get(run_id)
+        intervals = []
+        for sample in run_samples:
+            interval = {"t": sample["sampledAt"], "hashesPerSecond": sample.get("hashesPerSecond", 0),
+                        "dt": sample["sampledAt"] - previous["sampledAt"] if previous else None}
+            for field, name in self.DELTA_FIELDS:
+                interval[name] = sample.get(field, 0) - (previous.get(field, 0) if previous else 0)
+            intervals.append(interval)
+            previous = sample
+        return dict(run_samples[-1], intervals=intervals)
+    
+    def post(self, body: Dict[str, Any]) -> Optional[int]:
+        """POST on the kept-alive connection; returns the HTTP status, or None to retry later."""
+        import http.client
+        data = json.dumps(body).encode("utf-8")
+        for attempt in range(2):  # The server may have closed an idle keep-alive connection: reconnect once
+            try:
+                if self.connection is None:
+                    connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+                    self.connection = connection_class(self.host, self.port, timeout=STATS_REPORT_TIMEOUT)
+                self.connection.request("POST", self.path, body=data, headers=self.headers)
+                response = self.connection.getresponse()
+                response.read()  # Drain it so the connection can be reused
+                if response.will_close:
+                    self.connection.close()
+                    self.connection = None
+                return None if response.status >= 500 else response.status
+            except (OSError, http.client.HTTPException):
+                if self.connection is not None:
+                    self.connection.close()
+                self.connection = None
+        return None
+    
+    def read_spool(self) -> list:
+        try:
+            with open(self.spool_path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        samples = []
+        for line in lines:
+            try:
+                samples.append(json.loads(line))
+            except ValueError:
+                pass  # Torn write from a crash
+        return samples
+    
+    def write_spool(self, samples: list) -> None:
+        """Replace the spool with these samples, dropping the oldest beyond STATS_SPOOL_MAX_BYTES."""
+        import os
+        lines = [json.dumps(sample) + "\n" for sample in samples]
+        size = sum(len(line) for line in lines)
+        while lines and size > STATS_SPOOL_MAX_BYTES:
+            size -= len(lines.pop(0))
+            self.dropped += 1
+        if not lines:
+            if os.path.exists(self.spool_path):
+                os.remove(self.spool_path)
+            self.spooled = 0
+            return
+        temp_path = self.spool_path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.writelines(lines)
+        os.replace(temp_path, self.spool_path)
+        self.spooled = len(lines)
+
+
+class PoolManager:
+    """Ordered pool list with measured latency and per-pool reconnect backoff.
+    
+    The first pool is the primary and is always preferred; failover pools are
+    tried in order of measured connect + subscribe RTT (unmeasured pools keep
+    their configured order). A pool that fails is not retried until an
+    exponentially growing, jittered delay has passed.
+    """
+    
+    def __init__(self, pools: list):
+        self.pools = list(dict.fromkeys(pools))  # Keep order, drop duplicates
+        self.rtt_ms: Dict[Tuple[str, int], Optional[float]] = {pool: None for pool in self.pools}
+        self.failures: Dict[Tuple[str, int], int] = {pool: 0 for pool in self.pools}
+        self.retry_at: Dict[Tuple[str, int], float] = {pool: 0.0 for pool in self.pools}
+    
+    @property
+    def primary(self) -> Tuple[str, int]:
+        return self.pools[0]
+    
+    def candidates(self) -> list:
+        """Pools that may be tried now, best first."""
+        now = time.time()
+        failovers = sorted(self.pools[1:], key=lambda pool: (self.rtt_ms[pool] is None, self.rtt_ms[pool] or 0.0))
+        return [pool for pool in [self.primary] + failovers if self.retry_at[pool] <= now]
+    
+    def next_retry_in(self) -> float:
+        """Seconds until the earliest pool comes out of backoff."""
+        return max(0.0, min(self.retry_at.values()) - time.time())
+    
+    def record_rtt(self, pool: Tuple[str, int], rtt_ms: float) -> None:
+        previous = self.rtt_ms[pool]
+        self.rtt_ms[pool] = rtt_ms if previous is None else previous * 0.7 + rtt_ms * 0.3
+    
+    def record_failure(self, pool: Tuple[str, int]) -> float:
+        """Back the pool off; returns the delay before it is retried."""
+        self.failures[pool] += 1
+        delay = min(POOL_BACKOFF_MAX, POOL_BACKOFF_BASE * 2 ** (self.failures[pool] - 1))
+        delay *= random.uniform(0.5, 1.0)  # Jitter so many miners don't reconnect in lockstep
+        self.retry_at[pool] = time.time() + delay
+        return delay
+    
+    def record_success(self, pool: Tuple[str, int]) -> None:
+        self.failures[pool] = 0
+        self.retry_at[pool] = 0.0
+
+
+class MockPool:
+    """Local Stratum V1 stand-in for offline end-to-end runs (--mock-pool).
+    
+    Serves 127.0.0.1 on an ephemeral port from its own thread and event loop,
+    so its work never delays the miner's loop. After authorize it sets
+    MOCK_DIFFICULTY and sends a clean_jobs notify every MOCK_JOB_INTERVAL
+    seconds, each with MOCK_BRANCHES merkle branches, MOCK_EXTRANONCE2_SIZE
+    bytes of extranonce2 and version rolling granted. Every submitted share is rebuilt and hashed here with hashlib,
+    independently of the miner's header code, and answered like a pool would:
+    stale (superseded job), duplicate, or low difficulty.
+    
+    With the miner attached, the publish -> worker pickup time of each job is
+    sampled before the next notify, giving notify -> first hash latency.
+    """
+    
+    VERSION_MASK = 0x1FFFE000
+    # Coinbase transaction split around extranonce1 + extranonce2. coinb1: version 1, one input
+    # (null prevout), then the scriptSig length byte (added per pool: it covers the extranonces)
+    # and the scriptSig's BIP34 height push (block 100000). coinb2: input sequence, one 50 BTC
+    # P2PKH output to a zero key hash, locktime 0.
+    COINB1_PREFIX = "01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff"
+    COINBASE_HEIGHT_PUSH = "03a08601"
+    COINB2 = "ffffffff0100f2052a010000001976a914000000000000000000000000000000000000000088ac00000000"
+    
+    def __init__(self, difficulty: float, job_interval: float, branches: int, extranonce2_size: int = 4):
+        import os
+        self.difficulty = difficulty
+        self.job_interval = job_interval
+        self.branches = branches
+        self.extranonce2_size = extranonce2_size
+        self.target = int(0x00000000FFFF0000000000000000000000000000000000000000000000000000 / difficulty)
+        self.extranonce1 = os.urandom(4).hex()
+        script_sig_len = len(self.COINBASE_HEIGHT_PUSH) // 2 + len(self.extranonce1) // 2 + extranonce2_size
+        self.coinb1 = self.COINB1_PREFIX + f"{script_sig_len:02x}" + self.COINBASE_HEIGHT_PUSH
+        self.miner: Optional["StratumMiner"] = None  # Read for pickup latency (attached by main())
+        self.jobs: Dict[str, Dict[str, Any]] = {}  # Every job sent: job_id -> notify params and send time
+        self.current_job_id: Optional[str] = None
+        self.seen = set()  # Accepted (job, extranonce2, ntime, nonce, version bits)
+        self.counts = {"accepted": 0, "stale": 0, "duplicate": 0, "invalid": 0}
+        self.first_hash_ms = LatencyHistogram()  # Notify sent -> first worker hashing the job
+        self.all_workers_ms = LatencyHistogram()  # Notify sent -> last worker hashing the job
+        self.first_share_ms = LatencyHistogram()  # Notify sent -> first accepted share for the job
+        self.started_at = 0.0
+        self.port = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stop_event: Optional[asyncio.Event] = None
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.serve()), name="mock-pool", daemon=True)
+    
+    def start(self) -> int:
+        """Start serving; returns the port to connect to."""
+        self.thread.start()
+        self.ready.wait()
+        return self.port
+    
+    def stop(self) -> None:
+        if self.loop is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+            self.thread.join(timeout=5)
+    
+    async def serve(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+        await self.stop_event.wait()
+        server.close()
+    
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """One miner connection: answer requests, push jobs on the cadence."""
+        def send(message):
+            writer.write((json.dumps(message) + "\n").encode())
+        
+        async def notifier():
+            while True:
+                await asyncio.sleep(self.job_interval)
+                send(self.new_job())
+        
+        notify_task = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                method, msg_id, params = msg.get("method"), msg.get("id"), msg.get("params") or []
+                if method == "mining.subscribe":
+                    send({"id": msg_id, "result": [[["mining.notify", "mock"]], self.extranonce1, self.extranonce2_size],
+                          "error": None})
+                elif method == "mining.configure":
+                    send({"id": msg_id, "result": {"version-rolling": True, "version-rolling.mask": f"{self.VERSION_MASK:08x}"},
+                          "error": None})
+                elif method == "mining.authorize":
+                    send({"id": msg_id, "result": True, "error": None})
+                    send({"id": None, "method": "mining.set_difficulty", "params": [self.difficulty]})
+                    if not self.started_at:
+                        self.started_at = time.time()
+                    send(self.new_job())
+                    if notify_task is None:
+                        notify_task = asyncio.create_task(notifier())
+                elif method in ("mining.extranonce.subscribe", "mining.suggest_difficulty"):
+                    send({"id": msg_id, "result": True, "error": None})  # Difficulty stays fixed
+                elif method == "mining.submit":
+                    error = self.check_share(params)
+                    send({"id": msg_id, "result": error is None, "error": error})
+                elif msg_id is not None:
+                    send({"id": msg_id, "result": None, "error": [20, "Unsupported method", None]})
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            if notify_task is not None:
+                notify_task.cancel()
+            writer.close()
+    
+    def new_job(self) -> Dict[str, Any]:
+        """Next clean_jobs notify (every earlier job becomes stale)."""
+        import os
+        self.sample_pickup()
+        job_id = f"mock{len(self.jobs) + 1}"
+        params = [job_id, os.urandom(32).hex(), self.coinb1, self.COINB2,
+                  [os.urandom(32).hex() for _ in range(self.branches)],
+                  "20000000", "1d00ffff", f"{int(time.time()):08x}", True]
+        self.jobs[job_id] = {"params": params, "sent_at": time.time(), "shares": 0}
+        self.current_job_id = job_id
+        return {"id": None, "method": "mining.notify", "params": params}
+    
+    def sample_pickup(self) -> None:
+        """Record notify -> pickup for the current job (workers have had a whole interval to switch)."""
+        job = self.jobs.get(self.current_job_id)
+        pickup = self.miner.job_pickup() if self.miner is not None and job is not None else None
+        if pickup is None or pickup[0] != self.current_job_id:
+            return
+        _, published_at, first, last = pickup
+        if last <= 0:
+            return  # Workers record switch latency from their second job on
+        self.first_hash_ms.record((published_at + first - job["sent_at"]) * 1000)
+        self.all_workers_ms.record((published_at + last - job["sent_at"]) * 1000)
+    
+    def check_share(self, params: list) -> Optional[list]:
+        """Validate a mining.submit; returns the Stratum error, or None if accepted."""
+        if len(params) < 5:
+            self.counts["invalid"] += 1
+            return [20, "Malformed submit", None]
+        job_id, extranonce2_hex, ntime_hex, nonce_hex = params[1:5]
+        version_bits_hex = params[5] if len(params) > 5 else "00000000"
+        job = self.jobs.get(job_id)
+        if job is None:
+            self.counts["invalid"] += 1
+            return [21, "Job not found", None]
+        if len(extranonce2_hex) != 2 * self.extranonce2_size:
+            self.counts["invalid"] += 1
+            return [20, f"extranonce2 must be {self.extranonce2_size} bytes", None]
+        if job_id != self.current_job_id:
+            self.counts["stale"] += 1
+            return [21, "Stale job (superseded by clean_jobs)", None]
+        key = (job_id, extranonce2_hex, ntime_hex, nonce_hex, version_bits_hex)
+        if key in self.seen:
+            self.counts["duplicate"] += 1
+            return [22, "Duplicate share", None]
+        try:
+            hash_int = self.share_hash(job["params"], extranonce2_hex, ntime_hex, nonce_hex, int(version_bits_hex, 16))
+        except ValueError:
+            self.counts["invalid"] += 1
+            return [20, "Malformed submit", None]
+        if hash_int > self.target:
+            self.counts["invalid"] += 1
+            return [23, "Low difficulty share", None]
+        self.seen.add(key)
+        self.counts["accepted"] += 1
+        if not job["shares"]:
+            self.first_share_ms.record((time.time() - job["sent_at"]) * 1000)
+        job["shares"] += 1
+        return None
+    
+    def share_hash(self, params: list, extranonce2_hex: str, ntime_hex: str, nonce_hex: str, version_bits: int) -> int:
+        """Double SHA-256 of the share's header, as a little-endian integer."""
+        def sha256d_bytes(data):
+            return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+        
+        _, prevhash, coinb1, coinb2, branches, version, nbits, _, _ = params
+        if version_bits & ~self.VERSION_MASK:
+            raise ValueError("version bits outside the mask")
+        root = sha256d_bytes(bytes.fromhex(coinb1 + self.extranonce1 + extranonce2_hex + coinb2))
+        for branch in branches:
+            root = sha256d_bytes(root + bytes.fromhex(branch))
+        prevhash_raw = bytes.fromhex(prevhash)
+        header = (struct.pack("<I", (int(version, 16) & ~self.VERSION_MASK) | version_bits)
+                  + b"".join(prevhash_raw[i:i + 4][::-1] for i in range(0, 32, 4))  # Stratum prevhash: word-swapped
+                  + root
+                  + struct.pack("<I", int(ntime_hex, 16))
+                  + bytes.fromhex(nbits)[::-1]
+                  + struct.pack("<I", int(nonce_hex, 16)))
+        return int.from_bytes(sha256d_bytes(header), byteorder="little")
+    
+    def print_report(self, miner: "StratumMiner") -> None:
+        """End-to-end pipeline summary of the run."""
+        elapsed = max(time.time() - self.started_at, 1e-9) if self.started_at else 0.0
+        counts = self.counts
+        submitted = sum(counts.values())
+        found = submitted + miner.shares_stale + miner.verify_mismatches()  # Shares the workers queued
+        stale = counts["stale"] + miner.shares_stale
+        expected = miner.total_hashes / (self.difficulty * 2 ** 32)
+        print("=" * 60)
+        print(f"Mock pool: {elapsed:.0f} s, difficulty {self.difficulty:g}, clean job every {self.job_interval:g} s, "
+              f"{self.branches} merkle branches, {self.extranonce2_size}-byte extranonce2")
+        print("=" * 60)
+        print(f"Jobs sent: {len(self.jobs)}")
+        if elapsed:
+            print(f"Shares accepted: {counts['accepted']} ({counts['accepted'] / elapsed:.2f}/s; "
+                  f"{expected / elapsed:.2f}/s expected from {miner.total_hashes:,} hashes)")
+        print(f"Stale: {stale} ({counts['stale']} rejected by the pool, {miner.shares_stale} dropped by the miner), "
+              f"{stale / found * 100 if found else 0:.1f}% of {found} shares found")
+        print(f"Invalid: {counts['invalid']} (plus {miner.verify_mismatches()} caught by local verification) | "
+              f"Duplicate: {counts['duplicate']}")
+        print(f"Notify -> first hash p50/p99 ms: {self.first_hash_ms.summary()} "
+              f"(all workers: {self.all_workers_ms.summary()})")
+        print(f"Notify -> first share p50/p99 ms: {self.first_share_ms.summary()}")
+        print("=" * 60)
+
+
+SESSION_LOG_FORMAT = "minr-stratum-session"  # Header "format" of --record logs
+
+
+class SessionRecorder:
+    """Stratum session log (--record): every line sent and received, as JSON lines.
+    
+    The first line is a header; each following line is [t, kind, data], t being
+    seconds since the recording started (monotonic clock). Kinds: connect and
+    fail (data "host:port"), send and recv (data is the Stratum line exactly as
+    written or read), close (the pool dropped the connection) and end (the
+    miner closed it). The file is line buffered, so a session that ends in a
+    crash is still on disk. SessionReplay plays it back.
+    """
+    
+    def __init__(self, path: str, pools: list):
+        self.path = path
+        self.file = open(path, "w", encoding="utf-8", buffering=1)
+        self.started = time.monotonic()
+        self.events = 0
+        self.file.write(json.dumps({"format": SESSION_LOG_FORMAT, "version": 1, "recorded_at": datetime.now().isoformat(),
+                                    "pools": [f"{host}:{port}" for host, port in pools], "worker": WORKER_NAME}) + "\n")
+    
+    def record(self, kind: str, data: str = "") -> None:
+        if self.file.closed:
+            return
+        self.file.write(json.dumps([round(time.monotonic() - self.started, 6), kind, data], separators=(",", ":")) + "\n")
+        self.events += 1
+    
+    def close(self) -> None:
+        if not self.file.closed:
+            self.file.close()
+
+
+class ReplayConnection:
+    """One recorded pool connection played back in-process.
+    
+    reader is a StreamReader fed with the pool's own messages (notify,
+    set_difficulty, reconnect...) at their recorded offsets from the connect.
+    The object itself stands in for the StreamWriter: each request the miner
+    writes is answered with the next recorded response to the same method,
+    after the recorded response time. Messages the pool sent after answering
+    mining.subscribe wait for the replayed subscribe answer, so extranonce1 is
+    always known before the first job.
+    """
+    
+    def __init__(self, segment: Dict[str, Any], speed: float, on_end: Callable):
+        self.loop = asyncio.get_running_loop()
+        self.reader = asyncio.StreamReader()
+        self.segment = segment
+        self.speed = speed
+        self.on_end = on_end  # Called once the recorded connection is played out
+        self.responses = {method: list(queue) for method, queue in segment["responses"].items()}
+        self.started = self.loop.time()
+        self.subscribed = asyncio.Event()
+        self.closed = False
+        self.feeder = self.loop.create_task(self.feed())
+    
+    def delay(self, seconds: float) -> float:
+        """Recorded seconds -> replay seconds (speed 0 = no waiting)."""
+        return seconds / self.speed if self.speed > 0 else 0.0
+    
+    async def feed(self) -> None:
+        for offset, line, after_subscribe in self.segment["pushes"]:
+            if after_subscribe:
+                await self.subscribed.wait()
+            await asyncio.sleep(max(0.0, self.started + self.delay(offset) - self.loop.time()))
+            self.reader.feed_data(line.encode() + b"\n")
+        await asyncio.sleep(max(0.0, self.started + self.delay(self.segment["end"]) - self.loop.time()))
+        self.on_end(self)
+    
+    def write(self, data: bytes) -> None:
+        if self.closed:
+            return
+        for line in data.decode(errors="replace").splitlines():
+            try:
+                msg = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            method, msg_id = msg.get("method"), msg.get("id")
+            if not method or msg_id is None:
+                continue  # Our replies to pool requests need no answer
+            queue = self.responses.get(method)
+            if queue:
+                latency, result, error = queue.pop(0)
+            elif method == "mining.subscribe":
+                latency, result, error = 0.0, None, [20, "Not in recording", None]
+            else:
+                latency, result, error = 0.0, True, None  # More submits than recorded: accept
+            self.loop.call_later(self.delay(latency), self.respond, method, {"id": msg_id, "result": result, "error": error})
+    
+    def respond(self, method: str, msg: Dict[str, Any]) -> None:
+        if self.closed:
+            return
+        self.reader.feed_data((json.dumps(msg) + "\n").encode())
+        if method == "mining.subscribe":
+            self.subscribed.set()
+    
+    def close(self) -> None:
+        self.closed = True
+        self.feeder.cancel()
+    
+    async def wait_closed(self) -> None:
+        pass
+
+
+class SessionReplay:
+    """Plays a --record log back into the miner with no network (--replay).
+    
+    The log is split into its pool connections. Each connect() of the miner
+    gets the next one: a recorded connect failure fails the same way, a
+    recorded connection is played by a ReplayConnection and then closed from
+    the pool side, and once every connection has played, finished is set.
+    Pool-initiated messages keep their recorded timing, scaled by speed, so
+    job bursts, difficulty swings and reconnect storms happen as they did;
+    the shares the miner finds are its own and get the recorded answers in
+    order. Reconnect delays are the miner's own backoff, not the recorded gaps.
+    """
+    
+    def __init__(self, path: str, speed: float = 1.0):
+        self.path = path
+        self.speed = speed
+        self.segments = []  # One per recorded connect attempt
+        self.position = 0  # Next segment to hand out
+        self.finished = threading.Event()
+        with open(path, encoding="utf-8") as f:
+            try:
+                header = json.loads(f.readline() or "{}")
+            except json.JSONDecodeError:
+                header = {}
+            if not isinstance(header, dict) or header.get("format") != SESSION_LOG_FORMAT:
+                raise ValueError(f"{path} is not a Stratum session recording")
+            segment = None
+            pending = {}  # Request id -> (method, sent at) within the current connection
+            for line_number, line in enumerate(f, 2):
+                try:
+                    t, kind, data = json.loads(line)
+                except (json.JSONDecodeError, TypeError, ValueError):
+                    raise ValueError(f"{path}:{line_number}: invalid event")
+                if kind == "connect":
+                    segment = {"failed": False, "start": t, "end": 0.0, "pushes": [], "responses": {}, "subscribed": False}
+                    self.segments.append(segment)
+                    pending = {}
+                    continue
+                if kind == "fail":
+                    self.segments.append({"failed": True})
+                    segment = None
+                    continue
+                if segment is None:
+                    continue
+                offset = t - segment["start"]
+                segment["end"] = offset
+                if kind in ("close", "end"):
+                    segment = None
+                    continue
+                try:
+                    msg = json.loads(data)
+                except json.JSONDecodeError:
+                    msg = None
+                if not isinstance(msg, dict):
+                    msg = None
+                if kind == "send":
+                    if msg is not None and msg.get("method") and msg.get("id") is not None:
+                        pending[msg["id"]] = (msg["method"], t)
+                elif msg is None or msg.get("method"):
+                    segment["pushes"].append((offset, data, segment["subscribed"]))  # Unparsable lines replay as-is
+                elif msg.get("id") in pending:
+                    method, sent_at = pending.pop(msg["id"])
+                    segment["responses"].setdefault(method, []).append((t - sent_at, msg.get("result"), msg.get("error")))
+                    if method == "mining.subscribe":
+                        segment["subscribed"] = True
+        if not self.segments:
+            raise ValueError(f"{path} has no recorded connections")
+    
+    def open_connection(self) -> Tuple[asyncio.StreamReader, ReplayConnection]:
+        """Stand-in for asyncio.open_connection: the next recorded connection (event loop thread)."""
+        if self.position >= len(self.segments):
+            self.finished.set()
+            raise ConnectionError("end of recording")
+        segment = self.segments[self.position]
+        self.position += 1
+        if segment["failed"]:
+            raise ConnectionRefusedError("recorded connect failure")
+        connection = ReplayConnection(segment, self.speed, self.connection_played)
+        return connection.reader, connection
+    
+    def connection_played(self, connection: ReplayConnection) -> None:
+        if self.position >= len(self.segments):
+            self.finished.set()  # Last connection: leave it open until the miner stops
+        elif not connection.closed:
+            connection.reader.feed_eof()
+
+
 class StratumMiner:
     """A complete Stratum protocol Bitcoin miner in Python"""
     
     def __init__(self):
         self.running = False
-        self.socket: Optional[socket.socket] = None
+        self.stopped = False
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None  # Owns the pool connection (see run())
+        self.loop_thread: Optional[threading.Thread] = None
+        self.stop_event: Optional[asyncio.Event] = None
+        self.job_ready: Optional[asyncio.Event] = None  # Set by the first job of each pool session
+        self.session_closed: Optional[asyncio.Event] = None
+        self.pool_manager = PoolManager([(STRATUM_HOST, STRATUM_PORT)] + BACKUP_POOLS)
+        self.pool: Optional[Tuple[str, int]] = None  # Pool of the current session
+        self.recorder: Optional[SessionRecorder] = None  # Stratum line log (--record, attached by main())
+        self.replay: Optional[SessionReplay] = None  # Recorded session served instead of the network (--replay)
+        # Job registry for the current pool session: job_id -> {"clean", "stale", "difficulty", "received_at", ...}
+        # (insertion ordered; shares for unknown or stale jobs are dropped before submit), plus the notify
+        # params ("job") and lowest worker difficulty ("min_difficulty") used to verify shares
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.started = threading.Event()  # Set once workers are mining, or after every pool failed once
+        self.background_tasks = []
         self.total_hashes = 0  # 64-bit unsigned (Python int is arbitrary precision)
         self.start_time: Optional[datetime] = None
         self.shares_accepted = 0
         self.shares_rejected = 0
+        self.shares_stale = 0  # Dropped before submit: job superseded, unknown to the pool, or below its difficulty
+        self.mining_backend = "python"  # Header hashing engine of the workers (set in start_workers)
+        self.verify_backend, self.verify_sha256 = _select_sha256_backend()  # Full-header rehash, no midstate
+        self.verify_stats: Dict[str, Dict[str, int]] = {}  # Mining backend -> {"verified", "mismatched"}
+        # Share submit latency per stage: found in worker -> dequeued here ("queue"), -> written to
+        # the socket ("send"), -> pool response ("accepted" / "rejected")
+        self.submit_latency = {stage: LatencyHistogram() for stage in ("queue", "send", "accepted", "rejected")}
         self.shares_submitted = 0
         self.current_job: Optional[Dict[str, Any]] = None
         self.difficulty = 1.0  # Default difficulty (will be updated by mining.set_difficulty)
+        self.suggested_difficulty = 0.0  # Local share difficulty from vardiff (0 = follow the pool)
+        self.accepted_work = 0.0  # Sum of the difficulties of accepted shares
         self.extranonce1 = ""
         self.extranonce2_size = 4  # Default, will be updated by subscribe response
-        self.submit_id = 3
+        self.next_request_id = 1
+        self.pending_requests: Dict[int, Dict[str, Any]] = {}  # id -> request awaiting a response
+        self.recv_buffer = bytearray()  # Bytes received after the last complete line
         self.mining_threads = []
         self.mining_processes = []
         
+        self.current_target = 0x00000000FFFF0000000000000000000000000000000000000000000000000000
+        self.current_clean_jobs = False
+        self.version_mask = 0  # BIP310 mask granted by the pool for this session (0 = not negotiated)
+        
         # Shared memory for multiprocessing (bypasses GIL)
         # Use 'q' (signed long long) for 64-bit, but treat as unsigned
         # Python multiprocessing doesn't support unsigned types directly
-        self.manager = mp.Manager()
-        self.shared_total_hashes = mp.Value('q', 0)  # 64-bit signed (treat as unsigned)
+        self.worker_counters: Optional[WorkerCounters] = None  # Per-worker counters, sized in start()
         self.shared_running = mp.Value('b', True)  # Boolean shared value
-        self.shared_job = self.manager.dict()  # Shared dict for job data
-        self.share_queue = self.manager.Queue()  # Queue for share submission
+        self.job_board = SharedJobBoard()  # Compiled job records for worker processes
+        self.share_queue = mp.Queue()  # Queue for share submission
+        # Block candidates bypass share_queue: workers write to this pipe, the event loop reads it
+        self.block_reader, self.block_writer = mp.Pipe(duplex=False)
+        self.block_candidates: list = []  # Candidates awaiting a pool answer (resubmitted after reconnect)
+        self.stats_reporter: Optional[StatsReporter] = None  # API reporting thread (started in run() if API_URL is set)
+        self.metrics_server: Optional[asyncio.AbstractServer] = None  # Prometheus endpoint (--metrics-port)
+        self.trace_buffer: Optional[TraceBuffer] = None  # Per-worker trace rings (--trace-ring), sized in run()
+        self.trace_ring = 0  # The event loop's own ring in trace_buffer
+        self.phase_counters: Optional[WorkerCounters] = None  # Per-worker phase nanoseconds (--trace-perf)
+        self.phase_baseline = None  # phase_snapshot() when the workers started
+        self.pool_connects = 0  # Successful pool connections (sessions) since start
+        self.hashrate = 0.0  # Last stats window, for the metrics endpoint
+        self.worker_hashrates: list = []
+        self.blocks_found = 0
+        self.blocks_accepted = 0
+        self.block_latency_ms = 0.0  # Found (worker) -> sent (socket) for the last candidate
     
-    def connect(self) -> bool:
-        """Connect to Stratum pool"""
+    async def connect(self, pool: Tuple[str, int]) -> Optional[float]:
+        """Connect to a Stratum pool. Returns the connect time in ms, or None on failure."""
+        host, port = pool
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(30)
-            self.socket.connect((STRATUM_HOST, STRATUM_PORT))
+            connect_start = time.perf_counter()
+            if self.replay is not None:
+                self.reader, self.writer = self.replay.open_connection()
+            else:
+                self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=30)
+            connect_ms = (time.perf_counter() - connect_start) * 1000
+            if self.recorder is not None:
+                self.recorder.record("connect", f"{host}:{port}")
             if DEBUG_STRATUM:
-                print(f"[DEBUG] ✓ Connected to {STRATUM_HOST}:{STRATUM_PORT}")
+                print(f"[DEBUG] ✓ Connected to {host}:{port} ({connect_ms:.1f} ms)")
             else:
-                print(f"✓ Connected to {STRATUM_HOST}:{STRATUM_PORT}")
-            return True
+                print(f"✓ Connected to {host}:{port} ({connect_ms:.1f} ms)")
+            return connect_ms
         except Exception as e:
-            print(f"✗ Connection error: {e}")
-            return False
+            print(f"✗ Connection error ({host}:{port}): {e or type(e).__name__}")
+            if self.recorder is not None:
+                self.recorder.record("fail", f"{host}:{port}")
+            return None
+    
+    async def probe(self, pool: Tuple[str, int]) -> Optional[float]:
+        """TCP connect RTT to a pool in ms without starting a session (None if unreachable)."""
+        try:
+            probe_start = time.perf_counter()
+            _, writer = await asyncio.wait_for(asyncio.open_connection(*pool), timeout=10)
+            rtt_ms = (time.perf_counter() - probe_start) * 1000
+            writer.close()
+            return rtt_ms
+        except Exception:
+            return None
     
     def send_message(self, msg: Dict[str, Any]) -> None:
-        """Send JSON message to pool"""
-        if self.socket:
+        """Send JSON message to pool (event loop thread only; the transport buffers the write)"""
+        if self.writer:
             try:
                 data = json.dumps(msg) + "\n"
                 if DEBUG_STRATUM:
                     print(f"[DEBUG] → SEND: {data.strip()}")
-                self.socket.send(data.encode())
+                self.writer.write(data.encode())
+                if self.recorder is not None:
+                    self.recorder.record("send", data[:-1])
             except Exception as e:
                 print(f"Error sending message: {e}")
     
-    def receive_message(self) -> Optional[Dict[str, Any]]:
-        """Receive JSON message from pool"""
-        if not self.socket:
+    def send_request(self, method: str, params: list, context: Optional[Dict[str, Any]] = None) -> int:
+        """Send a request without waiting for its response.
+        
+        The request is remembered under its id so handle_message() can match the
+        response to it, however many other requests are in flight. Use request()
+        to wait for the response instead.
+        """
+        msg_id = self.next_request_id
+        self.next_request_id += 1
+        self.pending_requests[msg_id] = {
+            "method": method, "params": params, "context": context or {},
+            "sent_at": time.time(), "future": self.loop.create_future(),
+        }
+        self.send_message({"id": msg_id, "method": method, "params": params})
+        return msg_id
+    
+    async def request(self, method: str, params: list, timeout: float = 30) -> Optional[Dict[str, Any]]:
+        """Send a request and wait for its response (None if it never arrives)."""
+        future = self.pending_requests[self.send_request(method, params)]["future"]
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] ✗ No response to {method} after {timeout:.0f}s")
+            return None
+    
+    async def receive_messages(self) -> Optional[list]:
+        """Receive every complete JSON line available from the pool.
+        
+        Bytes after the last newline stay in recv_buffer for the next call, so
+        messages that arrive together (set_difficulty + notify, bursts of submit
+        responses) or split across reads are all delivered in order. Returns
+        None when the connection is closed.
+        """
+        if not self.reader:
             return None
         
         try:
-            # Read until we get a complete line
-            buffer = b""
-            while b"\n" not in buffer:
-                chunk = self.socket.recv(4096)
-                if not chunk:
-                    return None
-                buffer += chunk
-            
-            # Parse JSON from buffer
-            line = buffer.split(b"\n", 1)[0].decode().strip()
-            if line:
-                msg = json.loads(line)
-                if DEBUG_STRATUM:
-                    print(f"[DEBUG] ← RECV: {line}")
-                return msg
-        except json.JSONDecodeError:
-            pass
-        except socket.timeout:
-            pass
+            chunk = await self.reader.read(65536)
         except Exception as e:
             print(f"Error receiving message: {e}")
+            return None
+        if not chunk:
+            return None
+        
+        self.recv_buffer += chunk
+        end = self.recv_buffer.rfind(b"\n")
+        if end < 0:
+            if len(self.recv_buffer) > MAX_LINE_BYTES:
+                print(f"Error receiving message: line exceeds {MAX_LINE_BYTES} bytes, dropping")
+                self.recv_buffer.clear()
+            return []
+        lines = self.recv_buffer[:end].split(b"\n")
+        del self.recv_buffer[:end + 1]
         
+        messages = []
+        for raw in lines:
+            line = raw.decode(errors="replace").strip()
+            if not line:
+                continue
+            if DEBUG_STRATUM:
+                print(f"[DEBUG] ← RECV: {line}")
+            if self.recorder is not None:
+                self.recorder.record("recv", line)
+            try:
+                messages.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Error receiving message: invalid JSON line: {line[:80]}")
+        return messages
+    
+    def publish_job(self) -> None:
+        """Compile the current job and publish it to workers through the shared job board."""
+        try:
+            record = compile_job(self.current_job, self.extranonce1, self.extranonce2_size,
+                                 self.current_target, self.current_clean_jobs, self.version_mask)
+            generation = self.job_board.publish(record)
+            self.trace(TE_JOB_PUBLISHED, generation, hash_difficulty(self.current_target))
+            entry = self.jobs.get(record["job_id"])
+            if entry is not None:
+                # Easiest target workers were given for this job: a share below it is a backend error
+                entry["min_difficulty"] = min(entry["min_difficulty"], hash_difficulty(self.current_target))
+                # Coinbase and version parameters workers mine it under (set_extranonce/set_version_mask change them)
+                published_as = (self.extranonce1, self.extranonce2_size, self.version_mask)
+                if entry["published_as"][-1:] != [published_as]:
+                    entry["published_as"].append(published_as)
+            if self.job_ready is not None:
+                self.job_ready.set()
+            if DEBUG_STRATUM:
+                print(f"[DEBUG] Published job {record['job_id']} (generation {generation})")
+        except Exception as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] ✗ Failed to publish job: {e}")
+    
+    def register_job(self, job_id: str, clean_jobs: bool, job: Dict[str, Any]) -> None:
+        """Record a notified job; clean_jobs makes every earlier job stale."""
+        if clean_jobs:
+            for entry in self.jobs.values():
+                entry["stale"] = True
+        self.jobs.pop(job_id, None)
+        self.jobs[job_id] = {"clean": clean_jobs, "stale": False, "difficulty": self.difficulty, "received_at": time.time(),
+                             "job": job, "min_difficulty": float("inf"), "published_as": []}
+        while len(self.jobs) > JOB_REGISTRY_SIZE:
+            del self.jobs[next(iter(self.jobs))]
+    
+    def stale_reason(self, job_id: str, share_difficulty: float) -> Optional[str]:
+        """Why a share would be rejected by the pool (None if it is worth submitting)."""
+        if self.writer is None:
+            return "no pool connection"
+        job = self.jobs.get(job_id)
+        if job is None:
+            return "job unknown to this pool session"
+        if job["stale"]:
+            return "job superseded by clean_jobs"
+        if share_difficulty < self.difficulty:
+            return f"difficulty {share_difficulty:.6g} below pool {self.difficulty:.6g}"
         return None
     
+    def verify_share(self, job_id: str, extranonce2_hex: str, ntime_hex: str, nonce: int,
+                     version_bits: Optional[int], claimed_difficulty: float) -> Optional[bool]:
+        """Recompute a share from its notified job before it is submitted.
+        
+        The header is rebuilt from (job, extranonce2, ntime, nonce, version bits)
+        and hashed in full with the verify backend, independent of the
+        worker's midstate or batch engine, using the extranonce1 and version
+        mask the job was published with (newest first: a share queued before a
+        mining.set_extranonce was mined under the old one). The share is a
+        mismatch if the hash is weaker than the worker reported, or weaker than
+        any target the workers were given for the job; mismatches are counted
+        per mining backend. Returns None if the job is no longer registered.
+        """
+        entry = self.jobs.get(job_id)
+        if entry is None:
+            return None
+        extranonce2 = bytes.fromhex(extranonce2_hex)
+        min_difficulty = max(claimed_difficulty, entry["min_difficulty"]) * (1 - 1e-9)  # Only rounding may differ
+        difficulty = 0.0
+        for extranonce1, extranonce2_size, version_mask in reversed(entry["published_as"]):
+            if extranonce2_size != len(extranonce2):
+                continue
+            header = self.build_block_header(entry["job"], extranonce2, int(ntime_hex, 16), nonce, version_bits,
+                                             extranonce1, version_mask)
+            difficulty = hash_difficulty(int.from_bytes(self.double_sha256_with(self.verify_sha256, header), byteorder="little"))
+            if difficulty >= min_difficulty:
+                break
+        stats = self.verify_stats.setdefault(self.mining_backend, {"verified": 0, "mismatched": 0})
+        if difficulty < min_difficulty:
+            stats["mismatched"] += 1
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ Share verification mismatch ({self.mining_backend}): job {job_id}, "
+                  f"nonce {nonce:08x}, worker difficulty {claimed_difficulty:.6g}, recomputed {difficulty:.6g}, "
+                  f"job target difficulty {entry['min_difficulty']:.6g}")
+            return False
+        stats["verified"] += 1
+        return True
+    
+    def share_difficulty(self) -> float:
+        """Difficulty workers search at: the pool's, raised to our vardiff suggestion.
+        
+        A share at or above the suggested difficulty is also valid at any lower
+        pool difficulty, so the local target can be tightened even if the pool
+        ignores mining.suggest_difficulty.
+        """
+        pool_difficulty = float(self.difficulty) if self.difficulty > 0 else 1.0
+        return max(pool_difficulty, self.suggested_difficulty)
+    
+    def suggest_difficulty(self, difficulty: float) -> None:
+        """Ask the pool for a share difficulty and apply it to workers right away."""
+        self.suggested_difficulty = difficulty
+        if self.writer:
+            self.send_request("mining.suggest_difficulty", [difficulty])
+        target = int(0x00000000FFFF0000000000000000000000000000000000000000000000000000 // self.share_difficulty())
+        if target != self.current_target:
+            self.current_target = target
+            if self.current_job:
+                self.publish_job()
+    
     def double_sha256(self, data: bytes) -> bytes:
         """Compute double SHA256 hash"""
         return hashlib.sha256(hashlib.sha256(data).digest()).digest()
     
+    def double_sha256_with(self, sha256_func: Callable, data: bytes) -> bytes:
+        """Compute double SHA256 hash with a specific backend (from _select_sha256_backend)"""
+        return sha256_func(sha256_func(data))
+    
     def reverse_bytes(self, data: bytes) -> bytes:
         """Reverse byte order (little-endian to big-endian) - optimized"""
         return data[::-1]  # Faster than bytes(reversed(data))
     
     def compute_merkle_root(self, coinbase: bytes, merkle_branches: list) -> bytes:
-        """Compute Merkle root from coinbase and branches"""
-        root = coinbase
+        """Compute Merkle root from coinbase and branches (hex, as sent in mining.notify)"""
+        root = self.double_sha256(coinbase)
         for branch in merkle_branches:
             root = self.double_sha256(root + bytes.fromhex(branch))
         return root
     
-    def build_block_header(self, job: Dict[str, Any], extranonce2: bytes, ntime: bytes, nonce: int) -> bytes:
-        """Build Bitcoin block header"""
-        # Version comes as hex string from Stratum, convert to int
-        version_str = job.get("version", "20000000")
-        if isinstance(version_str, str):
-            version_int = int(version_str, 16) if version_str.startswith(('0x', '0X')) or all(c in '0123456789abcdefABCDEF' for c in version_str) else int(version_str)
-        else:
-            version_int = version_str
-        version = struct.pack("<I", version_int)
+    def build_block_header(self, job: Dict[str, Any], extranonce2: bytes, ntime: int, nonce: int,
+                           version_bits: Optional[int] = None, extranonce1: Optional[str] = None,
+                           version_mask: Optional[int] = None) -> bytes:
+        """Build the 80-byte Bitcoin block header for a share from its mining.notify job.
         
-        prevhash = bytes.fromhex(job["prevhash"])[::-1]  # Reverse for little-endian
-        merkle_root = bytes.fromhex(job["merkle_root"])[::-1]
-        nbits = bytes.fromhex(job["nbits"])[::-1]
+        The coinbase is assembled from coinb1 + extranonce1 + extranonce2 + coinb2,
+        and version_bits (BIP310) replace the rolled bits of the job version.
+        extranonce1 and version_mask default to the session's current values.
+        """
+        if extranonce1 is None:
+            extranonce1 = self.extranonce1
+        if version_mask is None:
+            version_mask = self.version_mask
+        coinbase = bytes.fromhex(job["coinb1"]) + bytes.fromhex(extranonce1) + extranonce2 + bytes.fromhex(job["coinb2"])
+        merkle_root = self.compute_merkle_root(coinbase, job["merkle_branches"])
+        header = bytearray(self.build_static_header(job, merkle_root))
+        if version_bits is not None:
+            version = int.from_bytes(header[0:4], "little")
+            struct.pack_into("<I", header, 0, (version & ~version_mask) | version_bits)
         
         # Build header: version + prevhash + merkle_root + ntime + nbits + nonce
-        header = version + prevhash + merkle_root + ntime + nbits + struct.pack("<I", nonce)
-        return header
+        return bytes(header) + struct.pack("<I", ntime) + bytes.fromhex(job["nbits"])[::-1] + struct.pack("<I", nonce)
     
-    def build_static_header(self, job: Dict[str, Any]) -> bytes:
-        """Build static parts of block header (version + prevhash + merkle_root + nbits) - optimized"""
+    def build_static_header(self, job: Dict[str, Any], merkle_root: bytes) -> bytes:
+        """Build the header bytes fixed for a whole nonce scan (version + prevhash + merkle_root, first 68 bytes)"""
         # Version comes as hex string from Stratum, convert to int
         version_str = job.get("version", "20000000")
         if isinstance(version_str, str):
             version_int = int(version_str, 16) if version_str.startswith(('0x', '0X')) or all(c in '0123456789abcdefABCDEF' for c in version_str) else int(version_str)
         else:
             version_int = version_str
-        version = struct.pack("<I", version_int)
-        
-        # Pre-compute hex conversions (cache these)
-        prevhash_hex = job["prevhash"]
-        merkle_root_hex = job["merkle_root"]
-        nbits_hex = job["nbits"]
         
         # Use bytearray for faster concatenation
-        header = bytearray(80)
-        header[0:4] = version
-        header[4:36] = bytes.fromhex(prevhash_hex)[::-1]  # Reverse for little-endian
-        header[36:68] = bytes.fromhex(merkle_root_hex)[::-1]
-        header[68:72] = bytes.fromhex(nbits_hex)[::-1]
-        
-        # Return static parts: version + prevhash + merkle_root + nbits (first 72 bytes)
-        return bytes(header[:72])
+        header = bytearray(68)
+        header[0:4] = struct.pack("<I", version_int)
+        header[4:36] = stratum_prevhash_bytes(job["prevhash"])
+        header[36:68] = merkle_root  # Raw double-SHA256 bytes, not reversed
+        return bytes(header)
     
     def check_share(self, header: bytes, target: int) -> bool:
         """Check if share meets target difficulty"""
@@ -712,29 +2532,38 @@ class StratumMiner:
         hash_int = int.from_bytes(hash_result, byteorder="big")
         return hash_int < target
     
-    def submit_share(self, job_id: str, extranonce2_hex: str, ntime_hex: str, nonce: int):
-        """Submit a share to the pool"""
-        submit_id = self.submit_id
-        self.submit_id += 1
+    def submit_share(self, job_id: str, extranonce2_hex: str, ntime_hex: str, nonce: int, version_bits: Optional[int] = None,
+                     block_candidate: Optional[Dict[str, Any]] = None, found_at: Optional[float] = None,
+                     received_at: Optional[float] = None):
+        """Submit a share to the pool (version_bits: rolled BIP310 bits, if version rolling is on).
+        
+        found_at (worker clock) and received_at (taken off the share queue) feed
+        the queue and send latency histograms.
+        """
         self.shares_submitted += 1
         
-        # Convert nonce to hex (little-endian, 8 hex chars)
-        nonce_hex = struct.pack("<I", nonce).hex()
+        # Convert nonce to hex (big-endian, 8 hex chars, like ntime)
+        nonce_hex = f"{nonce:08x}"
         
         if DEBUG_STRATUM:
             print(f"[DEBUG] Submitting share: job_id={job_id}, extranonce2={extranonce2_hex}, ntime={ntime_hex}, nonce={nonce_hex}")
         
-        self.send_message({
-            "id": submit_id,
-            "method": "mining.submit",
-            "params": [
-                BTC_WALLET + "." + WORKER_NAME,
-                job_id,
-                extranonce2_hex,
-                ntime_hex,
-                nonce_hex
-            ]
-        })
+        params = [
+            BTC_WALLET + "." + WORKER_NAME,
+            job_id,
+            extranonce2_hex,
+            ntime_hex,
+            nonce_hex
+        ]
+        if version_bits is not None:
+            params.append(f"{version_bits:08x}")
+        self.send_request("mining.submit", params, context={"job_id": job_id, "nonce_hex": nonce_hex,
+                                                            "difficulty": self.share_difficulty(),
+                                                            "block_candidate": block_candidate})
+        if found_at is not None and received_at is not None:
+            sent_at = time.time()
+            self.submit_latency["queue"].record(max(0.0, received_at - found_at) * 1000)
+            self.submit_latency["send"].record((sent_at - received_at) * 1000)
     
     def handle_message(self, msg: Dict[str, Any]) -> None:
         """Handle messages from pool"""
@@ -771,12 +2600,13 @@ class StratumMiner:
                     "nbits": nbits,
                     "ntime": ntime,
                 }
+                self.register_job(job_id, bool(clean_jobs), self.current_job)
                 
                 # Calculate target from difficulty (target = max_target / difficulty)
                 # Max target for Bitcoin: 0x00000000FFFF0000000000000000000000000000000000000000000000000000
                 max_target = 0x00000000FFFF0000000000000000000000000000000000000000000000000000
-                # Use difficulty, default to 1.0 if not set yet
-                current_diff = float(self.difficulty) if self.difficulty > 0 else 1.0
+                # Use the share difficulty (pool or vardiff), default to 1.0 if not set yet
+                current_diff = self.share_difficulty()
                 target = int(max_target // current_diff)
                 
                 if DEBUG_STRATUM:
@@ -785,23 +2615,32 @@ class StratumMiner:
                     if current_diff == 1.0:
                         print(f"[DEBUG] For difficulty 1.0, target should equal max_target: {target == max_target}")
                 
-                # Update shared_job for worker processes
-                self.shared_job.update({
-                    "job_id": job_id,
-                    "prevhash": prevhash,
-                    "coinb1": coinb1,
-                    "coinb2": coinb2,
-                    "extranonce1": self.extranonce1,
-                    "merkle_branches": merkle_branches if isinstance(merkle_branches, list) else [],
-                    "version": version,
-                    "nbits": nbits,
-                    "ntime": ntime,  # Include ntime from job
-                    "target": target,
-                    "extranonce2_size": self.extranonce2_size
-                })
+                # Compile once and publish to worker processes
+                self.current_target = target
+                self.current_clean_jobs = bool(clean_jobs)
+                self.publish_job()
                 
                 print(f"[{datetime.now().strftime('%H:%M:%S')}] New job: {job_id}")
         
+        elif method == "mining.set_extranonce":
+            # New extranonce1 (and optionally extranonce2_size) for this session. Republishing
+            # the job changes its key, so workers rebuild the coinbase template in place.
+            if params and isinstance(params[0], str):
+                self.extranonce1 = params[0]
+                if len(params) >= 2 and isinstance(params[1], int) and params[1] > 0:
+                    self.extranonce2_size = params[1]
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Extranonce changed (extranonce1: {self.extranonce1[:16]}..., extranonce2_size: {self.extranonce2_size})")
+                if self.current_job:
+                    self.publish_job()
+        
+        elif method == "mining.set_version_mask":
+            # BIP310: pool changed the rollable bits; republish so workers use the new mask
+            if params:
+                self.version_mask = int(params[0], 16) & VERSION_ROLLING_MASK
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Version rolling mask: {self.version_mask:08x}")
+                if self.current_job:
+                    self.publish_job()
+        
         elif method == "mining.set_difficulty":
             # Difficulty change
             if params:
@@ -810,77 +2649,308 @@ class StratumMiner:
                     print(f"[DEBUG] mining.set_difficulty: {self.difficulty}")
                 print(f"[{datetime.now().strftime('%H:%M:%S')}] Difficulty: {self.difficulty}")
                 
-                # Recalculate target and update shared_job
+                # Recalculate target and republish the current job with it
                 max_target = 0x00000000FFFF0000000000000000000000000000000000000000000000000000
-                target = int(max_target // self.difficulty) if self.difficulty > 0 else max_target
-                self.shared_job["target"] = target
+                target = int(max_target // self.share_difficulty())
+                self.current_target = target
+                if self.current_job:
+                    self.publish_job()
                 if DEBUG_STRATUM:
                     print(f"[DEBUG] Updated target: {hex(target)[:20]}...")
         
-        elif result is not None:
-            # Handle responses
-            if msg_id == 1:  # Subscribe response
+        elif msg_id is not None and msg_id in self.pending_requests:
+            # Response to one of our requests, matched by id (responses may arrive out of order)
+            request = self.pending_requests.pop(msg_id)
+            request_method = request["method"]
+            if not request["future"].done():
+                request["future"].set_result(msg)
+            
+            if request_method == "mining.subscribe":
                 if isinstance(result, list) and len(result) >= 2:
                     self.extranonce1 = result[1] if isinstance(result[1], str) else ""
                     self.extranonce2_size = result[2] if len(result) >= 3 else 4
                     if DEBUG_STRATUM:
                         print(f"[DEBUG] mining.subscribe response: extranonce1={self.extranonce1}, extranonce2_size={self.extranonce2_size}")
                     print(f"[{datetime.now().strftime('%H:%M:%S')}] ✓ Subscribed (extranonce1: {self.extranonce1[:16]}...)")
+                else:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] ✗ Subscribe failed: {error}")
+            
+            elif request_method == "mining.configure":
+                rolling = result.get("version-rolling") if isinstance(result, dict) else None
+                if rolling is True:
+                    self.version_mask = int(result.get("version-rolling.mask", "0"), 16) & VERSION_ROLLING_MASK
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] ✓ Version rolling enabled (mask: {self.version_mask:08x})")
+                elif DEBUG_STRATUM:
+                    print(f"[DEBUG] mining.configure: version rolling not available ({rolling if rolling is not None else error})")
+            
+            elif request_method == "mining.suggest_difficulty":
+                if DEBUG_STRATUM:
+                    print(f"[DEBUG] mining.suggest_difficulty: {'ok' if result or not error else f'not supported ({error})'}")
+            
+            elif request_method == "mining.extranonce.subscribe":
+                if DEBUG_STRATUM:
+                    print(f"[DEBUG] mining.extranonce.subscribe: {'enabled' if result else f'not supported ({error})'}")
             
-            elif msg_id == 2:  # Authorization response
+            elif request_method == "mining.authorize":
                 if result:
                     print(f"[{datetime.now().strftime('%H:%M:%S')}] ✓ Authorized")
                 else:
                     print(f"[{datetime.now().strftime('%H:%M:%S')}] ✗ Authorization failed")
                     self.running = False
             
-            elif msg_id and msg_id >= 3:  # Submit response
+            elif request_method == "mining.submit":
+                share = request["context"]
+                latency_ms = (time.time() - request["sent_at"]) * 1000
+                self.submit_latency["accepted" if result else "rejected"].record(latency_ms)
+                candidate = share["block_candidate"]
+                if candidate is not None and candidate in self.block_candidates:
+                    # Answered: no resubmit after a reconnect
+                    self.block_candidates.remove(candidate)
+                    if result:
+                        self.blocks_accepted += 1
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] ★ Block candidate {'ACCEPTED' if result else f'rejected: {error}'} "
+                          f"(job {share['job_id']}, {latency_ms:.0f} ms round trip)")
                 if result:
                     self.shares_accepted += 1
+                    self.accepted_work += share["difficulty"]
+                    if self.pool is not None:
+                        self.pool_manager.record_success(self.pool)  # Working session: reset its backoff
                     if DEBUG_STRATUM:
-                        print(f"[DEBUG] Share ACCEPTED (ID: {msg_id})")
+                        print(f"[DEBUG] Share ACCEPTED (ID: {msg_id}, job {share['job_id']}, nonce {share['nonce_hex']}, {latency_ms:.0f} ms)")
                     print(f"[{datetime.now().strftime('%H:%M:%S')}] ✓ Share accepted (Total: {self.shares_accepted})")
                 else:
                     self.shares_rejected += 1
-                    error_msg = error[1] if error and len(error) > 1 else "Unknown error"
+                    error_msg = error[1] if isinstance(error, list) and len(error) > 1 else (error or "Unknown error")
                     if DEBUG_STRATUM:
-                        print(f"[DEBUG] Share REJECTED (ID: {msg_id}): {error_msg}")
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] ✗ Share rejected: {error_msg} (Total rejected: {self.shares_rejected})")
+                        print(f"[DEBUG] Share REJECTED (ID: {msg_id}, job {share['job_id']}, nonce {share['nonce_hex']}, {latency_ms:.0f} ms): {error_msg}")
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] ✗ Share rejected: {error_msg} (job {share['job_id']}, Total rejected: {self.shares_rejected})")
+            
+            elif error:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Error ({request_method}): {error}")
         
         elif error:
             print(f"[{datetime.now().strftime('%H:%M:%S')}] Error: {error}")
     
     def start(self, num_threads: int = 1) -> bool:
-        """Start mining"""
-        if not self.connect():
-            return False
+        """Start mining.
         
-        self.running = True
-        self.start_time = datetime.now()
+        The pool connection, share forwarding and stats reporting all run on one
+        asyncio event loop in a background thread (see run()). Returns once the
+        first job is being mined, or False once every pool has failed to connect
+        (reconnect attempts continue in the background); the caller then waits
+        for self.running to become False.
+        """
+        def loop_main():
+            try:
+                asyncio.run(self.run(num_threads))
+            except Exception as e:
+                print(f"Event loop error: {e}")
+            finally:
+                self.running = False
+                self.started.set()
         
-        # Subscribe
-        self.send_message({
-            "id": 1,
-            "method": "mining.subscribe",
-            "params": []
-        })
+        self.loop_thread = threading.Thread(target=loop_main, daemon=True)
+        self.loop_thread.start()
+        self.started.wait()
+        return bool(self.mining_processes)
+    
+    async def run(self, num_threads: int) -> None:
+        """Event loop body: keep a pool session alive until stop().
         
-        # Wait for subscribe response
-        time.sleep(0.5)
+        Sessions are opened against the pool manager's best candidate. When one
+        ends (connection lost, handshake failed, or a failover session handing
+        back to the primary) the next pool is tried at once, while the worker
+        processes keep running and pick up the new pool's first job.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        self.job_ready = asyncio.Event()
+        self.running = True
+        self.start_time = datetime.now()
+        if API_URL:
+            self.stats_reporter = StatsReporter(API_URL, AUTH_TOKEN, STATS_SPOOL_PATH)
+        if TRACE_RING_EVENTS:
+            self.trace_buffer = TraceBuffer(num_threads, TRACE_RING_EVENTS)
+            self.trace_ring = self.trace_buffer.ring(num_threads)
+        if METRICS_PORT:
+            try:
+                self.metrics_server = await asyncio.start_server(self.serve_metrics, METRICS_HOST, METRICS_PORT)
+                print(f"Metrics: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+            except OSError as e:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ Metrics endpoint unavailable: {e}")
+        failed_pools = set()
+        try:
+            while self.running:
+                candidates = self.pool_manager.candidates()
+                if not candidates:
+                    if await self.wait_or_stop(self.pool_manager.next_retry_in()):
+                        break
+                    continue
+                pool = candidates[0]
+                if await self.run_session(pool, num_threads):
+                    failed_pools.clear()
+                    continue
+                if not self.running:
+                    break
+                delay = self.pool_manager.record_failure(pool)
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] ✗ Pool {pool[0]}:{pool[1]} unavailable, retrying it in {delay:.1f}s")
+                failed_pools.add(pool)
+                if failed_pools.issuperset(self.pool_manager.pools):
+                    self.started.set()  # Every pool failed once: let start() return, keep retrying here
+        finally:
+            self.started.set()
+            if self.background_tasks:
+                self.loop.remove_reader(self.block_reader.fileno())
+            for task in self.background_tasks:
+                task.cancel()
+            await asyncio.gather(*self.background_tasks, return_exceptions=True)
+            if self.metrics_server is not None:
+                self.metrics_server.close()
+            await self.close_session()
+    
+    async def wait_or_stop(self, timeout: float) -> bool:
+        """Sleep up to timeout seconds; True if stop() was requested meanwhile."""
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return not self.running
+    
+    async def run_session(self, pool: Tuple[str, int], num_threads: int) -> bool:
+        """Connect, handshake and serve one pool until the session ends.
         
-        # Authorize
-        self.send_message({
-            "id": 2,
-            "method": "mining.authorize",
-            "params": [BTC_WALLET + "." + WORKER_NAME, "x"]
-        })
+        Returns True if the session delivered a job (the pool is healthy), False
+        if it failed before that.
+        """
+        connect_ms = await self.connect(pool)
+        if connect_ms is None:
+            return False
         
+        # Fresh protocol state; workers keep mining the last published job meanwhile
+        self.pool = pool
+        self.pool_connects += 1
+        self.trace(TE_POOL_CONNECTED, connect_ms)
+        self.recv_buffer.clear()
+        self.jobs = {}
+        self.difficulty = 1.0
+        self.session_closed = asyncio.Event()
+        self.job_ready.clear()
+        self.version_mask = 0
+        receiver = asyncio.create_task(self.receive_loop())
+        try:
+            if VERSION_ROLLING:
+                # BIP310: pipelined ahead of subscribe; the response arrives before the first job
+                self.send_request("mining.configure", [
+                    ["version-rolling"],
+                    {"version-rolling.mask": f"{VERSION_ROLLING_MASK:08x}", "version-rolling.min-bit-count": 2},
+                ])
+            # Authorize as soon as the subscribe response (extranonce1) is in
+            subscribe_start = time.perf_counter()
+            response = await self.request("mining.subscribe", [])
+            if not response or response.get("result") is None or not self.running:
+                return False
+            subscribe_ms = (time.perf_counter() - subscribe_start) * 1000
+            self.pool_manager.record_rtt(pool, connect_ms + subscribe_ms)
+            if DEBUG_STRATUM:
+                print(f"[DEBUG] {pool[0]}:{pool[1]} RTT: connect {connect_ms:.1f} ms, subscribe {subscribe_ms:.1f} ms")
+            self.send_request("mining.authorize", [BTC_WALLET + "." + WORKER_NAME, "x"])
+            # Let the pool move extranonce1 with mining.set_extranonce instead of dropping us
+            self.send_request("mining.extranonce.subscribe", [])
+            if self.suggested_difficulty:
+                self.send_request("mining.suggest_difficulty", [self.suggested_difficulty])
+            self.resubmit_block_candidates()
+            
+            if not self.mining_processes:
+                self.print_banner(num_threads)
+            
+            # Wait for the first job of this session (or for the connection to drop)
+            if not await self.wait_any(self.job_ready, self.session_closed) or not self.job_ready.is_set():
+                return False
+            session_start = time.monotonic()
+            if not self.mining_processes:
+                self.start_workers(num_threads)
+                self.background_tasks = [asyncio.create_task(self.forward_shares()),
+                                         asyncio.create_task(self.stats_loop())]
+                self.loop.add_reader(self.block_reader.fileno(), self.on_block_candidates)
+                if TARGET_SHARE_RATE > 0:
+                    self.background_tasks.append(asyncio.create_task(self.vardiff_loop()))
+                if self.phase_counters is not None:
+                    self.background_tasks.append(asyncio.create_task(self.trace_perf_loop()))
+                self.started.set()
+            
+            if pool != self.pool_manager.primary:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ Mining on failover pool {pool[0]}:{pool[1]}")
+                failback = asyncio.create_task(self.wait_for_primary())
+                await self.wait_any(self.session_closed, failback)
+                failed_back = failback.done() and not failback.cancelled() and not self.session_closed.is_set()
+                failback.cancel()
+            else:
+                await self.wait_any(self.session_closed)
+                failed_back = False
+            if self.running and not failed_back:
+                # Dropped after its first job: back off like a failed connect, so a pool that
+                # closes right after the notify is not redialled in a tight loop. The failure
+                # count only resets once the session proved stable (or a share was accepted).
+                if time.monotonic() - session_start >= POOL_STABLE_SECONDS:
+                    self.pool_manager.record_success(pool)
+                delay = self.pool_manager.record_failure(pool)
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] ↻ Session with {pool[0]}:{pool[1]} ended, reconnecting in {delay:.1f}s")
+            return True
+        finally:
+            receiver.cancel()
+            await asyncio.gather(receiver, return_exceptions=True)
+            await self.close_session()
+    
+    async def wait_any(self, *waitables) -> bool:
+        """Wait until any of the events/tasks completes; False if stop() came first."""
+        waiters = [asyncio.ensure_future(w.wait() if isinstance(w, asyncio.Event) else w) for w in waitables]
+        stopping = asyncio.ensure_future(self.stop_event.wait())
+        await asyncio.wait(waiters + [stopping], return_when=asyncio.FIRST_COMPLETED)
+        for waiter in waiters + [stopping]:
+            if waiter not in waitables:
+                waiter.cancel()
+        return not self.stop_event.is_set() and self.running
+    
+    async def wait_for_primary(self) -> None:
+        """Return once the primary pool answers again (failback)."""
+        primary = self.pool_manager.primary
+        while True:
+            await asyncio.sleep(POOL_FAILBACK_INTERVAL)
+            rtt_ms = await self.probe(primary)
+            if rtt_ms is not None:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] ↺ Primary pool {primary[0]}:{primary[1]} is back ({rtt_ms:.1f} ms), failing back")
+                self.pool_manager.record_success(primary)
+                return
+    
+    async def close_session(self) -> None:
+        """Close the pool connection and forget requests that can no longer be answered."""
+        writer, self.writer, self.reader = self.writer, None, None
+        self.abandon_requests()
+        if writer and self.recorder is not None and not self.session_closed.is_set():
+            self.recorder.record("end")
+        if writer:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+    
+    def abandon_requests(self) -> None:
+        """Resolve every in-flight request with None (its connection is gone)."""
+        for request in self.pending_requests.values():
+            if not request["future"].done():
+                request["future"].set_result(None)
+        self.pending_requests.clear()
+    
+    def print_banner(self, num_threads: int) -> None:
         print("=" * 60)
         print("Minr.online Python Stratum Miner")
         print("=" * 60)
         print(f"Worker: {WORKER_NAME}")
         print(f"Wallet: {BTC_WALLET}")
         print(f"Pool: {STRATUM_HOST}:{STRATUM_PORT}")
+        if len(self.pool_manager.pools) > 1:
+            print("Failover pools: " + ", ".join(f"{host}:{port}" for host, port in self.pool_manager.pools[1:]))
         print(f"Threads: {num_threads}")
         if DEBUG_STRATUM:
             print("Debug mode: ON")
@@ -890,164 +2960,420 @@ class StratumMiner:
             backend_name, _ = _select_sha256_backend()
             print(f"Profile mode: ON (SHA256 backend: {backend_name})")
         print("=" * 60)
-        
-        # Start message receiver thread
-        def receiver_thread():
-            while self.running:
-                try:
-                    msg = self.receive_message()
-                    if msg:
-                        self.handle_message(msg)
-                except Exception as e:
-                    if self.running:
-                        print(f"Receiver error: {e}")
-                    break
-        
-        receiver = threading.Thread(target=receiver_thread, daemon=True)
-        receiver.start()
-        
-        # Wait for first job
-        while self.running and not self.current_job:
-            time.sleep(0.1)
-        
+    
+    def start_workers(self, num_threads: int) -> None:
+        """Spawn the worker processes (once; they keep running across pool sessions)."""
         # Start mining processes (multiprocessing bypasses GIL for TRUE parallelism)
         # This gives us real CPU parallelism, not just concurrency
         # Use standalone function (not method) to avoid pickling issues
-        # #region agent log
-        import os
-        log_path = "/Users/seneca/Desktop/minr.online/.cursor/debug.log"
-        try:
-            with open(log_path, "a") as f:
-                f.write(json.dumps({"sessionId":"debug-session","runId":"perf-debug","hypothesisId":"E","location":"StratumMiner.start:workers_start","message":"Starting workers","data":{"num_threads":num_threads,"cpu_count":multiprocessing.cpu_count()},"timestamp":int(time.time()*1000)}) + "\n")
-        except: pass
-        # #endregion
-        
+        self.worker_counters = WorkerCounters(num_threads)  # One writer per slot, no lock
+        if TRACE_PERF:
+            self.phase_counters = WorkerCounters(num_threads, PHASE_SLOT_WORDS)
+            self.phase_baseline = self.phase_snapshot()
+        # Same engine choice as mine_worker_process, for the per-backend verification counters
+        if USE_NATIVE and _check_native_module():
+            self.mining_backend = "native"
+        elif USE_NUMPY and _check_numpy():
+            self.mining_backend = "numpy"
         for i in range(num_threads):
             process = mp.Process(
                 target=mine_worker_process,
-                args=(i, self.shared_total_hashes, self.shared_running, self.shared_job, self.share_queue, DEBUG_STRATUM),
+                args=(i, self.worker_counters, self.shared_running, self.job_board, self.share_queue, DEBUG_STRATUM, USE_NATIVE,
+                      self.block_writer, self.trace_buffer, self.phase_counters),
                 daemon=True
             )
             process.start()
             self.mining_processes.append(process)
-            # #region agent log
-            try:
-                with open(log_path, "a") as f:
-                    f.write(json.dumps({"sessionId":"debug-session","runId":"perf-debug","hypothesisId":"E","location":"StratumMiner.start:worker_started","message":"Worker process started","data":{"worker_id":i,"pid":process.pid,"is_alive":process.is_alive()},"timestamp":int(time.time()*1000)}) + "\n")
-            except: pass
-            # #endregion
-        
-        # Start share processor thread (processes shares from queue)
-        def process_shares():
-            while self.running:
+        self.trace(TE_WORKERS_STARTED, num_threads)
+    
+    async def receive_loop(self) -> None:
+        """Dispatch every message from the pool until the connection closes."""
+        while self.running:
+            messages = await self.receive_messages()
+            if messages is None:
+                if self.running:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] ✗ Connection to {self.pool[0]}:{self.pool[1]} lost")
+                if self.recorder is not None:
+                    self.recorder.record("close")
+                self.abandon_requests()
+                self.session_closed.set()
+                return
+            for msg in messages:
                 try:
-                    share_data = self.share_queue.get(timeout=0.1)
-                    if share_data:
-                        job_id, extranonce2_hex, ntime_hex, nonce = share_data
-                        self.submit_share(job_id, extranonce2_hex, ntime_hex, nonce)
-                except:
-                    pass
-        
-        share_processor = threading.Thread(target=process_shares, daemon=True)
-        share_processor.start()
+                    self.handle_message(msg)
+                except Exception as e:
+                    print(f"Receiver error: {e}")
+    
+    def on_block_candidates(self) -> None:
+        """Event loop reader callback: submit block candidates the moment a worker writes one."""
+        while self.block_reader.poll():
+            job_id, extranonce2_hex, ntime_hex, nonce, version_bits, share_difficulty, hash_hex, found_at, worker_id = self.block_reader.recv()
+            self.blocks_found += 1
+            candidate = {"job_id": job_id, "extranonce2_hex": extranonce2_hex, "ntime_hex": ntime_hex, "nonce": nonce,
+                         "version_bits": version_bits, "hash": hash_hex, "found_at": found_at, "received_at": time.time(),
+                         "pool": self.pool, "attempts": 0}
+            self.block_candidates.append(candidate)
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] ★ BLOCK CANDIDATE from worker {worker_id}: job {job_id}, "
+                  f"hash {hash_hex[:24]}..., difficulty {share_difficulty:.6g}")
+            self.submit_block_candidate(candidate)
+            if VERIFY_SHARES:
+                # Flag only, after sending: a block is worth the pool's verdict even if our rehash disagrees
+                self.verify_share(job_id, extranonce2_hex, ntime_hex, nonce, version_bits, share_difficulty)
+    
+    def submit_block_candidate(self, candidate: Dict[str, Any]) -> None:
+        """Send a block candidate now (no stale filtering: the pool decides)."""
+        if self.writer is None:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ Block candidate held until the pool connection is back")
+            return
+        candidate["attempts"] += 1
+        # Queue/send latency only for the first attempt; a resubmit after reconnect would skew them
+        self.submit_share(candidate["job_id"], candidate["extranonce2_hex"], candidate["ntime_hex"], candidate["nonce"],
+                          candidate["version_bits"], block_candidate=candidate, found_at=candidate["found_at"],
+                          received_at=candidate["received_at"] if candidate["attempts"] == 1 else None)
+        self.block_latency_ms = (time.time() - candidate["found_at"]) * 1000
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] ★ Block candidate submitted to {self.pool[0]}:{self.pool[1]} "
+              f"({self.block_latency_ms:.1f} ms after it was found, attempt {candidate['attempts']})")
+    
+    def resubmit_block_candidates(self) -> None:
+        """After a reconnect, send again every candidate the pool never answered."""
+        for candidate in self.block_candidates:
+            if candidate["pool"] in (None, self.pool):
+                candidate["pool"] = self.pool
+                self.submit_block_candidate(candidate)
+    
+    async def forward_shares(self) -> None:
+        """Submit each share as soon as a worker queues it (no polling interval)."""
+        while True:
+            share_data = await self.loop.run_in_executor(None, self.share_queue.get)
+            if share_data is None:  # Sentinel from stop()
+                return
+            received_at = time.time()
+            job_id, extranonce2_hex, ntime_hex, nonce, version_bits, share_difficulty, found_at = share_data
+            if VERIFY_SHARES and self.verify_share(job_id, extranonce2_hex, ntime_hex, nonce, version_bits, share_difficulty) is False:
+                continue  # The pool would reject it as invalid: already counted as a mismatch
+            reason = self.stale_reason(job_id, share_difficulty)
+            if reason:
+                # The pool would reject it: keep it off the wire and out of the reject count
+                self.shares_stale += 1
+                if DEBUG_STRATUM:
+                    print(f"[DEBUG] Dropping stale share for job {job_id} ({reason})")
+                continue
+            self.submit_share(job_id, extranonce2_hex, ntime_hex, nonce, version_bits, found_at=found_at, received_at=received_at)
+    
+    async def vardiff_loop(self) -> None:
+        """Steer the share difficulty toward TARGET_SHARE_RATE shares per minute.
         
-        # Print stats periodically and report to API
-        def print_and_report_stats():
-            import urllib.request
-            import urllib.error
-            
-            last_total_hashes = 0  # Track for hashrate calculation (64-bit unsigned)
-            last_check_time = None  # Track last check time for accurate hashrate
-            log_path = "/Users/seneca/Desktop/minr.online/.cursor/debug.log"
+        Every VARDIFF_INTERVAL the accepted-share rate is measured, weighted by
+        the difficulty each share was submitted at so a window spanning a
+        difficulty change still gives the rate at the current difficulty. With
+        too few shares for a usable rate, the rate expected from the measured
+        hashrate is used instead. Changes are clamped to 4x per
+        step and skipped inside a +/-50% dead band, so the difficulty settles
+        instead of oscillating.
+        """
+        last_accepted = self.shares_accepted
+        last_work = self.accepted_work
+        last_hashes = self.worker_counters.total(WC_HASHES)
+        last_time = time.monotonic()
+        while self.running:
+            await asyncio.sleep(VARDIFF_INTERVAL)
+            now = time.monotonic()
+            elapsed = now - last_time
+            accepted = self.shares_accepted - last_accepted
+            work = self.accepted_work - last_work
+            hashes = self.worker_counters.total(WC_HASHES) - last_hashes
+            last_accepted, last_work, last_hashes, last_time = self.shares_accepted, self.accepted_work, last_hashes + hashes, now
+            if elapsed <= 0 or hashes <= 0:
+                continue
             
-            while self.running:
-                time.sleep(10)
-                if self.start_time:
-                    current_check_time = datetime.now()
-                    
-                    # Get total hashes from shared memory (64-bit unsigned)
-                    with self.shared_total_hashes.get_lock():
-                        total_hashes = self.shared_total_hashes.value
-                        # Handle signed 64-bit as unsigned
-                        if total_hashes < 0:
-                            total_hashes = total_hashes + 2**64
-                    
-                    self.total_hashes = total_hashes  # Update instance for compatibility
-                    
-                    duration = (current_check_time - self.start_time).total_seconds()
-                    
-                    # Calculate hashrate using unsigned delta
-                    delta = total_hashes - last_total_hashes
-                    if delta < 0:
-                        delta = delta + 2**64  # Handle wrap-around
-                    
-                    # Calculate hashrate: delta over the actual time elapsed since last check
-                    # This prevents showing 0.00 H/s when workers are actively mining
-                    if last_check_time is not None:
-                        actual_elapsed = (current_check_time - last_check_time).total_seconds()
-                        if actual_elapsed > 0:
-                            hashrate = delta / actual_elapsed
-                        else:
-                            hashrate = 0.0
+            difficulty = self.share_difficulty()
+            if accepted >= 4:
+                rate = work / difficulty * 60 / elapsed
+            else:
+                rate = hashes / elapsed * 60 / (difficulty * 2 ** 32)
+            factor = min(4.0, max(0.25, rate / TARGET_SHARE_RATE))
+            if 1 / 1.5 < factor < 1.5:
+                continue
+            new_difficulty = difficulty * factor
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Vardiff: {rate:.1f} shares/min -> suggesting difficulty {new_difficulty:.6g}")
+            self.suggest_difficulty(new_difficulty)
+    
+    async def trace_perf_loop(self) -> None:
+        """Print the phase profile of the last TRACE_INTERVAL seconds."""
+        last = self.phase_snapshot()
+        while self.running:
+            await asyncio.sleep(TRACE_INTERVAL)
+            current = self.phase_snapshot()
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Phase profile, ns/hash ({self.mining_backend}, last {current[0] - last[0]:.1f} s)")
+            for line in self.phase_report(last, current):
+                print("    " + line)
+            last = current
+    
+    def phase_snapshot(self) -> Tuple[float, list, list]:
+        """(time, per-worker hashes, per-worker phase slots) for phase_report."""
+        counters = self.phase_counters
+        slots = [counters.array[counters.slot(i):counters.slot(i) + PHASE_SLOT_WORDS] for i in range(counters.num_workers)]
+        return time.monotonic(), self.worker_counters.snapshot(WC_HASHES), slots
+    
+    def phase_report(self, before: Tuple[float, list, list], after: Tuple[float, list, list]) -> list:
+        """Table of ns/hash per phase and worker between two phase snapshots.
+        
+        Header and compare are divided by the hashes of the batches they were
+        timed on, every other phase by all hashes. "traced" is the sum of the
+        phases and "wall" the elapsed time per hash, so the gap between the two
+        is loop overhead no phase accounts for.
+        """
+        elapsed_ns = (after[0] - before[0]) * 1e9
+        lines = [f"{'worker':>6}" + "".join(f"{name:>10}" for name in PHASE_NAMES) + f" |{'traced':>10}{'wall':>10}"]
+        rows = []
+        for worker_id in range(self.phase_counters.num_workers):
+            hashes = after[1][worker_id] - before[1][worker_id]
+            phases = [now - then for now, then in zip(after[2][worker_id], before[2][worker_id])]
+            rows.append((f"#{worker_id}", hashes, phases, elapsed_ns / hashes if hashes else 0.0))
+        if len(rows) > 1:
+            # Averaged over workers: core time per hash, comparable with the per-worker rows
+            hashes = sum(row[1] for row in rows)
+            phases = [sum(column) for column in zip(*(row[2] for row in rows))]
+            rows.append(("all", hashes, phases, elapsed_ns * len(rows) / hashes if hashes else 0.0))
+        for label, hashes, phases, wall in rows:
+            if not hashes:
+                lines.append(f"{label:>6}  (no hashes)")
+                continue
+            per_hash = []
+            for phase in range(len(PHASE_NAMES)):
+                divisor = phases[PH_SAMPLED_HASHES] if phase in (PH_HEADER, PH_COMPARE) else hashes
+                per_hash.append(phases[phase] / divisor if divisor else 0.0)
+            lines.append(f"{label:>6}" + "".join(f"{ns:>10.1f}" for ns in per_hash) + f" |{sum(per_hash):>10.1f}{wall:>10.1f}")
+        return lines
+    
+    async def stats_loop(self) -> None:
+        """Print stats every 10 seconds and report them to the API."""
+        last_total_hashes = 0  # Track for hashrate calculation (64-bit unsigned)
+        last_worker_hashes = [0] * self.worker_counters.num_workers
+        last_check_time = None  # Track last check time for accurate hashrate
+        
+        while self.running:
+            await asyncio.sleep(10)
+            if self.start_time:
+                current_check_time = datetime.now()
+                
+                # Aggregate per-worker counters (lock-free reads of each worker's slot)
+                worker_hashes = self.worker_counters.snapshot(WC_HASHES)
+                total_hashes = sum(worker_hashes)
+                
+                self.total_hashes = total_hashes  # Update instance for compatibility
+                
+                duration = (current_check_time - self.start_time).total_seconds()
+                
+                # Calculate hashrate using unsigned delta
+                delta = total_hashes - last_total_hashes
+                if delta < 0:
+                    delta = delta + 2**64  # Handle wrap-around
+                
+                # Calculate hashrate: delta over the actual time elapsed since last check
+                # This prevents showing 0.00 H/s when workers are actively mining
+                if last_check_time is not None:
+                    actual_elapsed = (current_check_time - last_check_time).total_seconds()
+                    if actual_elapsed > 0:
+                        hashrate = delta / actual_elapsed
                     else:
-                        # First check: use duration since start (but at least 1 second to avoid division by zero)
-                        hashrate = delta / max(duration, 1.0) if duration > 0 else 0.0
-                    
-                    last_check_time = current_check_time
-                    
-                    # #region agent log
-                    try:
-                        with open(log_path, "a") as f:
-                            f.write(json.dumps({"sessionId":"debug-session","runId":"perf-debug","hypothesisId":"F","location":"print_and_report_stats:hashrate_calc","message":"Hashrate calculated","data":{"total_hashes":total_hashes,"last_total_hashes":last_total_hashes,"delta":delta,"hashrate":hashrate,"duration_sec":duration,"num_workers":len(self.mining_processes),"workers_alive":sum(1 for p in self.mining_processes if p.is_alive())},"timestamp":int(time.time()*1000)}) + "\n")
-                    except: pass
-                    # #endregion
-                    
-                    last_total_hashes = total_hashes
-                    
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Hashrate: {hashrate:.2f} H/s | "
-                          f"Accepted: {self.shares_accepted} | Rejected: {self.shares_rejected} | "
-                          f"Submitted: {self.shares_submitted} | Total hashes: {self.total_hashes:,}")
-                    
-                    # Report stats to API (try even without AUTH_TOKEN - endpoint will find user by workerName)
-                    if API_URL:
-                        try:
-                            stats_data = {
-                                "totalHashes": self.total_hashes,
-                                "hashesPerSecond": hashrate,
-                                "acceptedShares": self.shares_accepted,
-                                "rejectedShares": self.shares_rejected,
-                                "workerName": WORKER_NAME
-                            }
-                            
-                            headers = {
-                                'Content-Type': 'application/json'
-                            }
-                            # Add auth token if available
-                            if AUTH_TOKEN:
-                                headers['Authorization'] = f'Bearer {AUTH_TOKEN}'
-                            
-                            req = urllib.request.Request(
-                                f"{API_URL}/api/miner-stats",
-                                data=json.dumps(stats_data).encode('utf-8'),
-                                headers=headers,
-                                method='POST'
-                            )
-                            
-                            with urllib.request.urlopen(req, timeout=5) as response:
-                                pass  # Stats reported successfully
-                        except Exception as e:
-                            # Log error but don't interrupt mining
-                            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ Stats reporting error: {type(e).__name__}: {str(e)[:100]}")
+                        hashrate = 0.0
+                else:
+                    # First check: use duration since start (but at least 1 second to avoid division by zero)
+                    hashrate = delta / max(duration, 1.0) if duration > 0 else 0.0
+                
+                # Per-worker hashrate over the same window (a slow or throttled core stands out)
+                elapsed = actual_elapsed if last_check_time is not None else max(duration, 1.0)
+                worker_hashrates = [(now - before) / elapsed if elapsed > 0 else 0.0
+                                    for now, before in zip(worker_hashes, last_worker_hashes)]
+                last_worker_hashes = worker_hashes
+                self.hashrate, self.worker_hashrates = hashrate, worker_hashrates
+                
+                last_check_time = current_check_time
+                
+                self.trace(TE_STATS, hashrate, total_hashes)
+                
+                last_total_hashes = total_hashes
+                
+                # Worst last job-switch latency across workers (bounded by JOB_SLICE_SECONDS)
+                switch_latency_ms = max(self.worker_counters.snapshot(WC_SWITCH_US), default=0) / 1000
+                
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Hashrate: {hashrate:.2f} H/s | "
+                      f"Accepted: {self.shares_accepted} | Rejected: {self.shares_rejected} | Stale: {self.shares_stale} | "
+                      f"Blocks: {self.blocks_found} | Mismatched: {self.verify_mismatches()} | "
+                      f"Submitted: {self.shares_submitted} | Total hashes: {self.total_hashes:,} | "
+                      f"Job switch: {switch_latency_ms:.1f} ms")
+                print("    Workers: " + " | ".join(f"#{i} {rate / 1000:.1f} kH/s" for i, rate in enumerate(worker_hashrates)))
+                print("    Submit latency p50/p99 ms: " + self.latency_summary())
+                
+                # Report stats to API (try even without AUTH_TOKEN - endpoint will find user by workerName)
+                if self.stats_reporter is not None:
+                    stats_data = {
+                        "totalHashes": self.total_hashes,
+                        "hashesPerSecond": hashrate,
+                        "acceptedShares": self.shares_accepted,
+                        "rejectedShares": self.shares_rejected,
+                        "staleShares": self.shares_stale,
+                        "blockCandidates": self.blocks_found,
+                        "blockCandidatesAccepted": self.blocks_accepted,
+                        "verifyMismatches": self.verify_mismatches(),
+                        "submitLatencyMs": {stage: hist.to_dict() for stage, hist in self.submit_latency.items()},
+                        "workerHashrates": worker_hashrates,
+                        "workerName": WORKER_NAME
+                    }
+                    self.stats_reporter.submit(stats_data)
+    
+    async def serve_metrics(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer one HTTP GET /metrics with the Prometheus text format, then close."""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while await asyncio.wait_for(reader.readline(), 5) not in (b"\r\n", b"\n", b""):
+                pass  # Headers are ignored
+            parts = request_line.split()
+            if len(parts) < 2 or parts[0] not in (b"GET", b"HEAD"):
+                status, body = "405 Method Not Allowed", b""
+            elif parts[1].split(b"?")[0] not in (b"/metrics", b"/"):
+                status, body = "404 Not Found", b""
+            else:
+                status, body = "200 OK", self.render_metrics().encode("utf-8")
+            head = (f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode("ascii")
+            writer.write(head if parts[:1] == [b"HEAD"] else head + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    def render_metrics(self) -> str:
+        """Prometheus text exposition of the miner's counters.
         
-        stats_thread = threading.Thread(target=print_and_report_stats, daemon=True)
-        stats_thread.start()
+        Runs on the event loop thread that owns every counter it reads, and reads
+        the worker slots with plain loads, so scraping never takes a lock the
+        workers use.
+        """
+        lines = []
         
-        # Return immediately - main loop is handled by threads
-        # The caller will wait for self.running to become False
-        return True
+        def sample(name: str, labels: Dict[str, Any], value) -> None:
+            if labels:
+                escaped = (str(val).replace("\\", "\\\\").replace('"', '\\"') for val in labels.values())
+                name += "{" + ",".join(f'{key}="{val}"' for key, val in zip(labels, escaped)) + "}"
+            lines.append(f"{name} {value}")
+        
+        def metric(name: str, kind: str, help_text: str, samples) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                sample(name, labels, value)
+        
+        counters = self.worker_counters
+        workers = range(counters.num_workers) if counters is not None else range(0)
+        worker_hashes = counters.snapshot(WC_HASHES) if counters is not None else []
+        metric("minr_hashes_total", "counter", "Hashes computed by all workers.", [({}, sum(worker_hashes))])
+        metric("minr_worker_hashes_total", "counter", "Hashes computed per worker.",
+               [({"worker": i}, worker_hashes[i]) for i in workers])
+        metric("minr_hashrate_hashes_per_second", "gauge", "Total hashrate over the last stats window.", [({}, self.hashrate)])
+        metric("minr_worker_hashrate_hashes_per_second", "gauge", "Per-worker hashrate over the last stats window.",
+               [({"worker": i}, rate) for i, rate in enumerate(self.worker_hashrates)])
+        if counters is not None:
+            metric("minr_worker_batch_size", "gauge", "Current adaptive batch size (nonces).",
+                   [({"worker": i}, size) for i, size in enumerate(counters.snapshot(WC_BATCH_SIZE))])
+            metric("minr_job_switch_latency_seconds", "gauge", "Last job publish-to-pickup latency per worker.",
+                   [({"worker": i}, us / 1e6) for i, us in enumerate(counters.snapshot(WC_SWITCH_US))])
+        
+        metric("minr_shares_total", "counter", "Shares by outcome (stale and mismatched shares are never submitted).",
+               [({"outcome": "accepted"}, self.shares_accepted), ({"outcome": "rejected"}, self.shares_rejected),
+                ({"outcome": "stale"}, self.shares_stale), ({"outcome": "mismatched"}, self.verify_mismatches())])
+        metric("minr_shares_submitted_total", "counter", "Shares sent to the pool.", [({}, self.shares_submitted)])
+        metric("minr_block_candidates_total", "counter", "Hashes below the network target.",
+               [({"outcome": "found"}, self.blocks_found), ({"outcome": "accepted"}, self.blocks_accepted)])
+        
+        depths = [({"queue": "submits_in_flight"},
+                   sum(1 for request in self.pending_requests.values() if request["method"] == "mining.submit")),
+                  ({"queue": "block_candidates"}, len(self.block_candidates))]
+        try:
+            depths.append(({"queue": "shares"}, self.share_queue.qsize()))
+        except NotImplementedError:
+            pass  # macOS has no sem_getvalue
+        if self.stats_reporter is not None:
+            depths.append(({"queue": "stats_pending"}, len(self.stats_reporter.pending)))
+            depths.append(({"queue": "stats_spooled"}, self.stats_reporter.spooled))
+        metric("minr_queue_depth", "gauge", "Items waiting in internal queues.", depths)
+        
+        if self.current_job is not None and self.current_job["job_id"] in self.jobs:
+            job_age = time.time() - self.jobs[self.current_job["job_id"]]["received_at"]
+            metric("minr_job_age_seconds", "gauge", "Time since the current job was notified.", [({}, job_age)])
+        metric("minr_difficulty", "gauge", "Share difficulty: pool-set and the one workers search at.",
+               [({"source": "pool"}, self.difficulty), ({"source": "local"}, self.share_difficulty())])
+        metric("minr_pool_connects_total", "counter", "Pool sessions opened.", [({}, self.pool_connects)])
+        metric("minr_pool_reconnects_total", "counter", "Pool sessions opened after the first.",
+               [({}, max(0, self.pool_connects - 1))])
+        metric("minr_pool_connected", "gauge", "1 while a pool connection is open.",
+               [({"pool": f"{self.pool[0]}:{self.pool[1]}" if self.pool else ""}, int(self.writer is not None))])
+        metric("minr_backend_info", "gauge", "Active mining and share-verification backends.",
+               [({"backend": self.mining_backend, "verify": self.verify_backend if VERIFY_SHARES else "off"}, 1)])
+        
+        lines.append("# HELP minr_submit_latency_seconds Share submit latency per stage.")
+        lines.append("# TYPE minr_submit_latency_seconds histogram")
+        for stage, hist in self.submit_latency.items():
+            cumulative = 0
+            for bound, count in zip(hist.BOUNDS_MS + (float("inf"),), hist.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound / 1000:g}"
+                sample("minr_submit_latency_seconds_bucket", {"stage": stage, "le": le}, cumulative)
+            sample("minr_submit_latency_seconds_sum", {"stage": stage}, hist.sum_ms / 1000)
+            sample("minr_submit_latency_seconds_count", {"stage": stage}, hist.count)
+        return "\n".join(lines) + "\n"
+    
+    def latency_summary(self) -> str:
+        """One-line submit latency percentiles per stage."""
+        return " | ".join(f"{stage} {hist.summary()}" for stage, hist in self.submit_latency.items())
+    
+    def trace(self, kind: int, a: float = 0, b: float = 0) -> None:
+        """Record an event in the main trace ring (event loop thread only; no-op without --trace-ring)."""
+        if self.trace_buffer is not None:
+            self.trace_buffer.record(self.trace_ring, kind, a, b)
+    
+    def dump_trace(self) -> None:
+        """Write the trace rings to TRACE_FILE (on SIGUSR1 and at exit)."""
+        if self.trace_buffer is None:
+            return
+        import os
+        path = TRACE_FILE or os.path.join(os.path.dirname(os.path.abspath(__file__)), "minr-trace.jsonl")
+        try:
+            count = self.trace_buffer.dump(path)
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Trace: {count} events written to {path}")
+        except OSError as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ Trace dump failed: {e}")
+    
+    def verify_mismatches(self) -> int:
+        """Shares whose local rehash disagreed with the worker, across backends."""
+        return sum(stats["mismatched"] for stats in self.verify_stats.values())
+    
+    def job_pickup(self) -> Optional[Tuple[str, float, float, float]]:
+        """Published job and how fast workers picked it up: (job_id, published_at, fastest s, slowest s).
+        
+        Switch times are each worker's last publish -> pickup latency, so they
+        describe the published job once every worker has moved to it. Safe to
+        call from other threads; None before the workers start or after stop.
+        """
+        board, counters = self.job_board, self.worker_counters
+        if board is None or counters is None or self.stopped:
+            return None
+        try:
+            _, job = board.read()
+        except (ValueError, TypeError):
+            return None  # Board closed under us
+        if job is None:
+            return None
+        switch_us = counters.snapshot(WC_SWITCH_US)
+        return job["job_id"], job["published_at"], min(switch_us) / 1e6, max(switch_us) / 1e6
     
     def stop(self) -> None:
         """Stop mining"""
+        if self.stopped:
+            return
+        self.stopped = True
         self.running = False
         self.shared_running.value = False  # Signal processes to stop
         
@@ -1057,8 +3383,31 @@ class StratumMiner:
             if process.is_alive():
                 process.terminate()
         
-        if self.socket:
-            self.socket.close()
+        # Wake the share forwarder and let the event loop close the connection
+        self.share_queue.put(None)
+        if self.loop is not None and self.stop_event is not None and self.loop_thread.is_alive():
+            try:
+                self.loop.call_soon_threadsafe(self.stop_event.set)
+            except RuntimeError:
+                pass  # Loop already closed
+            self.loop_thread.join(timeout=5)
+        
+        if self.job_board is not None:
+            self.job_board.close()
+            self.job_board = None
+        
+        self.dump_trace()
+        if self.recorder is not None:
+            self.recorder.close()
+            print(f"Stratum session recorded: {self.recorder.events} events ({self.recorder.path})")
+        
+        if self.stats_reporter is not None:
+            self.stats_reporter.close()
+            if self.stats_reporter.spooled:
+                print(f"Stats spooled for the next run: {self.stats_reporter.spooled} samples ({self.stats_reporter.spool_path})")
+        
+        if self.worker_counters is not None:
+            self.total_hashes = self.worker_counters.total(WC_HASHES)
         
         if self.start_time:
             duration = (datetime.now() - self.start_time).total_seconds()
@@ -1071,6 +3420,16 @@ class StratumMiner:
             print(f"Shares Submitted: {self.shares_submitted}")
             print(f"Shares Accepted: {self.shares_accepted}")
             print(f"Shares Rejected: {self.shares_rejected}")
+            print(f"Shares Stale (not submitted): {self.shares_stale}")
+            print(f"Submit latency p50/p99 ms: {self.latency_summary()}")
+            if self.phase_counters is not None:
+                print(f"Phase profile, ns/hash ({self.mining_backend}, whole run):")
+                for line in self.phase_report(self.phase_baseline, self.phase_snapshot()):
+                    print("  " + line)
+            for backend, stats in self.verify_stats.items():
+                print(f"Verified ({backend} vs {self.verify_backend}): {stats['verified']} ok, {stats['mismatched']} mismatched")
+            if self.blocks_found:
+                print(f"Block Candidates: {self.blocks_found} (accepted: {self.blocks_accepted}, last found->sent: {self.block_latency_ms:.1f} ms)")
             print("=" * 60)
 
 
@@ -1078,7 +3437,8 @@ def main():
     """Main entry point"""
     import multiprocessing
     
-    global DEBUG_STRATUM, TEST_LOW_DIFF, BENCH_MODE, PROFILE_MODE, USE_NATIVE, TRACE_PERF, TRACE_INTERVAL, NATIVE_BATCH_SIZE, RUN_SECONDS
+    global DEBUG_STRATUM, TEST_LOW_DIFF, BENCH_MODE, PROFILE_MODE, USE_NATIVE, USE_NUMPY, TRACE_PERF, TRACE_INTERVAL, NATIVE_BATCH_SIZE, RUN_SECONDS, JOB_SLICE_SECONDS, VERSION_ROLLING, TARGET_SHARE_RATE, VERIFY_SHARES, METRICS_HOST, METRICS_PORT, TRACE_RING_EVENTS, TRACE_FILE
+    global MOCK_POOL, MOCK_JOB_INTERVAL, MOCK_DIFFICULTY, MOCK_EXTRANONCE2_SIZE, STRATUM_HOST, STRATUM_PORT, API_URL, RECORD_FILE, REPLAY_FILE, REPLAY_SPEED
     
     # Parse command line arguments (support both --flag=value and --flag value forms)
     num_threads = multiprocessing.cpu_count()
@@ -1104,6 +3464,19 @@ def main():
                     sys.exit(2)
             elif arg == "--trace-perf":
                 TRACE_PERF = True
+            elif arg == "--no-version-rolling":
+                VERSION_ROLLING = False
+            elif arg == "--no-verify-shares":
+                VERIFY_SHARES = False
+            elif arg == "--target-share-rate":
+                if i + 1 < len(sys.argv):
+                    TARGET_SHARE_RATE = float(sys.argv[i + 1])
+                    i += 1
+                else:
+                    print("Error: --target-share-rate requires a value")
+                    sys.exit(1)
+            elif arg.startswith("--target-share-rate="):
+                TARGET_SHARE_RATE = float(arg.split("=", 1)[1])
             elif arg == "--backend":
                 if i + 1 < len(sys.argv):
                     SELECTED_BACKEND = sys.argv[i + 1]
@@ -1131,6 +3504,15 @@ def main():
                     sys.exit(1)
             elif arg.startswith("--native-batch="):
                 NATIVE_BATCH_SIZE = int(arg.split("=", 1)[1])
+            elif arg == "--job-slice-ms":
+                if i + 1 < len(sys.argv):
+                    JOB_SLICE_SECONDS = float(sys.argv[i + 1]) / 1000.0
+                    i += 1
+                else:
+                    print("Error: --job-slice-ms requires a value")
+                    sys.exit(1)
+            elif arg.startswith("--job-slice-ms="):
+                JOB_SLICE_SECONDS = float(arg.split("=", 1)[1]) / 1000.0
             elif arg == "--run-seconds":
                 if i + 1 < len(sys.argv):
                     RUN_SECONDS = float(sys.argv[i + 1])
@@ -1140,6 +3522,127 @@ def main():
                     sys.exit(1)
             elif arg.startswith("--run-seconds="):
                 RUN_SECONDS = float(arg.split("=", 1)[1])
+            elif arg == "--metrics-port" or arg.startswith("--metrics-port="):
+                if arg == "--metrics-port":
+                    if i + 1 >= len(sys.argv):
+                        print("Error: --metrics-port requires a value")
+                        sys.exit(1)
+                    metrics_spec = sys.argv[i + 1]
+                    i += 1
+                else:
+                    metrics_spec = arg.split("=", 1)[1]
+                host, _, port = metrics_spec.rpartition(":")
+                if not port.isdigit():
+                    print(f"Error: invalid --metrics-port '{metrics_spec}' (expected [host:]port)")
+                    sys.exit(1)
+                METRICS_HOST = host or METRICS_HOST
+                METRICS_PORT = int(port)
+            elif arg == "--trace-ring":
+                if i + 1 < len(sys.argv):
+                    TRACE_RING_EVENTS = int(sys.argv[i + 1])
+                    i += 1
+                else:
+                    print("Error: --trace-ring requires a value")
+                    sys.exit(1)
+            elif arg.startswith("--trace-ring="):
+                TRACE_RING_EVENTS = int(arg.split("=", 1)[1])
+            elif arg == "--trace-file":
+                if i + 1 < len(sys.argv):
+                    TRACE_FILE = sys.argv[i + 1]
+                    i += 1
+                else:
+                    print("Error: --trace-file requires a value")
+                    sys.exit(1)
+            elif arg.startswith("--trace-file="):
+                TRACE_FILE = arg.split("=", 1)[1]
+            elif arg == "--mock-pool":
+                MOCK_POOL = True
+            elif arg == "--mock-job-interval":
+                if i + 1 < len(sys.argv):
+                    MOCK_JOB_INTERVAL = float(sys.argv[i + 1])
+                    i += 1
+                else:
+                    print("Error: --mock-job-interval requires a value")
+                    sys.exit(1)
+            elif arg.startswith("--mock-job-interval="):
+                MOCK_JOB_INTERVAL = float(arg.split("=", 1)[1])
+            elif arg == "--mock-difficulty":
+                if i + 1 < len(sys.argv):
+                    MOCK_DIFFICULTY = float(sys.argv[i + 1])
+                    i += 1
+                else:
+                    print("Error: --mock-difficulty requires a value")
+                    sys.exit(1)
+            elif arg.startswith("--mock-difficulty="):
+                MOCK_DIFFICULTY = float(arg.split("=", 1)[1])
+            elif arg == "--mock-extranonce2-size":
+                if i + 1 < len(sys.argv):
+                    MOCK_EXTRANONCE2_SIZE = int(sys.argv[i + 1])
+                    i += 1
+                else:
+                    print("Error: --mock-extranonce2-size requires a value")
+                    sys.exit(1)
+            elif arg.startswith("--mock-extranonce2-size="):
+                MOCK_EXTRANONCE2_SIZE = int(arg.split("=", 1)[1])
+            elif arg == "--record":
+                if i + 1 < len(sys.argv):
+                    RECORD_FILE = sys.argv[i + 1]
+                    i += 1
+                else:
+                    print("Error: --record requires a value")
+                    sys.exit(1)
+            elif arg.startswith("--record="):
+                RECORD_FILE = arg.split("=", 1)[1]
+            elif arg == "--replay":
+                if i + 1 < len(sys.argv):
+                    REPLAY_FILE = sys.argv[i + 1]
+                    i += 1
+                else:
+                    print("Error: --replay requires a value")
+                    sys.exit(1)
+            elif arg.startswith("--replay="):
+                REPLAY_FILE = arg.split("=", 1)[1]
+            elif arg == "--replay-speed":
+                if i + 1 < len(sys.argv):
+                    REPLAY_SPEED = float(sys.argv[i + 1])
+                    i += 1
+                else:
+                    print("Error: --replay-speed requires a value")
+                    sys.exit(1)
+            elif arg.startswith("--replay-speed="):
+                REPLAY_SPEED = float(arg.split("=", 1)[1])
+            elif arg.startswith("--bench-"):
+                # Benchmark suite options (each implies --bench)
+                option, sep, value = arg.partition("=")
+                if not sep:
+                    if i + 1 >= len(sys.argv):
+                        print(f"Error: {option} requires a value")
+                        sys.exit(1)
+                    value = sys.argv[i + 1]
+                    i += 1
+                try:
+                    set_bench_option(option, value)
+                except KeyError:
+                    print(f"Error: unknown option {option}")
+                    sys.exit(1)
+                except ValueError:
+                    print(f"Error: invalid value for {option}: '{value}'")
+                    sys.exit(1)
+                BENCH_MODE = True
+            elif arg == "--pool" or arg.startswith("--pool="):
+                if arg == "--pool":
+                    if i + 1 >= len(sys.argv):
+                        print("Error: --pool requires a value")
+                        sys.exit(1)
+                    pool_spec = sys.argv[i + 1]
+                    i += 1
+                else:
+                    pool_spec = arg.split("=", 1)[1]
+                try:
+                    BACKUP_POOLS.append(parse_pool(pool_spec))
+                except ValueError as e:
+                    print(f"Error: {e}")
+                    sys.exit(1)
             elif arg == "--cli":
                 num_threads = mp.cpu_count()
             else:
@@ -1148,15 +3651,38 @@ def main():
                 except ValueError:
                     print(f"Usage: {sys.argv[0]} [num_threads] [OPTIONS]")
                     print(f"Options:")
-                    print(f"  --bench          Benchmark mode (no Stratum)")
+                    print(f"  --bench          Benchmark suite (no Stratum); options, each also as --opt=<value>:")
+                    print(f"    --bench-engines <list>   python,numpy,native (default: all that load)")
+                    print(f"    --bench-workers <list>   Worker counts (default: 1 and num_threads)")
+                    print(f"    --bench-batch <list>     Nonces per call for numpy/native (default: engine default)")
+                    print(f"    --bench-branches <list>  Merkle branch depths (default: 0,12)")
+                    print(f"    --bench-trials <n> / --bench-seconds <sec> / --bench-warmup <sec>  (default 3 x 2s, 1s)")
+                    print(f"    --bench-json <path>      Write results as JSON")
+                    print(f"    --bench-compare <path>   Compare with saved results, exit 1 on regression")
+                    print(f"    --bench-tolerance <pct>  Slowdown counted as a regression (default 5)")
                     print(f"  --profile        Profile mode (show performance stats)")
                     print(f"  --debug-stratum  Debug Stratum protocol")
                     print(f"  --test-low-diff  Test with low difficulty")
-                    print(f"  --native         Use native module (if available)")
-                    print(f"  --trace-perf     Enable performance tracing")
-                    print(f"  --backend <name> or --backend=<name>")
-                    print(f"  --trace-interval <sec> or --trace-interval=<sec>")
+                    print(f"  --native         Use native module for bench and live mining (if available)")
+                    print(f"  --trace-perf     Print ns/hash per mining loop phase and worker (runs 20s unless --run-seconds)")
+                    print(f"  --backend <name> or --backend=<name>  (hashlib, pycryptodome, numpy)")
+                    print(f"  --trace-interval <sec> or --trace-interval=<sec>  Seconds between --trace-perf reports (default 2)")
                     print(f"  --native-batch <size> or --native-batch=<size>")
+                    print(f"  --job-slice-ms <ms> or --job-slice-ms=<ms>  (default 20)")
+                    print(f"  --pool <host:port> or --pool=<host:port>  Failover pool (repeatable)")
+                    print(f"  --no-version-rolling  Don't negotiate BIP310 version rolling")
+                    print(f"  --no-verify-shares  Don't rehash shares locally before submitting them")
+                    print(f"  --metrics-port [host:]port  Serve Prometheus metrics (default host 127.0.0.1)")
+                    print(f"  --trace-ring <events> or --trace-ring=<events>  Per-worker trace ring, dumped on SIGUSR1 and at exit")
+                    print(f"  --trace-file <path> or --trace-file=<path>  Trace dump file (default minr-trace.jsonl next to the miner)")
+                    print(f"  --target-share-rate <n> or --target-share-rate=<n>  Shares/min to hold via mining.suggest_difficulty")
+                    print(f"  --mock-pool      Mine against a local mock pool and report shares/s, latency, stale and invalid shares (runs 30s unless --run-seconds)")
+                    print(f"  --mock-job-interval <sec> or --mock-job-interval=<sec>  Seconds between mock clean_jobs notifies (default 2)")
+                    print(f"  --mock-difficulty <diff> or --mock-difficulty=<diff>  Mock pool share difficulty (default 0.0001)")
+                    print(f"  --mock-extranonce2-size <n> or --mock-extranonce2-size=<n>  extranonce2 bytes from the mock pool (default 4)")
+                    print(f"  --record <path> or --record=<path>  Log every Stratum line sent and received (JSON lines)")
+                    print(f"  --replay <path> or --replay=<path>  Mine a --record log played back, no network (stops at its end)")
+                    print(f"  --replay-speed <x> or --replay-speed=<x>  Replay speed-up (default 1, 0 = no waiting)")
                     sys.exit(1)
             i += 1
     
@@ -1185,17 +3711,74 @@ def main():
             except ImportError:
                 print("ERROR: pycryptodome not installed. Install with: pip3 install pycryptodome")
                 sys.exit(1)
+        elif SELECTED_BACKEND == "numpy":
+            if not _check_numpy():
+                print("ERROR: numpy not installed. Install with: pip3 install numpy")
+                sys.exit(1)
+            # Header scans run batched in NumPy; single hashes (coinbase/merkle) stay on hashlib
+            USE_NUMPY = True
+        else:
+            print(f"ERROR: Unknown backend '{SELECTED_BACKEND}' (use hashlib, pycryptodome or numpy)")
+            sys.exit(1)
     
     # Benchmark mode: test hashing performance without Stratum
     if BENCH_MODE:
-        run_benchmark(num_threads)
-        return
+        sys.exit(run_benchmark(num_threads))
     
     # Set default test deadline when trace-perf is enabled
     if TRACE_PERF and RUN_SECONDS is None:
         RUN_SECONDS = 20.0
     
+    # A trace file alone turns the trace rings on at the default size
+    if TRACE_FILE and not TRACE_RING_EVENTS:
+        TRACE_RING_EVENTS = 4096
+    
+    if MOCK_POOL and REPLAY_FILE:
+        print("Error: --replay and --mock-pool are mutually exclusive")
+        sys.exit(1)
+    
+    # Mock pool: serve locally and point the miner (and nothing else) at it
+    mock_pool = None
+    if MOCK_POOL:
+        mock_pool = MockPool(MOCK_DIFFICULTY, MOCK_JOB_INTERVAL, MOCK_BRANCHES, MOCK_EXTRANONCE2_SIZE)
+        STRATUM_HOST, STRATUM_PORT = "127.0.0.1", mock_pool.start()
+        BACKUP_POOLS.clear()
+        API_URL = ""  # Stay offline: no stats for mock runs
+        if RUN_SECONDS is None:
+            RUN_SECONDS = 30.0
+    
+    # Replay: a recorded session stands in for the pool
+    replay = None
+    if REPLAY_FILE:
+        try:
+            replay = SessionReplay(REPLAY_FILE, REPLAY_SPEED)
+        except (OSError, ValueError) as e:
+            print(f"Error: cannot replay {REPLAY_FILE}: {e}")
+            sys.exit(1)
+        BACKUP_POOLS.clear()
+        API_URL = ""  # Replays never report stats
+        print(f"Replaying {REPLAY_FILE} ({len(replay.segments)} connections) at {REPLAY_SPEED:g}x")
+    
     miner = StratumMiner()
+    if mock_pool is not None:
+        mock_pool.miner = miner
+    miner.replay = replay
+    if RECORD_FILE:
+        try:
+            miner.recorder = SessionRecorder(RECORD_FILE, miner.pool_manager.pools)
+        except OSError as e:
+            print(f"Error: cannot record to {RECORD_FILE}: {e}")
+            sys.exit(1)
+    
+    if TRACE_RING_EVENTS:
+        import os
+        import signal
+        if hasattr(signal, "SIGUSR1"):
+            main_pid = os.getpid()
+            def on_sigusr1(signum, frame):
+                if os.getpid() == main_pid:  # Forked workers inherit the handler
+                    miner.dump_trace()
+            signal.signal(signal.SIGUSR1, on_sigusr1)
     
     try:
         miner.start(num_threads)
@@ -1207,13 +3790,24 @@ def main():
                 time.sleep(RUN_SECONDS)
                 if miner.running:
                     print(f"\n[TEST] Reached deadline ({RUN_SECONDS}s), stopping...")
-                    miner.stop()
+                    miner.running = False  # Main thread performs the shutdown
             timer_thread = threading.Thread(target=deadline_timer, daemon=True)
             timer_thread.start()
         
+        # A replay ends with its recording
+        if replay is not None:
+            import threading
+            def replay_watcher():
+                replay.finished.wait()
+                if miner.running:
+                    print(f"\n[REPLAY] End of {REPLAY_FILE}, stopping...")
+                    miner.running = False  # Main thread performs the shutdown
+            threading.Thread(target=replay_watcher, daemon=True).start()
+        
         # Wait for miner to stop (either by deadline or user interrupt)
         while miner.running:
             time.sleep(0.1)
+        miner.stop()
     except KeyboardInterrupt:
         miner.stop()
     except Exception as e:
@@ -1222,6 +3816,12 @@ def main():
         traceback.print_exc()
         miner.stop()
         sys.exit(1)
+    finally:
+        if mock_pool is not None:
+            mock_pool.stop()
+    
+    if mock_pool is not None:
+        mock_pool.print_report(miner)
 
 
 if __name__ == "__main__":